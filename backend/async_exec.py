@@ -0,0 +1,190 @@
+import os
+import time
+import asyncio
+import functools
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional, Sequence
+from sqlalchemy.engine import make_url
+
+import storage
+import metrics
+import exec_query
+import query_control
+from db_adapter import DatabaseClient
+from engine_registry import EngineRegistry
+
+# Blocking work (sync DB drivers, JSON storage, bcrypt) is offloaded to this bounded pool so the
+# event loop keeps serving other requests while it runs.
+THREADPOOL_SIZE = int(os.environ.get("DB_THREADPOOL_SIZE", "32"))
+USE_ASYNC_DRIVERS = os.environ.get("DB_ASYNC_DRIVERS", "true").lower() in ("1", "true", "yes")
+
+# backend -> (sync drivers we know how to swap, async driver module, async drivername)
+_ASYNC_DRIVERS = {
+    "sqlite": ({"pysqlite"}, "aiosqlite", "sqlite+aiosqlite"),
+    "postgresql": ({"psycopg2"}, "asyncpg", "postgresql+asyncpg"),
+    "mysql": ({"pymysql", "mysqldb"}, "aiomysql", "mysql+aiomysql"),
+}
+
+_executor = ThreadPoolExecutor(max_workers=THREADPOOL_SIZE, thread_name_prefix="db-offload")
+
+# loop that owns the async engines; captured on first use so engines can be disposed from any thread
+_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+async def run_blocking(fn, *args, **kwargs):
+    """Run a blocking callable on the bounded offload pool and await its result."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(fn, *args, **kwargs))
+
+
+async def run_controlled(control: query_control.QueryControl, fn, *args, **kwargs):
+    """run_blocking for a query function taking `control=`: cancelling the awaiting task also
+    cancels the statement on its worker thread (which a plain run_blocking would leave running)."""
+    try:
+        return await run_blocking(fn, *args, control=control, **kwargs)
+    except asyncio.CancelledError:
+        control.cancel()
+        raise
+
+
+def _has_module(name: str) -> bool:
+    return importlib.util.find_spec(name) is not None
+
+
+@functools.lru_cache(maxsize=1024)
+def async_url_for(sqlalchemy_url: str) -> Optional[str]:
+    """Async equivalent of a connector URL, or None when no async driver applies.
+
+    Only plain URLs on the default sync drivers are translated; driver-specific query
+    arguments (sslmode, odbc options, ...) don't carry over between drivers.
+    """
+    if not USE_ASYNC_DRIVERS or not sqlalchemy_url:
+        return None
+    try:
+        url = make_url(sqlalchemy_url)
+    except Exception:
+        return None
+    spec = _ASYNC_DRIVERS.get(url.get_backend_name())
+    if spec is None:
+        return None
+    sync_drivers, module, drivername = spec
+    if url.get_driver_name() not in sync_drivers or url.query:
+        return None
+    if url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+        # a private in-memory database per engine would not match the sync engine's data
+        return None
+    if not (_has_module(module) and _has_module("greenlet")):
+        return None
+    return url.set(drivername=drivername).render_as_string(hide_password=False)
+
+
+def _create_async_engine(url: str, **kwargs):
+    from sqlalchemy.ext.asyncio import create_async_engine
+    return create_async_engine(url, **kwargs)
+
+
+def _dispose_async_engine(engine) -> None:
+    # AsyncEngine.dispose() is a coroutine bound to the loop its connections were made on
+    loop = _loop
+    if loop is None or loop.is_closed():
+        engine.sync_engine.dispose(close=False)
+        return
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        loop.create_task(engine.dispose())
+    else:
+        asyncio.run_coroutine_threadsafe(engine.dispose(), loop)
+
+
+async_registry = EngineRegistry(engine_factory=_create_async_engine, url_for=lambda url: async_url_for(url) or url,
+                                disposer=_dispose_async_engine)
+storage.add_connector_listener(async_registry.invalidate)
+metrics.register_collector("async_pool", async_registry.pool_stats, label="connector")
+
+
+async def _run_async(connector: Dict, prepared, params, control: query_control.QueryControl, **kwargs) -> Dict:
+    """Run a PreparedQuery on the connector's AsyncEngine via AsyncConnection.run_sync, under `control`.
+
+    If the awaiting task is cancelled, the statement is stopped through `control` where the driver
+    allows it (the execution then finishes with an error and releases its connection cleanly),
+    otherwise the execution itself is cancelled.
+    """
+    global _loop
+    _loop = asyncio.get_running_loop()
+    execution = asyncio.ensure_future(_run_async_connection(connector, prepared, params, control, kwargs))
+    try:
+        return await asyncio.shield(execution)
+    except asyncio.CancelledError:
+        if not control.cancel():
+            execution.cancel()
+        await asyncio.gather(execution, return_exceptions=True)
+        raise
+
+
+async def _run_async_connection(connector: Dict, prepared, params, control, kwargs) -> Dict:
+    try:
+        engine = async_registry.get_engine(connector)
+        start = time.perf_counter()
+        async with engine.connect() as conn:
+            metrics.pool_timer(connector.get("id"))(time.perf_counter() - start)
+            return await conn.run_sync(
+                lambda sync_conn: exec_query.run_prepared(DatabaseClient.for_connection(sync_conn), prepared, params,
+                                                          control=control, **kwargs))
+    except Exception as e:
+        return control.error() or {"ok": False, "error": str(e)}
+
+
+def _has_async_engine(connector) -> bool:
+    return isinstance(connector, dict) and bool(connector.get("id")) and async_url_for(connector.get("sqlalchemy_url", "")) is not None
+
+
+async def run_query(connector: Dict, sql_text: str, params: Dict[str, Any] | None = None, max_rows: int = 100, is_proc: bool = False,
+                    offset: int = 0, cursor: str | None = None, pk: Sequence[str] | None = None,
+                    timeout_ms: int | None = None) -> Dict:
+    """Async counterpart of exec_query.run_query.
+
+    Uses an async engine when the connector's driver has one installed, running the usual
+    sync code path through AsyncConnection.run_sync; otherwise the sync run_query is
+    offloaded to the bounded thread pool. The statement runs under `timeout_ms` (default: the
+    connector's) and is cancelled if the awaiting task is.
+    """
+    if timeout_ms is None:
+        timeout_ms = query_control.timeout_ms(connector=connector if isinstance(connector, dict) else None)
+    control = query_control.QueryControl(timeout_ms)
+    if not _has_async_engine(connector):
+        return await run_controlled(control, exec_query.run_query, connector, sql_text, params, max_rows=max_rows, is_proc=is_proc,
+                                    offset=offset, cursor=cursor, pk=pk)
+    prepared = exec_query.prepare_query(sql_text, tuple(pk or ()))
+    return await _run_async(connector, prepared, params, control, max_rows=max_rows, offset=offset, cursor=cursor)
+
+
+async def run_plan(plan, params: Dict[str, Any] | None = None, max_rows: int = 100, offset: int = 0, cursor: str | None = None,
+                   compact: bool = False) -> Dict:
+    """Execute a compiled MappingPlan, on an async engine when available, else on the offload pool.
+
+    `compact` returns rows as value lists (alongside `columns`) instead of dicts. The statement
+    runs under the plan's statement timeout and is cancelled if the awaiting task is.
+    """
+    row_converter = exec_query.rows_to_lists if compact else plan.row_converter
+    kwargs = {"max_rows": max_rows, "offset": offset, "cursor": cursor, "row_converter": row_converter}
+    control = query_control.QueryControl(plan.statement_timeout_ms)
+    if _has_async_engine(plan.connector):
+        return await _run_async(plan.connector, plan.prepared, params, control, **kwargs)
+    return await run_controlled(control, _run_plan_sync, plan, params, kwargs)
+
+
+def _run_plan_sync(plan, params, kwargs, control=None) -> Dict:
+    try:
+        client = plan.client()
+    except Exception as e:
+        return {"ok": False, "error": str(e)}
+    return exec_query.run_prepared(client, plan.prepared, params, control=control, **kwargs)
+
+
+async def dispose_all() -> None:
+    for engine in async_registry.drain():
+        await engine.dispose()
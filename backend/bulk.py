@@ -0,0 +1,265 @@
+import os
+import re
+import csv
+import json
+import codecs
+import asyncio
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import param_model
+
+# Rows per executemany / COPY call (and per savepoint).
+CHUNK_SIZE = int(os.environ.get("BULK_CHUNK_SIZE", "1000"))
+# Invalid rows listed (with their error) in a bulk report; the rest are only counted.
+MAX_ROW_ERRORS = int(os.environ.get("BULK_MAX_ROW_ERRORS", "100"))
+
+# request Content-Type -> bulk body format
+BULK_CONTENT_TYPES = {"application/x-ndjson": "ndjson", "application/ndjson": "ndjson", "text/csv": "csv"}
+
+_IDENT = r'(?:"[^"]+"|\[[^\]]+\]|`[^`]+`|[\w$]+)'
+_INSERT_RE = re.compile(
+    rf'^\s*INSERT\s+INTO\s+({_IDENT}(?:\s*\.\s*{_IDENT})?)\s*\(([^)]*)\)\s*VALUES\s*\(([^)]*)\)\s*;?\s*$',
+    re.IGNORECASE | re.DOTALL)
+
+
+def copy_target(sql_text: str) -> Optional[Tuple[str, List[str], List[str]]]:
+    """(table, columns, param names) when the statement is a plain single-row
+    `INSERT INTO t (a, b) VALUES (:a, :b)` that COPY can replace, else None."""
+    m = _INSERT_RE.match(sql_text or "")
+    if not m:
+        return None
+    columns = [c.strip() for c in m.group(2).split(",")]
+    values = [v.strip() for v in m.group(3).split(",")]
+    if len(columns) != len(values) or not all(re.fullmatch(r":\w+", v) for v in values):
+        return None
+    return m.group(1), columns, [v[1:] for v in values]
+
+
+class BodyReader:
+    """Blocking iterator over an ASGI request body, for use on a worker thread while the event loop runs."""
+
+    def __init__(self, stream, loop: asyncio.AbstractEventLoop):
+        self._stream = stream.__aiter__()
+        self._loop = loop
+
+    def __iter__(self) -> Iterator[bytes]:
+        while True:
+            try:
+                chunk = asyncio.run_coroutine_threadsafe(self._stream.__anext__(), self._loop).result()
+            except StopAsyncIteration:
+                return
+            if chunk:
+                yield chunk
+
+
+def _lines(body: Iterator[bytes]) -> Iterator[str]:
+    pending = b""
+    for chunk in body:
+        pending += chunk
+        *complete, pending = pending.split(b"\n")
+        for line in complete:
+            yield line.decode("utf-8")
+    if pending:
+        yield pending.decode("utf-8")
+
+
+_WS = " \t\r\n"
+_decoder = json.JSONDecoder()
+
+
+def _json_array(body: Iterator[bytes]) -> Iterator[Any]:
+    """Elements of a top-level JSON array, decoded one at a time as the body arrives.
+
+    Only the element being decoded is buffered. An element is taken once the `,` or `]` after it
+    has arrived, so a value cut at a chunk boundary (e.g. a number) is never decoded early.
+    A malformed element can't be skipped reliably, so it is yielded as a ValueError and ends the body.
+    """
+    chunks = iter(body)
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    buf, pos, eof = "", 0, False
+
+    def more() -> bool:
+        nonlocal buf, pos, eof
+        if eof:
+            return False
+        chunk = next(chunks, None)
+        if chunk is None:
+            eof = True
+            buf = buf[pos:] + utf8.decode(b"", final=True)
+        else:
+            buf = buf[pos:] + utf8.decode(chunk)
+        pos = 0
+        return True
+
+    def skip_ws() -> bool:
+        # True once a non-whitespace character is at buf[pos]
+        nonlocal pos
+        while True:
+            while pos < len(buf) and buf[pos] in _WS:
+                pos += 1
+            if pos < len(buf):
+                return True
+            if not more():
+                return False
+
+    if not skip_ws():
+        return
+    if buf[pos] != "[":
+        raise ValueError("bulk JSON body must be an array")
+    pos += 1
+    if skip_ws() and buf[pos] == "]":
+        return
+    while True:
+        while True:
+            try:
+                value, end = _decoder.raw_decode(buf, pos)
+            except ValueError as e:
+                if more():
+                    continue
+                yield ValueError(f"invalid JSON: {e}")
+                return
+            # the delimiter after the value must have arrived too
+            while end < len(buf) and buf[end] in _WS:
+                end += 1
+            if end < len(buf) or not more():
+                break
+        pos = end
+        if pos >= len(buf):
+            yield ValueError("invalid JSON: unterminated array")
+            return
+        yield value
+        pos += 1
+        if buf[pos - 1] == "]":
+            return
+        if buf[pos - 1] != ",":
+            yield ValueError(f"invalid JSON: expected ',' or ']' at offset {pos - 1}")
+            return
+        if not skip_ws():
+            yield ValueError("invalid JSON: unterminated array")
+            return
+
+
+def iter_records(body: Iterator[bytes], fmt: str) -> Iterator[Any]:
+    """Records of a bulk body, parsed as they arrive (a JSON array element by element).
+
+    Unparseable records are yielded as ValueError instances so they are reported as invalid rows.
+    """
+    if fmt == "json":
+        yield from _json_array(body)
+    elif fmt == "ndjson":
+        for line in _lines(body):
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError as e:
+                yield ValueError(f"invalid JSON: {e}")
+    elif fmt == "csv":
+        reader = csv.reader(_lines(body))
+        header = next(reader, None)
+        if header is None:
+            return
+        header = [h.strip() for h in header]
+        for values in reader:
+            if not values:
+                continue
+            if len(values) != len(header):
+                yield ValueError(f"expected {len(header)} fields, got {len(values)}")
+                continue
+            # empty CSV fields are treated as absent so the param defaults apply
+            yield {k: v for k, v in zip(header, values) if v != ""}
+    else:
+        raise ValueError(f"unsupported bulk format: {fmt}")
+
+
+class _Chunker:
+    """Validates records with the mapping's param model and groups the valid ones into (rows, error)
+    chunks of `chunk_size` records. Invalid records are left out and collected in `row_errors`;
+    under `atomic` a chunk holding one is failed instead so the whole load rolls back."""
+
+    def __init__(self, plan, base: Dict[str, Any], chunk_size: int, atomic: bool):
+        self.plan = plan
+        self.base = base
+        self.chunk_size = chunk_size
+        self.atomic = atomic
+        # input records covered by each chunk yielded so far, and their invalid ones
+        self.records = []
+        self.invalid = []
+        self.row_errors = []
+        self.rows_invalid = 0
+
+    def _row(self, rec):
+        if isinstance(rec, Exception):
+            raise rec
+        if not isinstance(rec, dict):
+            raise ValueError("record must be an object")
+        data = {**self.base, **rec}
+        if self.plan.validator is not None:
+            data = self.plan.validator.validate(data)
+        return {k: v for k, v in data.items() if k not in self.plan.exclude}
+
+    def chunks(self, records: Iterator[Any]) -> Iterator[Tuple[List[dict], Optional[str]]]:
+        rows, seen, invalid = [], 0, 0
+        for n, rec in enumerate(records):
+            seen += 1
+            try:
+                rows.append(self._row(rec))
+            except param_model.ValidationError as e:
+                invalid += 1
+                self._reject(n, param_model.error_text(e))
+            except Exception as e:
+                invalid += 1
+                self._reject(n, str(e))
+            if seen >= self.chunk_size:
+                yield self._chunk(rows, seen, invalid)
+                rows, seen, invalid = [], 0, 0
+        if seen:
+            yield self._chunk(rows, seen, invalid)
+
+    def _reject(self, n: int, error: str) -> None:
+        self.rows_invalid += 1
+        if len(self.row_errors) < MAX_ROW_ERRORS:
+            self.row_errors.append({"row": n, "error": error})
+
+    def _chunk(self, rows: List[dict], seen: int, invalid: int):
+        self.records.append(seen)
+        self.invalid.append(invalid)
+        if invalid and self.atomic:
+            return rows, f"{invalid} invalid rows (see row_errors)"
+        return rows, None
+
+
+def load(plan, body: Iterator[bytes], fmt: str, base: Dict[str, Any], atomic: bool = False,
+         chunk_size: int = CHUNK_SIZE) -> Dict[str, Any]:
+    """Validate and write a bulk body through a write mapping's statement. Runs on a worker thread."""
+    client = plan.client()
+    chunker = _Chunker(plan, base, max(1, chunk_size), atomic)
+    chunks = chunker.chunks(iter_records(body, fmt))
+    results, committed, method = client.execute_chunks(plan.prepared.statement, chunks, copy_target(plan.prepared.sql_text), atomic=atomic)
+
+    report_chunks = []
+    offset = written = 0
+    for i, r in enumerate(results):
+        records, invalid = chunker.records[i], chunker.invalid[i]
+        entry = {"index": i, "first_row": offset, "rows": records, "status": "ok" if r["error"] is None else "error"}
+        if invalid:
+            entry["invalid_rows"] = invalid
+        if r["error"] is None:
+            entry["rowcount"] = r["rowcount"]
+            written += r["rows"]
+        else:
+            entry["error"] = r["error"]
+        report_chunks.append(entry)
+        offset += records
+    failed = [c for c in report_chunks if c["status"] == "error"]
+    return {
+        "ok": committed and not failed and not chunker.rows_invalid,
+        "committed": committed,
+        "method": method,
+        "rows_total": offset,
+        "rows_written": written if committed else 0,
+        "rows_invalid": chunker.rows_invalid,
+        "row_errors": chunker.row_errors,
+        "chunks_failed": len(failed),
+        "chunks": report_chunks,
+    }
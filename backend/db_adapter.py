@@ -1,7 +1,22 @@
+import io
 import os
-from typing import List, Dict, Any, Optional
+import time
+from contextlib import contextmanager
+from typing import List, Dict, Any, Callable, Iterable, Iterator, Optional, Tuple
 from sqlalchemy import create_engine, text, inspect
-from sqlalchemy.engine import Engine
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.sql import Executable
+
+import query_control
+
+def _copy_field(value: Any) -> str:
+    # COPY ... (FORMAT csv): an unquoted empty field is NULL, anything quoted is a literal
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return '"' + str(value).replace('"', '""') + '"'
+
 
 class DatabaseClient:
     """
@@ -9,9 +24,62 @@ class DatabaseClient:
     Enforces Rule 1 (Explicit row shape) and Rule 2 (Normalization at boundary).
     """
 
-    def __init__(self, sqlalchemy_url: str):
+    def __init__(self, sqlalchemy_url: str, engine: Optional[Engine] = None, connection: Optional[Connection] = None,
+                 pool_timer: Optional[Callable[[float], None]] = None):
         self.url = sqlalchemy_url
-        self.engine = create_engine(self.url)
+        # called with the seconds spent waiting for a pooled connection (see metrics.pool_timer)
+        self._pool_timer = pool_timer
+        # statement timeout / cancellation for the current execution (query_control.QueryControl)
+        self.control = None
+        # A shared engine (from engine_registry) outlives this client; only dispose engines we created.
+        self._owns_engine = engine is None and connection is None
+        self._connection = connection
+        if connection is not None:
+            self.engine = connection.engine
+        else:
+            self.engine = engine if engine is not None else create_engine(self.url)
+
+    @classmethod
+    def for_connection(cls, connection: Connection) -> "DatabaseClient":
+        """Client bound to an already-open connection, e.g. the sync facade inside AsyncConnection.run_sync."""
+        return cls(str(connection.engine.url), connection=connection)
+
+    @property
+    def dialect_name(self) -> str:
+        return self.engine.dialect.name
+
+    def connect(self):
+        """Context manager yielding a connection; reuses the bound connection without closing it.
+        While `control` is set, its statement timeout and cancellation apply to the connection."""
+        if self._connection is not None:
+            conn = self._bound()
+        elif self._pool_timer is None:
+            conn = self.engine.connect()
+        else:
+            start = time.perf_counter()
+            conn = self.engine.connect()
+            self._pool_timer(time.perf_counter() - start)
+        return self._controlled(conn)
+
+    @contextmanager
+    def _controlled(self, connection_cm):
+        with connection_cm as conn:
+            if self.control is not None:
+                with self.control.applied(conn):
+                    yield conn
+            else:
+                query_control.clear_session_timeout(conn)
+                yield conn
+
+    @contextmanager
+    def _bound(self):
+        # Mirror closing a pooled connection: whatever transaction is left open is rolled back.
+        conn = self._connection
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction():
+                conn.rollback()
 
     def fetch_all(self, query: str, params: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
         """
@@ -21,7 +89,7 @@ class DatabaseClient:
         if params is None:
             params = {}
 
-        with self.engine.connect() as conn:
+        with self.connect() as conn:
             result = conn.execute(text(query), params)
             if not result.returns_rows:
                 return []
@@ -37,25 +105,171 @@ class DatabaseClient:
         
         return rows
 
-    def execute(self, query: str, params: Optional[Dict[str, Any]] = None, commit: bool = True) -> int:
+    def fetch_page(self, query: str | Executable, params: Optional[Dict[str, Any]] = None, limit: int = 100, offset: int = 0) -> Tuple[List[Dict[str, Any]], bool]:
+        """
+        Executes a query and returns at most `limit` rows plus a flag telling whether more rows exist.
+        Fetches limit + 1 rows (the extra one is a probe for `more`) through a server-side cursor
+        where the driver supports one, so the remainder of the result set is never materialized.
+        `offset` rows are skipped on the cursor first; prefer pushing OFFSET into the SQL where possible.
+        """
+        columns, _, tuples, more = self.fetch_page_rows(query, params, limit=limit, offset=offset)
+        rows = [dict(zip(columns, r)) for r in tuples]
+
+        # Rule 4: Structural assertions
+        assert isinstance(rows, list), f"Expected list, got {type(rows)}"
+        if rows:
+            assert isinstance(rows[0], dict), f"Expected dict rows, got {type(rows[0])}"
+
+        return rows, more
+
+    def fetch_page_rows(self, query: str | Executable, params: Optional[Dict[str, Any]] = None, limit: int = 100,
+                        offset: int = 0) -> Tuple[List[str], List[Any], List[tuple], bool]:
+        """
+        Same as fetch_page but returns (column names, cursor description type codes, row tuples, more),
+        leaving conversion to the caller (see serializer.py).
+        """
+        if params is None:
+            params = {}
+        stmt = text(query) if isinstance(query, str) else query
+
+        with self.connect() as conn:
+            result = conn.execution_options(stream_results=True).execute(stmt, params)
+            if not result.returns_rows:
+                return [], [], [], False
+            columns = list(result.keys())
+            description = getattr(result, "cursor", None) and result.cursor.description
+            type_codes = [d[1] for d in description] if description else []
+
+            skipped = 0
+            while skipped < offset:
+                chunk = result.fetchmany(min(offset - skipped, 1000))
+                if not chunk:
+                    break
+                skipped += len(chunk)
+
+            rows = [tuple(row) for row in result.fetchmany(limit + 1)]
+            result.close()
+
+        more = len(rows) > limit
+        return columns, type_codes, rows[:limit], more
+
+    def stream_rows(self, query: str | Executable, params: Optional[Dict[str, Any]] = None, chunk_size: int = 1000) -> Iterator[List[Any]]:
+        """
+        Generator over a result through a server-side cursor. Yields the column names first,
+        then lists of up to `chunk_size` row tuples. The connection stays checked out until the
+        generator is exhausted or closed.
+        """
+        if params is None:
+            params = {}
+        stmt = text(query) if isinstance(query, str) else query
+
+        with self.connect() as conn:
+            result = conn.execution_options(stream_results=True, yield_per=chunk_size).execute(stmt, params)
+            if not result.returns_rows:
+                yield []
+                return
+            yield list(result.keys())
+            for partition in result.partitions():
+                yield [tuple(row) for row in partition]
+
+    def execute(self, query: str | Executable, params: Optional[Dict[str, Any]] = None, commit: bool = True) -> int:
         """
         Executes a non-selection query (INSERT, UPDATE, DELETE) and returns rowcount.
         """
         if params is None:
             params = {}
+        stmt = text(query) if isinstance(query, str) else query
 
-        with self.engine.connect() as conn:
+        with self.connect() as conn:
             if commit:
                 with conn.begin():
-                    result = conn.execute(text(query), params)
+                    result = conn.execute(stmt, params)
                     rowcount = result.rowcount
             else:
-                result = conn.execute(text(query), params)
+                result = conn.execute(stmt, params)
                 rowcount = result.rowcount
             return rowcount
 
+    def execute_chunks(self, query: str | Executable, chunks: Iterable[Tuple[List[Dict[str, Any]], Optional[str]]],
+                       copy_target: Optional[Tuple[str, List[str], List[str]]] = None, atomic: bool = False) -> Tuple[List[Dict[str, Any]], bool, str]:
+        """
+        Runs a write statement once per row for an iterable of (rows, error) chunks inside one transaction.
+        Each chunk gets a savepoint: a failing chunk (or one arriving with an error, e.g. validation)
+        is rolled back and reported while the rest commit, unless `atomic`, where the first failure
+        rolls back everything. Uses COPY for psycopg2 when `copy_target` (table, columns, params) is
+        given, pyodbc fast_executemany for MSSQL, and executemany otherwise.
+        Returns (per-chunk results, committed, method).
+        """
+        stmt = text(query) if isinstance(query, str) else query
+        driver = self.engine.dialect.driver
+        if copy_target is not None and self.dialect_name == "postgresql" and driver == "psycopg2":
+            method = "copy"
+        elif self.dialect_name == "mssql" and driver == "pyodbc":
+            method = "fast_executemany"
+        else:
+            method = "executemany"
+
+        results = []
+        with self.connect() as conn:
+            trans = conn.begin()
+            try:
+                for rows, error in chunks:
+                    result = {"rows": len(rows), "rowcount": 0, "error": error}
+                    results.append(result)
+                    if error is None and rows:
+                        savepoint = conn.begin_nested()
+                        try:
+                            if method == "copy":
+                                result["rowcount"] = self._copy_rows(conn, copy_target, rows)
+                            elif method == "fast_executemany":
+                                result["rowcount"] = self._fast_executemany(conn, stmt, rows)
+                            else:
+                                result["rowcount"] = conn.execute(stmt, rows).rowcount
+                            savepoint.commit()
+                        except Exception as e:
+                            savepoint.rollback()
+                            result["error"] = str(e)
+                    if result["error"] is not None and atomic:
+                        trans.rollback()
+                        return results, False, method
+                trans.commit()
+            except BaseException:
+                if trans.is_active:
+                    trans.rollback()
+                raise
+        return results, True, method
+
+    @staticmethod
+    def _fast_executemany(conn: Connection, stmt, rows: List[Dict[str, Any]]) -> int:
+        # pyodbc binds the whole parameter array in one round trip; the statement is compiled to qmark form
+        compiled = stmt.compile(dialect=conn.dialect)
+        names = compiled.positiontup or []
+        cursor = conn.connection.dbapi_connection.cursor()
+        try:
+            cursor.fast_executemany = True
+            cursor.executemany(str(compiled), [tuple(r.get(n) for n in names) for r in rows])
+            return cursor.rowcount
+        finally:
+            cursor.close()
+
+    @staticmethod
+    def _copy_rows(conn: Connection, copy_target: Tuple[str, List[str], List[str]], rows: List[Dict[str, Any]]) -> int:
+        table, columns, names = copy_target
+        buf = io.StringIO()
+        for r in rows:
+            buf.write(",".join(_copy_field(r.get(n)) for n in names))
+            buf.write("\n")
+        buf.seek(0)
+        cursor = conn.connection.dbapi_connection.cursor()
+        try:
+            cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buf)
+            return cursor.rowcount
+        finally:
+            cursor.close()
+
     def get_inspector(self):
-        return inspect(self.engine)
+        return inspect(self._connection if self._connection is not None else self.engine)
 
     def dispose(self):
-        self.engine.dispose()
+        if self._owns_engine:
+            self.engine.dispose()
@@ -1,15 +1,22 @@
 import time
-from db_adapter import DatabaseClient
+from typing import Dict
+from engine_registry import get_client
 
-def test_connection(sqlalchemy_url: str, timeout_seconds: float = 5.0) -> dict:
-    """Check connectivity using the DatabaseClient."""
+def test_connection(connector: Dict | str, timeout_seconds: float = 5.0) -> dict:
+    """Check connectivity using the DatabaseClient.
+
+    Accepts a connector record (uses its pooled engine) or a bare SQLAlchemy URL.
+    """
     start = time.perf_counter()
+    client = None
     try:
         # Try to fetch 1 row of a dummy query
-        client = DatabaseClient(sqlalchemy_url)
+        client = get_client(connector)
         client.fetch_all("SELECT 1")
         latency_ms = int((time.perf_counter() - start) * 1000)
-        client.dispose()
         return {"ok": True, "latency_ms": latency_ms}
     except Exception as e:
         return {"ok": False, "error": str(e)}
+    finally:
+        if client is not None:
+            client.dispose()
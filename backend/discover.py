@@ -1,69 +1,179 @@
-from typing import Dict, List, Any
-from db_adapter import DatabaseClient
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from uuid import uuid4
+from sqlalchemy import select, table as sql_table, literal_column
+from sqlalchemy.pool import SingletonThreadPool, StaticPool
+from engine_registry import get_client
 
-def discover_schema(sqlalchemy_url: str, sample_rows: int = 5) -> Dict:
-    """Discover schema for the given URL.
+# Concurrent sample queries per discovery; each holds one pooled connection while it runs.
+SAMPLE_WORKERS = int(os.environ.get("DISCOVER_SAMPLE_WORKERS", "4"))
+# finished background jobs kept for polling
+MAX_JOBS = int(os.environ.get("DISCOVER_MAX_JOBS", "100"))
+
+
+def _sample_rows(client, table_name: str, sample_rows: int) -> List[list]:
+    """Fetch up to `sample_rows` rows from a table as lists of JSON-safe values.
+
+    The statement is compiled per dialect (LIMIT / TOP / FETCH FIRST) and the table name
+    quoted by SQLAlchemy, and fetch_page stops reading after the requested rows.
+    """
+    query = select(literal_column("*")).select_from(sql_table(table_name)).limit(sample_rows)
+    rows, _ = client.fetch_page(query, limit=sample_rows)
+    # Convert dict to list of values for the sample_rows format expected by frontend
+    return [[None if x is None else (x if isinstance(x, (int, float, bool)) else str(x)) for x in r.values()] for r in rows]
+
+
+def _column_info(col: dict) -> dict:
+    return {
+        "name": col.get("name"),
+        "type": str(col.get("type")),
+        "nullable": col.get("nullable"),
+        "default": col.get("default"),
+    }
+
+
+def _reflect(inspector) -> Dict[str, Tuple[list, list]]:
+    """table name -> (columns, pk columns) for the default schema, in as few round trips as the dialect allows."""
+    try:
+        multi_cols = inspector.get_multi_columns()
+        multi_pk = inspector.get_multi_pk_constraint()
+    except NotImplementedError:
+        multi_cols = None
+    if multi_cols is None:
+        # dialects without bulk reflection: one call per table
+        return {name: ([_column_info(c) for c in inspector.get_columns(name)],
+                       inspector.get_pk_constraint(name).get("constrained_columns", []))
+                for name in inspector.get_table_names()}
+    out = {}
+    for key, cols in multi_cols.items():
+        name = key[1]
+        pk = (multi_pk.get(key) or {}).get("constrained_columns", [])
+        out[name] = ([_column_info(c) for c in cols], pk)
+    return out
+
+
+def _sample_workers(client) -> int:
+    # SingletonThreadPool/StaticPool hand every thread its own database (in-memory SQLite) or share
+    # one connection between threads; sample those serially
+    if isinstance(client.engine.pool, (SingletonThreadPool, StaticPool)):
+        return 1
+    return max(1, SAMPLE_WORKERS)
+
+
+def discover_schema(connector: Dict | str, sample_rows: int = 5, previous: Optional[Dict] = None,
+                    progress: Optional[Callable[[Dict[str, int]], None]] = None) -> Dict:
+    """Discover schema for the given connector record or URL.
+    Columns and primary keys are reflected in bulk; tables whose columns and pk match the
+    `previous` snapshot and that hold at least `sample_rows` sample rows there keep their entry
+    from it (sample cut to size), the others are sampled concurrently on up to
+    DISCOVER_SAMPLE_WORKERS connections. `progress` receives counters as tables complete.
     Rule 3: No direct cursor usage.
     """
     snapshot = {"tables": {}}
-    client = DatabaseClient(sqlalchemy_url)
+    prev_tables = (previous or {}).get("tables", {})
+    client = get_client(connector)
     try:
-        inspector = client.get_inspector()
-        for table_name in inspector.get_table_names():
-            cols = []
-            for col in inspector.get_columns(table_name):
-                cols.append({
-                    "name": col.get("name"),
-                    "type": str(col.get("type")),
-                    "nullable": col.get("nullable"),
-                    "default": col.get("default"),
-                })
-
-            pk = inspector.get_pk_constraint(table_name).get("constrained_columns", [])
-
-            # Sample rows
-            sample = []
+        reflected = _reflect(client.get_inspector())
+
+        pending = []
+        for table_name, (cols, pk) in reflected.items():
+            prev = prev_tables.get(table_name)
+            prev_sample = (prev or {}).get("sample_rows") or []
+            # a shorter previous sample may be from a smaller request (or a table that has grown since)
+            if prev is not None and prev.get("columns") == cols and prev.get("pk") == pk and len(prev_sample) >= sample_rows:
+                snapshot["tables"][table_name] = prev if len(prev_sample) == sample_rows else {**prev, "sample_rows": prev_sample[:sample_rows]}
+            else:
+                snapshot["tables"][table_name] = {"columns": cols, "pk": pk, "sample_rows": []}
+                pending.append(table_name)
+
+        counts = {"tables_total": len(reflected), "tables_skipped": len(reflected) - len(pending), "tables_done": len(reflected) - len(pending)}
+        if progress:
+            progress(dict(counts))
+
+        def sample(table_name: str) -> list:
             try:
-                # Use fetch_all for standardized row shape
-                # We need to quote table names for safety
-                query = f"SELECT * FROM \"{table_name}\" LIMIT {sample_rows}"
-                # For SQLite, double quotes might not be enough if it's not strictly followed, 
-                # but SQLAlchemy usually handles it.
-                rows = client.fetch_all(query)
-                for r in rows:
-                    # Convert dict to list of values for the sample_rows format expected by frontend
-                    sample.append([None if x is None else (x if isinstance(x, (int, float, bool)) else str(x)) for x in r.values()])
+                return _sample_rows(client, table_name, sample_rows)
             except Exception:
-                sample = []
+                return []
 
-            snapshot["tables"][table_name] = {"columns": cols, "pk": pk, "sample_rows": sample}
+        with ThreadPoolExecutor(max_workers=min(_sample_workers(client), max(1, len(pending))), thread_name_prefix="discover") as pool:
+            futures = {pool.submit(sample, name): name for name in pending}
+            for fut in as_completed(futures):
+                snapshot["tables"][futures[fut]]["sample_rows"] = fut.result()
+                counts["tables_done"] += 1
+                if progress:
+                    progress(dict(counts))
 
+        # keep the inspector's table order rather than completion order
+        snapshot["tables"] = {name: snapshot["tables"][name] for name in reflected}
         return snapshot
     finally:
         client.dispose()
 
-def get_table_info(sqlalchemy_url: str, table: str, sample_rows: int = 5) -> Dict:
+
+# --- background discovery jobs ---
+
+_jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_jobs_lock = threading.Lock()
+
+
+def start_job(connector: Dict, sample_rows: int = 5, previous: Optional[Dict] = None,
+              on_complete: Optional[Callable[[Dict], Dict]] = None) -> Dict[str, Any]:
+    """Run discover_schema on a background thread and return the job record to poll with get_job.
+
+    `on_complete(snapshot)` (e.g. saving it) runs on the job thread; its return value is stored as `record`.
+    """
+    job = {
+        "id": uuid4().hex,
+        "connector_id": connector.get("id"),
+        "status": "running",
+        "tables_total": None,
+        "tables_done": 0,
+        "tables_skipped": 0,
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "finished_at": None,
+        "error": None,
+    }
+    with _jobs_lock:
+        _jobs[job["id"]] = job
+        while len(_jobs) > MAX_JOBS:
+            _jobs.popitem(last=False)
+
+    def run():
+        try:
+            snapshot = discover_schema(connector, sample_rows=sample_rows, previous=previous, progress=job.update)
+            job["record"] = on_complete(snapshot) if on_complete else None
+            job["tables"] = snapshot.get("tables", {})
+            job["status"] = "done"
+        except Exception as e:
+            job["error"] = str(e)
+            job["status"] = "error"
+        job["finished_at"] = datetime.now(timezone.utc).isoformat()
+
+    threading.Thread(target=run, name=f"discover-{job['id'][:8]}", daemon=True).start()
+    return dict(job)
+
+
+def get_job(job_id: str) -> Optional[Dict[str, Any]]:
+    job = _jobs.get(job_id)
+    return dict(job) if job is not None else None
+
+
+def get_table_info(connector: Dict | str, table: str, sample_rows: int = 5) -> Dict:
     """Return column metadata, primary key and sample rows for a single table."""
-    client = DatabaseClient(sqlalchemy_url)
+    client = get_client(connector)
     try:
         inspector = client.get_inspector()
-        cols = []
-        for col in inspector.get_columns(table):
-            cols.append({
-                "name": col.get("name"),
-                "type": str(col.get("type")),
-                "nullable": col.get("nullable"),
-                "default": col.get("default"),
-            })
+        cols = [_column_info(col) for col in inspector.get_columns(table)]
 
         pk = inspector.get_pk_constraint(table).get("constrained_columns", [])
 
-        sample = []
         try:
-            query = f"SELECT * FROM \"{table}\" LIMIT {sample_rows}"
-            rows = client.fetch_all(query)
-            for r in rows:
-                sample.append([None if x is None else (x if isinstance(x, (int, float, bool)) else str(x)) for x in r.values()])
+            sample = _sample_rows(client, table, sample_rows)
         except Exception:
             sample = []
 
@@ -0,0 +1,251 @@
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.routing import BaseRoute, Match
+
+import serializer
+
+# Endpoint value marking an undeployed path+method; requests get 410 instead of 404/405.
+TOMBSTONE = object()
+
+_STATIC, _PARAM, _CATCHALL = 0, 1, 2
+
+
+def _parse(path: str) -> List[Tuple[int, str]]:
+    """Split a route template into (kind, key) segments. `{name}` matches one segment, `{name:path}` the rest."""
+    if not path.startswith("/"):
+        raise ValueError("path must start with /")
+    segs = []
+    parts = path[1:].split("/")
+    for i, part in enumerate(parts):
+        if part.startswith("{") and part.endswith("}"):
+            name, _, convertor = part[1:-1].partition(":")
+            if convertor == "path":
+                if i != len(parts) - 1:
+                    raise ValueError("{name:path} must be the last segment")
+                segs.append((_CATCHALL, name))
+            else:
+                # other convertors (int, float, ...) are left to the mapping's param model
+                segs.append((_PARAM, name))
+        else:
+            segs.append((_STATIC, part))
+    return segs
+
+
+class _Node:
+    """Trie node. Nodes are never mutated once reachable from a published root (copy-on-write)."""
+
+    __slots__ = ("static", "params", "catchall", "endpoints")
+
+    def __init__(self, other: Optional["_Node"] = None):
+        self.static: Dict[str, "_Node"] = dict(other.static) if other else {}
+        self.params: Dict[str, "_Node"] = dict(other.params) if other else {}
+        self.catchall: Dict[str, "_Node"] = dict(other.catchall) if other else {}
+        self.endpoints: Dict[str, Any] = dict(other.endpoints) if other else {}
+
+    def empty(self) -> bool:
+        return not (self.static or self.params or self.catchall or self.endpoints)
+
+
+_CHILDREN = {_STATIC: "static", _PARAM: "params", _CATCHALL: "catchall"}
+
+
+def _with(node: Optional[_Node], segs, i: int, method: str, endpoint) -> _Node:
+    """Copy of `node` with `endpoint` set (or removed when None) at segs[i:]; only the path is copied."""
+    node = _Node(node)
+    if i == len(segs):
+        if endpoint is None:
+            node.endpoints.pop(method, None)
+        else:
+            node.endpoints[method] = endpoint
+        return node
+    kind, key = segs[i]
+    children = getattr(node, _CHILDREN[kind])
+    child = children.get(key)
+    if child is None and endpoint is None:
+        return node
+    child = _with(child, segs, i + 1, method, endpoint)
+    if child.empty():
+        children.pop(key, None)
+    else:
+        children[key] = child
+    return node
+
+
+def _insert(root: _Node, segs, method: str, endpoint, owned: set) -> None:
+    """Set `endpoint` at segs in a trie being built privately; nodes not in `owned` are copied first."""
+    node = root
+    for kind, key in segs:
+        children = getattr(node, _CHILDREN[kind])
+        child = children.get(key)
+        if child is None or id(child) not in owned:
+            child = _Node(child)
+            owned.add(id(child))
+            children[key] = child
+        node = child
+    node.endpoints[method] = endpoint
+
+
+def _match(node: _Node, segs: List[str], i: int, params: Dict[str, str]) -> Optional[_Node]:
+    if i == len(segs):
+        return node if node.endpoints else None
+    seg = segs[i]
+    # static segments win over parameters, as with declaration-ordered routes
+    child = node.static.get(seg)
+    if child is not None:
+        found = _match(child, segs, i + 1, params)
+        if found is not None:
+            return found
+    if seg:
+        for name, child in node.params.items():
+            params[name] = seg
+            found = _match(child, segs, i + 1, params)
+            if found is not None:
+                return found
+            del params[name]
+    for name, child in node.catchall.items():
+        if child.endpoints:
+            params[name] = "/".join(segs[i:])
+            return child
+    return None
+
+
+class MappingDispatcher(BaseRoute):
+    """
+    Single route that serves every deployed mapping. Paths live in a radix-style trie keyed by
+    segment, with endpoints per method at the leaves, so lookup costs O(path length) however
+    many mappings are deployed. Writers build a new root by path copying and publish it with one
+    assignment, so requests always see either the old or the new table, never a partial update.
+    """
+
+    def __init__(self):
+        self._root = _Node()
+        self._templates: Dict[Tuple[str, str], Any] = {}
+        self._lock = threading.Lock()
+
+    # --- registry ---
+
+    def _set(self, path: str, method: str, endpoint) -> None:
+        segs = _parse(path)
+        method = method.upper()
+        with self._lock:
+            self._root = _with(self._root, segs, 0, method, endpoint)
+            if endpoint is None:
+                self._templates.pop((path, method), None)
+            else:
+                self._templates[(path, method)] = endpoint
+
+    def add(self, path: str, method: str, endpoint: Callable) -> None:
+        """Register (or atomically replace) the ASGI endpoint for path+method."""
+        self._set(path, method, endpoint)
+
+    def add_many(self, entries) -> List[Tuple[str, str]]:
+        """Register many (path, method, endpoint) entries with a single publish.
+
+        Path copying per entry would recopy shared parents (e.g. `/api`) once per route;
+        here each node is copied at most once, so loading N routes stays linear.
+        Returns the (path, method) pairs skipped because their template is invalid.
+        """
+        parsed, rejected = [], []
+        for path, method, endpoint in entries:
+            try:
+                parsed.append((_parse(path), path, method.upper(), endpoint))
+            except ValueError:
+                rejected.append((path, method))
+        with self._lock:
+            root = _Node(self._root)
+            owned = {id(root)}
+            for segs, path, method, endpoint in parsed:
+                _insert(root, segs, method, endpoint, owned)
+                self._templates[(path, method)] = endpoint
+            self._root = root
+        return rejected
+
+    def tombstone(self, path: str, method: str) -> None:
+        """Mark path+method as undeployed: it keeps answering 410 until redeployed."""
+        self._set(path, method, TOMBSTONE)
+
+    def remove(self, path: str, method: str) -> None:
+        self._set(path, method, None)
+
+    def lookup(self, path: str) -> Optional[Tuple[Dict[str, Any], Dict[str, str]]]:
+        """Endpoints by method and extracted path params for a request path, or None."""
+        if not path.startswith("/"):
+            return None
+        params: Dict[str, str] = {}
+        node = _match(self._root, path[1:].split("/"), 0, params)
+        if node is None:
+            return None
+        return node.endpoints, params
+
+    def resolve(self, path: str, method: str) -> Tuple[Any, Dict[str, str]]:
+        """Endpoint and path params for path+method, raising the HTTPException a request would get."""
+        found = self.lookup(path)
+        if found is None:
+            raise HTTPException(status_code=404, detail="Not Found")
+        endpoints, params = found
+        endpoint = endpoints.get(method.upper())
+        if endpoint is None:
+            raise HTTPException(status_code=405, detail="Method Not Allowed")
+        if endpoint is TOMBSTONE:
+            raise HTTPException(status_code=410, detail="mapping undeployed")
+        return endpoint, params
+
+    def routes(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            items = list(self._templates.items())
+        return [{"path": path, "methods": [method], "name": "tombstone" if ep is TOMBSTONE else "mapping"}
+                for (path, method), ep in sorted(items)]
+
+    # --- starlette routing ---
+
+    def matches(self, scope) -> Tuple[Match, dict]:
+        if scope["type"] != "http":
+            return Match.NONE, {}
+        found = self.lookup(scope["path"])
+        if found is None:
+            return Match.NONE, {}
+        endpoints, params = found
+        child_scope = {"path_params": {**scope.get("path_params", {}), **params}, "mapping_endpoints": endpoints}
+        method = scope["method"]
+        if method in endpoints or (method == "HEAD" and "GET" in endpoints):
+            return Match.FULL, child_scope
+        return Match.PARTIAL, child_scope
+
+    async def handle(self, scope, receive, send) -> None:
+        endpoints = scope["mapping_endpoints"]
+        method = scope["method"]
+        endpoint = endpoints.get(method)
+        if endpoint is None and method == "HEAD":
+            endpoint = endpoints.get("GET")
+        if endpoint is None:
+            raise HTTPException(status_code=405, detail="Method Not Allowed", headers={"Allow": ", ".join(sorted(endpoints))})
+        if endpoint is TOMBSTONE:
+            raise HTTPException(status_code=410, detail="mapping undeployed")
+        await endpoint(scope, receive, send)
+
+
+def mapping_app(handler: Callable, mapping_id: Optional[str] = None) -> Callable:
+    """Adapt an `async handler(request, response)` to ASGI, rendering non-Response results as JSON.
+
+    Results are encoded in one pass by serializer.dumps: mapping results are already JSON-ready,
+    so FastAPI's jsonable_encoder walk is skipped.
+
+    Headers set on `response` are copied onto the rendered result, as FastAPI does for injected responses.
+    """
+
+    async def app(scope, receive, send):
+        request = Request(scope, receive, send)
+        sub_response = Response()
+        del sub_response.headers["content-length"]
+        result = await handler(request, sub_response)
+        if not isinstance(result, Response):
+            result = serializer.JSONBytesResponse(result, status_code=sub_response.status_code)
+            result.headers.update(sub_response.headers)
+        await result(scope, receive, send)
+
+    app.mapping_id = mapping_id
+    return app
@@ -0,0 +1,183 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine, make_url
+
+import storage
+import metrics
+from db_adapter import DatabaseClient
+
+# Process-wide defaults; individual connectors may override them via their "pool" entry.
+DEFAULT_POOL_OPTIONS = {
+    "pool_size": int(os.environ.get("DB_POOL_SIZE", "5")),
+    "max_overflow": int(os.environ.get("DB_MAX_OVERFLOW", "10")),
+    "pool_recycle": int(os.environ.get("DB_POOL_RECYCLE", "1800")),
+    "pool_timeout": int(os.environ.get("DB_POOL_TIMEOUT", "30")),
+    "pool_pre_ping": os.environ.get("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes"),
+}
+
+# Upper bound on live engines and how long an unused one may keep its pool open.
+MAX_ENGINES = int(os.environ.get("ENGINE_REGISTRY_MAX_ENGINES", "64"))
+IDLE_TIMEOUT_SECONDS = float(os.environ.get("ENGINE_IDLE_TIMEOUT", "900"))
+
+
+def _engine_options(url: str, pool: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Merge connector pool overrides onto the defaults, dropping options the pool class can't take."""
+    opts = dict(DEFAULT_POOL_OPTIONS)
+    for k, v in (pool or {}).items():
+        if k in opts and v is not None:
+            opts[k] = v
+
+    parsed = make_url(url)
+    if parsed.get_backend_name() == "sqlite" and parsed.database in (None, "", ":memory:"):
+        # in-memory SQLite uses SingletonThreadPool, which has no size/overflow/timeout knobs
+        return {"pool_pre_ping": opts["pool_pre_ping"]}
+    return opts
+
+
+def _create_engine(factory, url: str, pool: Optional[Dict[str, Any]]):
+    opts = _engine_options(url, pool)
+    try:
+        return factory(url, **opts)
+    except TypeError:
+        # the dialect picked a pool class without sizing knobs (NullPool, StaticPool, ...)
+        return factory(url, pool_pre_ping=opts.get("pool_pre_ping", False))
+
+
+class _Entry:
+    __slots__ = ("fingerprint", "engine", "last_used")
+
+    def __init__(self, fingerprint: tuple, engine: Engine):
+        self.fingerprint = fingerprint
+        self.engine = engine
+        self.last_used = time.monotonic()
+
+
+class EngineRegistry:
+    """
+    Keeps one pooled SQLAlchemy engine per connector id for the lifetime of the process.
+    Engines are rebuilt when the connector's URL or pool settings change and evicted
+    least-recently-used once more than `max_engines` are alive or after `idle_timeout` seconds unused.
+    """
+
+    def __init__(self, max_engines: int = MAX_ENGINES, idle_timeout: float = IDLE_TIMEOUT_SECONDS,
+                 engine_factory=create_engine, url_for=None, disposer=None):
+        self.max_engines = max_engines
+        self.idle_timeout = idle_timeout
+        # hooks so the same registry can hold AsyncEngines (see async_exec)
+        self._engine_factory = engine_factory
+        self._url_for = url_for or (lambda url: url)
+        self._dispose = disposer or (lambda engine: engine.dispose())
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_engine(self, connector: Dict) -> Engine:
+        connector_id = connector.get("id")
+        url = self._url_for(connector.get("sqlalchemy_url", ""))
+        pool = connector.get("pool") or {}
+        fingerprint = (url, tuple(sorted(pool.items())))
+
+        stale = []
+        with self._lock:
+            entry = self._entries.get(connector_id)
+            if entry is not None and entry.fingerprint != fingerprint:
+                stale.append(self._entries.pop(connector_id).engine)
+                entry = None
+
+            if entry is None:
+                entry = _Entry(fingerprint, _create_engine(self._engine_factory, url, pool))
+                self._entries[connector_id] = entry
+            else:
+                self._entries.move_to_end(connector_id)
+            entry.last_used = time.monotonic()
+            engine = entry.engine
+
+            stale.extend(self._evict_locked(keep=connector_id))
+
+        for e in stale:
+            self._dispose(e)
+        return engine
+
+    def get_client(self, connector: Dict) -> DatabaseClient:
+        """Return a DatabaseClient bound to the connector's shared engine."""
+        return DatabaseClient(connector.get("sqlalchemy_url", ""), engine=self.get_engine(connector),
+                              pool_timer=metrics.pool_timer(connector.get("id")))
+
+    def invalidate(self, connector_id: str) -> bool:
+        """Drop and dispose the engine for a connector. Returns True if one was registered."""
+        with self._lock:
+            entry = self._entries.pop(connector_id, None)
+        if entry is None:
+            return False
+        self._dispose(entry.engine)
+        return True
+
+    def drain(self) -> list:
+        """Remove every engine from the registry and return them without disposing."""
+        with self._lock:
+            engines = [entry.engine for entry in self._entries.values()]
+            self._entries.clear()
+        return engines
+
+    def dispose_all(self) -> None:
+        for engine in self.drain():
+            self._dispose(engine)
+
+    def _evict_locked(self, keep: str) -> list:
+        evicted = []
+        now = time.monotonic()
+        # OrderedDict is kept in LRU order, so idle entries are always at the front
+        for cid in list(self._entries.keys()):
+            if cid == keep:
+                continue
+            entry = self._entries[cid]
+            over_cap = len(self._entries) > self.max_engines
+            idle = self.idle_timeout > 0 and now - entry.last_used > self.idle_timeout
+            if not (over_cap or idle):
+                break
+            evicted.append(self._entries.pop(cid).engine)
+        return evicted
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "engines": len(self._entries),
+                "max_engines": self.max_engines,
+                "connectors": list(self._entries.keys()),
+            }
+
+    def pool_stats(self) -> Dict[str, Dict[str, int]]:
+        """Per-connector pool occupancy, for pools that track it (QueuePool and friends)."""
+        with self._lock:
+            engines = [(cid, entry.engine) for cid, entry in self._entries.items()]
+        out = {}
+        for cid, engine in engines:
+            pool = getattr(engine, "sync_engine", engine).pool
+            stats = {}
+            for name, attr in (("size", "size"), ("checked_out", "checkedout"), ("overflow", "overflow")):
+                fn = getattr(pool, attr, None)
+                if callable(fn):
+                    # QueuePool.overflow() is negative while the base pool still has room
+                    stats[name] = max(fn(), 0)
+            out[cid] = stats
+        return out
+
+
+registry = EngineRegistry()
+storage.add_connector_listener(registry.invalidate)
+metrics.register_collector("pool", registry.pool_stats, label="connector")
+
+
+def get_client(connector: Dict | str) -> DatabaseClient:
+    """Resolve a DatabaseClient for a connector record or a bare URL.
+
+    Connector records with an id share a pooled engine from the registry; bare URLs
+    (e.g. testing a connection before it is saved) get a throwaway engine.
+    """
+    if isinstance(connector, dict) and connector.get("id"):
+        return registry.get_client(connector)
+    url = connector.get("sqlalchemy_url", "") if isinstance(connector, dict) else connector
+    return DatabaseClient(url)
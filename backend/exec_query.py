@@ -1,6 +1,14 @@
-from typing import Any, Dict, List
-from sqlalchemy import text
-from db_adapter import DatabaseClient
+import io
+import csv
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterator, List, Sequence, Tuple
+from sqlalchemy import text, bindparam
+from sqlalchemy.exc import OperationalError, ProgrammingError
+from sqlalchemy.sql import Executable
+from engine_registry import get_client
+from query_control import QueryControl
+import pagination
+import serializer
 
 def _to_json_safe(val: Any):
     # minimal conversion
@@ -18,24 +26,26 @@ def _get_url(connector: Dict | str) -> str:
         return connector.get("sqlalchemy_url", "")
     return connector
 
-def preview_query(connector: Dict, sql_text: str, params: Dict[str, Any] | None = None, max_rows: int = 10) -> Dict:
+def preview_query(connector: Dict, sql_text: str, params: Dict[str, Any] | None = None, max_rows: int = 10,
+                  control: QueryControl | None = None) -> Dict:
     """Execute the SQL and return sample results. 
+    `control` (statement timeout / cancellation) applies to the execution.
     Rule 3: No direct cursor usage here.
     """
     url = _get_url(connector)
     if not url:
         return {"ok": False, "error": "missing connector url"}
 
-    client = DatabaseClient(url)
+    client = get_client(connector)
+    client.control = control
     try:
         # For preview, we still want to ensure we don't commit anything if the user provides a write query
         # Although DatabaseClient uses autocommit for SELECTs, we can wrap in a transaction if needed.
         # But SELECTs are safe. If it's a non-select, we don't want to commit in preview.
         
         if sql_text.strip().lower().startswith("select"):
-            rows = client.fetch_all(sql_text, params)
-            # Limit rows for preview
-            rows = rows[:max_rows]
+            # Only the first max_rows rows are fetched from the cursor
+            rows, _ = client.fetch_page(sql_text, params, limit=max_rows)
             
             # Apply json safety
             safe_rows = []
@@ -46,43 +56,217 @@ def preview_query(connector: Dict, sql_text: str, params: Dict[str, Any] | None
             return {"ok": True, "rows": safe_rows, "columns": cols}
         else:
             # For non-select in preview, we use a custom block to rollback
-            with client.engine.connect() as conn:
+            with client.connect() as conn:
                 with conn.begin() as trans:
                     res = conn.execute(text(sql_text), params or {})
                     rowcount = res.rowcount
                     trans.rollback()
             return {"ok": True, "message": f"preview: would execute, rowcount={rowcount}"}
     except Exception as e:
-        return {"ok": False, "error": str(e)}
+        return (control and control.error()) or {"ok": False, "error": str(e)}
     finally:
         client.dispose()
 
-def run_query(connector: Dict, sql_text: str, params: Dict[str, Any] | None = None, max_rows: int = 100, is_proc: bool = False) -> Dict:
+def _typed_text(sql_text: str, param_types: Dict[str, Any] | None = None):
+    clause = text(sql_text)
+    if param_types:
+        typed = [bindparam(name, type_=t) for name, t in param_types.items() if name in clause._bindparams]
+        if typed:
+            clause = clause.bindparams(*typed)
+    return clause
+
+
+class PreparedQuery:
+    """SQL analysed once and reused for every execution.
+
+    Holds the statement kind, the text() clause (with declared bind-param types when given),
+    the pagination plan and, per dialect, the pre-built page statements. `unwrapped` is set once
+    the wrapped (keyset/offset) form failed where the SQL as written ran; it is then paged by scanning.
+    """
+
+    __slots__ = ("sql_text", "is_select", "statement", "pk", "page_plan", "unwrapped", "_param_types", "_page_statements")
+
+    def __init__(self, sql_text: str, param_types: Dict[str, Any] | None = None, pk: Sequence[str] = (),
+                 not_null: Sequence[str] = ()):
+        self.sql_text = sql_text
+        self.is_select = sql_text.strip().lower().startswith("select")
+        self.pk = tuple(pk or ())
+        self._param_types = dict(param_types or {})
+        self.statement = _typed_text(sql_text, self._param_types)
+        self.page_plan = pagination.plan_pagination(sql_text, self.pk, not_null=tuple(not_null)) if self.is_select else None
+        self.unwrapped = False
+        self._page_statements = {}
+
+    def page_statements(self, dialect_name: str):
+        """(first page, continuation) statements for a dialect, built on first use."""
+        stmts = self._page_statements.get(dialect_name)
+        if stmts is None:
+            inner = _typed_text(self.page_plan.inner_sql, self._param_types)
+            stmts = pagination.build_statements(self.page_plan, dialect_name, inner)
+            self._page_statements[dialect_name] = stmts
+        return stmts
+
+
+@lru_cache(maxsize=1024)
+def prepare_query(sql_text: str, pk: Tuple[str, ...] = ()) -> PreparedQuery:
+    """Untyped PreparedQuery shared by ad-hoc run_query calls with the same SQL."""
+    return PreparedQuery(sql_text, pk=pk)
+
+
+# SQLite and MySQL report some statements that can't compile as OperationalError
+_COMPILE_ERRORS = ("no such column", "ambiguous column", "syntax error", "unknown column")
+
+
+def _compile_error(e: Exception) -> bool:
+    """True if the statement was rejected as written (not a connection, timeout or data error)."""
+    if isinstance(e, ProgrammingError):
+        return True
+    return isinstance(e, OperationalError) and any(m in str(e.orig).lower() for m in _COMPILE_ERRORS)
+
+
+def _fetch_paged(client, prepared: PreparedQuery, params: Dict[str, Any] | None, limit: int, offset: int, cursor: str | None):
+    """Fetch one page, pushing LIMIT/OFFSET or a keyset predicate into the SQL where the plan allows."""
+    sql_text = prepared.sql_text
+    plan = prepared.page_plan
+    if prepared.unwrapped:
+        plan = pagination.plan_pagination(sql_text, prepared.pk, wrap=False)
+    after, start = None, offset
+    if cursor:
+        after, start = pagination.decode_cursor(plan, cursor)
+
+    if plan.mode == pagination.SCAN:
+        page = client.fetch_page_rows(prepared.statement, params, limit=limit, offset=start)
+    else:
+        first, nxt = prepared.page_statements(client.dialect_name)
+        # limit + 1 so fetch_page's probe row comes from the database, not from an extra scan
+        bind = dict(params or {})
+        bind.update(pagination.page_params(limit + 1, start, after))
+        try:
+            page = client.fetch_page_rows(first if after is None else nxt, bind, limit=limit)
+        except Exception as e:
+            if cursor or not _compile_error(e) or (client.control is not None and client.control.error()):
+                # transient, timed-out or cancelled statements say nothing about the wrapped form
+                raise
+            # e.g. ORDER BY on a column the outer query can't see; retry as written and remember
+            plan = pagination.plan_pagination(sql_text, prepared.pk, wrap=False)
+            page = client.fetch_page_rows(prepared.statement, params, limit=limit, offset=start)
+            prepared.unwrapped = True
+
+    columns, type_codes, rows, more = page
+    next_cursor = pagination.next_cursor(plan, dict(zip(columns, rows[-1])), start, len(rows)) if more and rows else None
+    return columns, type_codes, rows, more, next_cursor
+
+
+# Row converters take (columns, row tuples, cursor type codes) and return JSON-ready rows.
+rows_to_json = serializer.rows_as_dicts
+rows_to_lists = serializer.rows_as_lists
+
+
+def run_query(connector: Dict, sql_text: str, params: Dict[str, Any] | None = None, max_rows: int = 100, is_proc: bool = False,
+              offset: int = 0, cursor: str | None = None, pk: Sequence[str] | None = None, control: QueryControl | None = None) -> Dict:
     """Execute the SQL and return results. Used by runtime routes.
+    SELECTs return one page of `max_rows` rows starting at `offset`, or after the continuation
+    `cursor` returned as `next_cursor` by the previous page. `pk` (from schema discovery) is used
+    as the keyset when the SQL has no ORDER BY. `control` applies a statement timeout and lets
+    another thread cancel the execution.
     Rule 3: Ban direct cursor usage.
     """
     url = _get_url(connector)
     if not url:
         return {"ok": False, "error": "missing connector url"}
 
-    client = DatabaseClient(url)
+    client = get_client(connector)
     try:
-        if sql_text.strip().lower().startswith("select"):
-            rows = client.fetch_all(sql_text, params)
-            # Handle max_rows limit
-            more = len(rows) > max_rows
-            rows = rows[:max_rows]
-            
-            safe_rows = []
-            for r in rows:
-                safe_rows.append({k: _to_json_safe(v) for k, v in r.items()})
-            
-            cols = list(safe_rows[0].keys()) if safe_rows else []
-            return {"ok": True, "rows": safe_rows, "columns": cols, "more": more}
+        return run_prepared(client, prepare_query(sql_text, tuple(pk or ())), params, max_rows=max_rows, offset=offset, cursor=cursor,
+                            control=control)
+    finally:
+        client.dispose()
+
+
+def run_prepared(client, prepared: PreparedQuery, params: Dict[str, Any] | None = None, max_rows: int = 100,
+                 offset: int = 0, cursor: str | None = None, row_converter: Callable = rows_to_json,
+                 control: QueryControl | None = None) -> Dict:
+    """Body of run_query against an existing DatabaseClient (also used for compiled mapping plans)."""
+    client.control = control
+    try:
+        if prepared.is_select:
+            # Handle max_rows limit; fetch_page probes one extra row to compute `more`
+            cols, type_codes, rows, more, next_cursor = _fetch_paged(client, prepared, params, max_rows, offset, cursor)
+            return {"ok": True, "rows": row_converter(cols, rows, type_codes), "columns": cols, "more": more, "next_cursor": next_cursor}
         else:
-            rowcount = client.execute(sql_text, params)
+            rowcount = client.execute(prepared.statement, params)
             return {"ok": True, "message": f"executed, rowcount={rowcount}", "rowcount": rowcount}
+    except pagination.InvalidCursor as e:
+        return {"ok": False, "error": str(e), "error_status": 400}
     except Exception as e:
-        return {"ok": False, "error": str(e)}
-    finally:
+        # a timed-out or cancelled statement surfaces as a driver error; report it as such
+        return (control and control.error()) or {"ok": False, "error": str(e)}
+
+
+# stream format -> response media type
+STREAM_FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+def stream_query(connector: Dict, sql_text: str | Executable, params: Dict[str, Any] | None, fmt: str, chunk_size: int = 1000,
+                 max_rows: int | None = None, on_complete: Callable[[int, str | None], None] | None = None,
+                 control: QueryControl | None = None) -> Tuple[str, Iterator[bytes]]:
+    """Execute a SELECT and return (media_type, iterator of encoded chunks) for a streaming response.
+
+    The statement runs before this returns, so SQL errors surface as exceptions rather than a
+    truncated body. Rows are read through a server-side cursor `chunk_size` at a time and each
+    chunk is encoded to NDJSON or CSV as one piece. `on_complete(rows, error)` runs once the
+    stream ends or the client goes away. `control` applies to the connection for the whole
+    stream, so its timeout bounds the export and `cancel()` stops it between or during fetches.
+    """
+    if fmt not in STREAM_FORMATS:
+        raise ValueError(f"unsupported stream format: {fmt}")
+    url = _get_url(connector)
+    if not url:
+        raise ValueError("missing connector url")
+
+    client = get_client(connector)
+    client.control = control
+    chunks = client.stream_rows(sql_text, params, chunk_size=chunk_size)
+    try:
+        columns = next(chunks)
+    except Exception:
+        chunks.close()
         client.dispose()
+        raise
+
+    def encode() -> Iterator[bytes]:
+        count = 0
+        error = None
+        try:
+            if fmt == "csv":
+                buf = io.StringIO()
+                writer = csv.writer(buf)
+                writer.writerow(columns)
+                yield buf.getvalue().encode("utf-8")
+            for chunk in chunks:
+                if max_rows is not None:
+                    chunk = chunk[:max_rows - count]
+                if fmt == "csv":
+                    buf = io.StringIO()
+                    writer = csv.writer(buf)
+                    writer.writerows([["" if v is None else _to_json_safe(v) for v in row] for row in chunk])
+                    data = buf.getvalue().encode("utf-8")
+                else:
+                    data = b"".join(serializer.dumps(r) + b"\n" for r in serializer.rows_as_dicts(columns, chunk))
+                count += len(chunk)
+                if data:
+                    yield data
+                if max_rows is not None and count >= max_rows:
+                    break
+        except Exception as e:
+            error = ((control and control.error()) or {}).get("error") or str(e)
+            raise
+        finally:
+            chunks.close()
+            client.dispose()
+            if error is None and control is not None and control.cancelled:
+                error = control.error()["error"]
+            if on_complete:
+                on_complete(count, error)
+
+    return STREAM_FORMATS[fmt], encode()
@@ -0,0 +1,204 @@
+import os
+import json
+import time
+import queue
+import random
+import threading
+from datetime import datetime, timezone
+from typing import Iterator, List, Optional
+
+import metrics
+
+# fsync policy for group commits: "batch" fsyncs every commit, "interval" at most every
+# LOG_FSYNC_INTERVAL seconds, "never" leaves it to the OS.
+FSYNC_POLICY = os.environ.get("LOG_FSYNC", "batch").lower()
+FSYNC_INTERVAL = float(os.environ.get("LOG_FSYNC_INTERVAL", "1.0"))
+BATCH_SIZE = int(os.environ.get("LOG_BATCH_SIZE", "500"))
+FLUSH_INTERVAL = float(os.environ.get("LOG_FLUSH_INTERVAL", "0.2"))
+ROTATE_BYTES = int(os.environ.get("LOG_ROTATE_BYTES", str(64 * 1024 * 1024)))
+ROTATE_SECONDS = float(os.environ.get("LOG_ROTATE_SECONDS", "86400"))
+# fraction of successful request records kept; errors are always written
+SAMPLE_RATE = float(os.environ.get("LOG_SAMPLE_RATE", "1.0"))
+# retention: closed segments beyond this count / older than this many days are deleted (0 disables)
+RETENTION_SEGMENTS = int(os.environ.get("LOG_RETENTION_SEGMENTS", "50"))
+RETENTION_DAYS = float(os.environ.get("LOG_RETENTION_DAYS", "30"))
+
+SEGMENT_PREFIX = "requests-"
+SEGMENT_SUFFIX = ".jsonl"
+
+
+class LogWriter:
+    """
+    Append-only JSONL request log. Records are queued by `append` and written by one
+    background thread that group-commits whatever arrived within FLUSH_INTERVAL (up to
+    BATCH_SIZE records) with a single write + fsync. Segments rotate by size and age and
+    old ones are pruned according to the retention settings.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._queue: "queue.Queue" = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._file = None
+        self._segment_path = None
+        self._segment_opened = 0.0
+        self._last_fsync = 0.0
+        self._seq = 0
+
+    # --- producer side ---
+
+    def append(self, record: dict) -> bool:
+        """Queue a record. Returns False if it was dropped by sampling."""
+        if SAMPLE_RATE < 1.0 and record.get("status") != "error" and random.random() >= SAMPLE_RATE:
+            return False
+        self._ensure_thread()
+        self._queue.put(record)
+        return True
+
+    def flush(self, timeout: float = 5.0) -> None:
+        """Block until everything queued so far is written (and fsynced per policy)."""
+        if self._thread is None:
+            return
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait(timeout)
+
+    def close(self) -> None:
+        self.flush()
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def _ensure_thread(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="request-log-writer", daemon=True)
+                self._thread.start()
+
+    # --- writer thread ---
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            batch, waiters = [], []
+            deadline = time.monotonic() + FLUSH_INTERVAL
+            while True:
+                if isinstance(item, threading.Event):
+                    waiters.append(item)
+                    # a flush request ends the batch early
+                    break
+                batch.append(item)
+                if len(batch) >= BATCH_SIZE:
+                    break
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+            try:
+                if batch:
+                    self._commit(batch, force_fsync=bool(waiters))
+            except Exception:
+                # logging must never take the server down; the batch is lost
+                pass
+            for w in waiters:
+                w.set()
+
+    def _commit(self, batch: List[dict], force_fsync: bool = False) -> None:
+        data = "".join(json.dumps(r, ensure_ascii=False, default=str) + "\n" for r in batch).encode("utf-8")
+        with self._lock, metrics.timed_storage_write("logs"):
+            f = self._current_segment(len(data))
+            f.write(data)
+            f.flush()
+            now = time.monotonic()
+            if FSYNC_POLICY == "batch" or (FSYNC_POLICY == "interval" and (force_fsync or now - self._last_fsync >= FSYNC_INTERVAL)):
+                os.fsync(f.fileno())
+                self._last_fsync = now
+
+    def _current_segment(self, incoming: int):
+        now = time.monotonic()
+        if self._file is not None:
+            too_big = ROTATE_BYTES > 0 and self._file.tell() + incoming > ROTATE_BYTES and self._file.tell() > 0
+            too_old = ROTATE_SECONDS > 0 and now - self._segment_opened >= ROTATE_SECONDS
+            if too_big or too_old:
+                self._file.close()
+                self._file = None
+        if self._file is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self._seq += 1
+            stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+            name = f"{SEGMENT_PREFIX}{stamp}-{os.getpid()}-{self._seq:04d}{SEGMENT_SUFFIX}"
+            self._segment_path = os.path.join(self.directory, name)
+            self._file = open(self._segment_path, "ab")
+            self._segment_opened = now
+            self._apply_retention()
+        return self._file
+
+    def _closed_segments(self) -> List[str]:
+        """Segments no process writes to any more: this process's earlier ones, and other workers'
+        not written for ROTATE_SECONDS (their next write rotates to a new segment first)."""
+        own = f"-{os.getpid()}-"
+        cutoff = time.time() - ROTATE_SECONDS if ROTATE_SECONDS > 0 else None
+        closed = []
+        for p in self.segments():
+            if p == self._segment_path:
+                continue
+            if own not in os.path.basename(p)[len(SEGMENT_PREFIX):]:
+                try:
+                    if cutoff is None or os.path.getmtime(p) >= cutoff:
+                        continue
+                except OSError:
+                    continue
+            closed.append(p)
+        return closed
+
+    def _apply_retention(self) -> None:
+        closed = self._closed_segments()
+        doomed = set()
+        if RETENTION_SEGMENTS > 0 and len(closed) > RETENTION_SEGMENTS:
+            doomed.update(closed[:len(closed) - RETENTION_SEGMENTS])
+        if RETENTION_DAYS > 0:
+            cutoff = time.time() - RETENTION_DAYS * 86400
+            for p in closed:
+                try:
+                    if os.path.getmtime(p) < cutoff:
+                        doomed.add(p)
+                except OSError:
+                    continue
+        for p in doomed:
+            try:
+                os.remove(p)
+            except OSError:
+                continue
+
+    # --- readers ---
+
+    def segments(self) -> List[str]:
+        """Segment paths, oldest first (names sort chronologically)."""
+        if not os.path.isdir(self.directory):
+            return []
+        names = [n for n in os.listdir(self.directory) if n.startswith(SEGMENT_PREFIX) and n.endswith(SEGMENT_SUFFIX)]
+        return [os.path.join(self.directory, n) for n in sorted(names)]
+
+    def iter_records(self, newest_first: bool = False) -> Iterator[dict]:
+        self.flush()
+        paths = self.segments()
+        if newest_first:
+            paths = list(reversed(paths))
+        for path in paths:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    lines = f.readlines()
+            except OSError:
+                continue
+            if newest_first:
+                lines = reversed(lines)
+            for line in lines:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    # torn final line from a crash mid-write
+                    continue
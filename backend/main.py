@@ -1,26 +1,72 @@
 import os
 import sys
+import time
+import asyncio
+import threading
 import uuid
 import datetime
 import traceback
-from typing import List, Optional
+from contextlib import asynccontextmanager
+from typing import List, Optional, Tuple
 
 # Add the backend directory to sys.path to allow relative imports of local modules
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from fastapi import FastAPI, HTTPException, Depends, Request
-from fastapi.responses import JSONResponse, HTMLResponse
+from fastapi import FastAPI, HTTPException, Depends, Request, Response
+from fastapi.responses import JSONResponse, HTMLResponse, PlainTextResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
 
 import storage
 import dbtest
 import discover
 import exec_query
+import engine_registry
+import async_exec
+import plans
+import result_cache
+import single_flight
+import metrics
+import dispatcher
+import serializer
+import bulk
 import param_model
+import query_control
 
 
-app = FastAPI(title="DB API Admin")
+# compile the plans of deployed mappings in the background after start-up instead of on first hit
+PLAN_WARMUP = os.environ.get("PLAN_WARMUP", "true").lower() in ("1", "true", "yes")
+# seconds between checks of the metadata generation file; deploys made by other workers show up within this
+ROUTE_SYNC_INTERVAL = float(os.environ.get("ROUTE_SYNC_INTERVAL", "1.0"))
+
+
+async def _route_sync_loop():
+    while True:
+        await asyncio.sleep(ROUTE_SYNC_INTERVAL)
+        try:
+            if storage.metadata_generation()[1] != _synced_generation:
+                await async_exec.run_blocking(sync_deployed_routes)
+        except Exception:
+            continue
+
+
+@asynccontextmanager
+async def lifespan(app_instance: FastAPI):
+    if PLAN_WARMUP:
+        threading.Thread(target=plans.warm_up, name="plan-warmup", daemon=True).start()
+    sync_task = asyncio.create_task(_route_sync_loop()) if ROUTE_SYNC_INTERVAL > 0 else None
+    yield
+    if sync_task is not None:
+        sync_task.cancel()
+    # close pooled connections held by the per-connector engines
+    engine_registry.registry.dispose_all()
+    await async_exec.dispose_all()
+    # write out queued request logs
+    storage.close_logs()
+
+
+app = FastAPI(title="DB API Admin", lifespan=lifespan)
 
 # serve React frontend if built, else fallback
 # serve React frontend if built, else fallback
@@ -58,6 +104,13 @@ def get_guide():
 
 # runtime route registry (in-memory)
 _deployed_routes = {}
+# guards _deployed_routes / mapping_routes changes; _synced_generation is the metadata
+# generation signature this worker's route table was last reconciled with
+_sync_lock = threading.Lock()
+_synced_generation = None
+
+# all deployed mappings are served by this one route; mounted after the admin routes (see bottom of module)
+mapping_routes = dispatcher.MappingDispatcher()
 
 # maximum limit enforced for list-returning mappings
 MAX_LIMIT = 100
@@ -127,6 +180,8 @@ async def global_exception_handler(request: Request, exc: Exception):
 class ConnectorIn(BaseModel):
     name: str
     sqlalchemy_url: str
+    pool: dict | None = None
+    statement_timeout_ms: int | None = None
 
 
 class ConnectorOut(BaseModel):
@@ -162,17 +217,21 @@ class PreviewIn(BaseModel):
     sql_text: str
     params: dict | None = None
     max_rows: int | None = 10
+    timeout_ms: int | None = None
 
 
 @app.post("/admin/queries/preview")
-def preview_query(payload: PreviewIn, admin=Depends(require_admin)):
+async def preview_query(payload: PreviewIn, request: Request, admin=Depends(require_admin)):
     c = storage.get_connector_by_id(payload.connector_id)
     if not c:
         raise HTTPException(status_code=404, detail="connector not found")
 
-    res = exec_query.preview_query(c, payload.sql_text, payload.params or {}, max_rows=payload.max_rows or 10)
+    # the connector's statement timeout applies unless the request sets one; closing the request cancels
+    control = query_control.QueryControl(payload.timeout_ms or query_control.timeout_ms(connector=c))
+    res = await _unless_disconnected(request, async_exec.run_controlled(
+        control, exec_query.preview_query, c, payload.sql_text, payload.params or {}, max_rows=payload.max_rows or 10))
     if not res.get("ok"):
-        raise HTTPException(status_code=400, detail=res.get("error"))
+        raise HTTPException(status_code=res.get("error_status", 400), detail=res.get("error"))
     return res
 
 
@@ -192,6 +251,8 @@ class MappingIn(BaseModel):
     method: str
     params_json: list
     auth_required: bool = True
+    cache_ttl: int | None = None
+    statement_timeout_ms: int | None = None
 
 
 class MappingOut(BaseModel):
@@ -201,200 +262,452 @@ class MappingOut(BaseModel):
 @app.post("/admin/mappings", response_model=MappingOut, status_code=201)
 def add_mapping(payload: MappingIn, admin=Depends(require_admin)):
     try:
-        mid = storage.add_mapping_entry(payload.query_id, payload.connector_id, payload.path, payload.method, payload.params_json, payload.auth_required)
+        mid = storage.add_mapping_entry(payload.query_id, payload.connector_id, payload.path, payload.method, payload.params_json, payload.auth_required,
+                                         payload.cache_ttl, payload.statement_timeout_ms)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     return {"id": mid}
 
 
-@app.post("/admin/mappings/{mapping_id}/deploy")
-def deploy_mapping(mapping_id: str, admin=Depends(require_admin)):
-    # locate mapping
-    mappings = storage.read_mappings()
-    mapping = next((m for m in mappings if m.get("id") == mapping_id), None)
-    if not mapping:
-        raise HTTPException(status_code=404, detail="mapping not found")
+# `?stream=` values and the Accept media types that select them
+STREAM_ACCEPT = {"application/x-ndjson": "ndjson", "text/csv": "csv"}
 
-    # even if already marked deployed in storage, we ensure it's in the router
-    # but first remove any existing registration for this specific mapping path/method
-    path = mapping.get("path")
-    method = mapping.get("method", "GET").upper()
 
-    # remove matching route(s) from app.router to avoid duplicates or disabled stubs
-    new_routes = []
-    for r in app.router.routes:
+def _stream_format(request: Request, declared: set) -> str | None:
+    """Return the requested streaming format, if any. A mapping param named `stream` takes precedence."""
+    if "stream" not in declared:
+        fmt = request.query_params.get("stream")
+        if fmt:
+            if fmt not in exec_query.STREAM_FORMATS:
+                raise HTTPException(status_code=400, detail=f"stream must be one of {', '.join(exec_query.STREAM_FORMATS)}")
+            return fmt
+    accept = request.headers.get("accept", "")
+    for media_type, fmt in STREAM_ACCEPT.items():
+        if media_type in accept:
+            return fmt
+    return None
+
+
+def _compact_format(query_params, declared: set) -> bool:
+    """`?format=compact` returns `{columns, rows: [[...]]}` rows. A mapping param named `format` takes precedence."""
+    if "format" in declared:
+        return False
+    fmt = query_params.get("format")
+    if fmt and fmt not in ("compact", "objects"):
+        raise HTTPException(status_code=400, detail="format must be one of compact, objects")
+    return fmt == "compact"
+
+
+def _get_plan(mapping_id: str):
+    try:
+        plan = plans.get_plan(mapping_id)
+    except plans.PlanError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if plan is None:
+        raise HTTPException(status_code=410, detail="mapping undeployed")
+    return plan
+
+
+async def _request_data(plan, request: Request) -> dict:
+    """Raw mapping params from the request locations the mapping declares."""
+    try:
+        return await plan.extractor.from_request(request)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+async def _prepare_call(plan, data: dict, api_key_record):
+    """Validate params and enforce auth. `api_key_record` is an async callable returning the
+    caller's API key record (or None); it is only awaited for mappings that need it."""
+    # validate straight into the bind-param dict
+    if plan.validator is not None:
         try:
-            if getattr(r, "path", None) == path and method in getattr(r, "methods", set()):
-                continue
-        except Exception:
-            pass
-        new_routes.append(r)
-    app.router.routes = new_routes
+            validated = plan.validator.validate(data)
+        except param_model.ValidationError as e:
+            raise HTTPException(status_code=400, detail=param_model.error_details(e))
+    else:
+        # Fallback for params_json that failed to compile
+        validated = {k: v for k, v in data.items() if not (k == "stream" and k not in plan.declared)}
+
+    # auth enforcement
+    if plan.mapping.get("auth_required"):
+        rec = await api_key_record()
+        if not rec:
+            raise HTTPException(status_code=401, detail="missing or invalid api key")
+
+    # prepare params dict for SQL execution
+    params = {k: v for k, v in validated.items() if k not in plan.exclude}
+    return validated, params
 
-    # build pydantic model from params_json using param_model helper
-    params_json = mapping.get("params_json", [])
-    Model = None
+
+async def _wait_disconnect(receive) -> None:
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+async def _unless_disconnected(request: Request, awaitable):
+    """Await `awaitable` while watching the connection. If the client disconnects first, it is
+    cancelled (and with it the statement it runs, see async_exec.run_controlled) and 499 raised."""
+    task = asyncio.ensure_future(awaitable)
+    watcher = asyncio.ensure_future(_wait_disconnect(request.receive))
     try:
-        Model = param_model.build_params_model("ParamsModel_" + mapping_id, params_json)
-    except Exception:
-        Model = None
+        await asyncio.wait((task, watcher), return_when=asyncio.FIRST_COMPLETED)
+    except asyncio.CancelledError:
+        task.cancel()
+        raise
+    finally:
+        watcher.cancel()
+    if task.done():
+        return task.result()
+    task.cancel()
+    # let it unwind (statement cancel, logging) before answering
+    await asyncio.gather(task, return_exceptions=True)
+    raise HTTPException(status_code=499, detail="client disconnected")
+
+
+async def _execute_call(plan, validated, params: dict, method: str, compact: bool, headers) -> dict:
+    """Run a validated mapping call (cache, coalescing, metrics, logging) and return the response body."""
+    mapping_id = plan.mapping_id
+
+    # enforce max limit
+    limit = validated.get("limit", 100) or 100
+    if limit > MAX_LIMIT:
+        limit = MAX_LIMIT
+    offset = validated.get("offset", 0) or 0
+    cursor = validated.get("cursor")
+
+    start = time.perf_counter()
+    cache_key = cache_status = res = None
+    cancelled = False
+    if plan.cache_ttl and method == "GET":
+        cache_key = result_cache.make_key(mapping_id, params, limit, offset, cursor, "compact" if compact else "")
+        res = result_cache.cache.get(cache_key)
+        cache_status = "hit" if res is not None else "miss"
+        headers["X-Cache"] = cache_status.upper()
+    if res is None:
+        async def execute():
+            # taken before the query runs, so a write invalidating the tables meanwhile keeps `out` out of the cache
+            version = result_cache.cache.version(mapping_id, plan.connector.get("id"), plan.tables) if cache_key is not None else None
+            out = await async_exec.run_plan(plan, params, max_rows=limit, offset=offset, cursor=cursor, compact=compact)
+            if out.get("ok"):
+                if cache_key is not None:
+                    result_cache.cache.put(cache_key, out, plan.cache_ttl, mapping_id, plan.connector.get("id"), plan.tables, version)
+                elif not plan.is_select:
+                    result_cache.cache.invalidate_tables(plan.connector.get("id"), plan.tables)
+            return out
 
-def create_mapping_handler(mapping, Model):
-    mapping_id = mapping.get("id")
-    
-    async def handler(request: Request):
-        # gather params
-        data = {}
-        # path params
-        data.update(request.path_params)
-        # query params
-        for k, v in request.query_params.items():
-            if k not in data:
-                data[k] = v
-
-        # body
         try:
-            body = await request.json() if request.headers.get("content-type", "").startswith("application/json") else {}
-        except Exception:
-            body = {}
-        if isinstance(body, dict):
-            for k, v in body.items():
-                if k not in data:
-                    data[k] = v
-
-        # validate via model
-        if Model:
+            if plan.is_select and single_flight.ENABLED:
+                # identical concurrent reads share one execution
+                flight_key = cache_key or result_cache.make_key(mapping_id, params, limit, offset, cursor, "compact" if compact else "")
+                res = await single_flight.flights.do(flight_key, execute)
+            else:
+                res = await execute()
+        except asyncio.CancelledError:
+            # the client went away (see _unless_disconnected); log the call before unwinding
+            cancelled = True
+            res = {"ok": False, "error": "query cancelled: client disconnected"}
+    elapsed = time.perf_counter() - start
+    duration_ms = int(elapsed * 1000)
+    metrics.record_request(mapping_id, elapsed, len(res.get("rows") or ()), error=not res.get("ok"))
+
+    # log
+    rid = uuid.uuid4().hex
+    logrec = {
+        "request_id": rid,
+        "mapping_id": mapping_id,
+        "time": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "status": "cancelled" if cancelled else "ok" if res.get("ok") else "error",
+        "duration_ms": duration_ms,
+        "params": params,
+    }
+    if res.get("rows") is not None:
+        logrec["rows_count"] = len(res.get("rows"))
+    if cache_status:
+        logrec["cache"] = cache_status
+    if not res.get("ok"):
+        logrec["error"] = res.get("error")
+    storage.append_log(logrec)
+
+    if cancelled:
+        raise asyncio.CancelledError()
+    if not res.get("ok"):
+        raise HTTPException(status_code=res.get("error_status", 500), detail=res.get("error"))
+
+    return {"request_id": rid, "duration_ms": duration_ms, "result": res, "more": res.get("more", False),
+            "next_cursor": res.get("next_cursor")}
+
+
+def _api_key_lookup(key: str | None):
+    async def lookup():
+        return await async_exec.run_blocking(storage.validate_api_key, key)
+    return lookup
+
+
+def create_mapping_handler(mapping_id: str):
+    """Request handler for a deployed mapping; the per-request work comes from its compiled plan."""
+
+    async def handler(request: Request, response: Response):
+        plan = _get_plan(mapping_id)
+        bulk_fmt, request = await _bulk_format(plan, request)
+        if bulk_fmt:
+            return await _bulk_call(plan, request, bulk_fmt)
+        data = await _request_data(plan, request)
+        validated, params = await _prepare_call(plan, data, _api_key_lookup(request.headers.get("x-api-key")))
+
+        stream_fmt = _stream_format(request, plan.declared)
+        if stream_fmt:
+            return await async_exec.run_blocking(_stream_response, plan, params, stream_fmt,
+                                                 max_rows=validated.get("limit") if "limit" in data else None)
+
+        compact = _compact_format(request.query_params, plan.declared)
+        return await _unless_disconnected(request, _execute_call(plan, validated, params, request.method, compact, response.headers))
+
+    return handler
+
+
+async def _bulk_format(plan, request: Request) -> Tuple[str | None, Request]:
+    """Bulk body format for write requests: NDJSON or CSV by Content-Type, or a JSON body starting
+    with `[`. Returned with the request to read the body from (see _peek_body)."""
+    if request.method == "GET" or plan.is_select:
+        return None, request
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type in bulk.BULK_CONTENT_TYPES:
+        return bulk.BULK_CONTENT_TYPES[content_type], request
+    if content_type == "application/json":
+        first, request = await _peek_body(request)
+        return ("json" if first == b"[" else None), request
+    return None, request
+
+
+async def _peek_body(request: Request) -> Tuple[bytes, Request]:
+    """First non-whitespace byte of the body (b"" if empty), without reading or parsing the rest.
+
+    The body chunks read up to it are replayed by the returned Request, which reads the full body.
+    """
+    messages = []
+    first = b""
+    more = True
+    while more and not first:
+        message = await request.receive()
+        messages.append(message)
+        if message["type"] != "http.request":
+            break
+        more = message.get("more_body", False)
+        first = message.get("body", b"").lstrip()[:1]
+
+    async def receive():
+        return messages.pop(0) if messages else await request.receive()
+    return first, Request(request.scope, receive)
+
+
+async def _bulk_call(plan, request: Request, fmt: str):
+    """Load many rows through a write mapping: each record is validated like a single call's
+    params (path and query params act as shared defaults) and written in chunks in one transaction."""
+    mapping_id = plan.mapping_id
+    if plan.mapping.get("auth_required"):
+        if not await _api_key_lookup(request.headers.get("x-api-key"))():
+            raise HTTPException(status_code=401, detail="missing or invalid api key")
+
+    base = dict(request.query_params)
+    atomic = base.pop("atomic", "").lower() in ("1", "true", "yes") and "atomic" not in plan.declared
+    base.update(request.path_params)
+
+    start = time.perf_counter()
+    reader = bulk.BodyReader(request.stream(), asyncio.get_running_loop())
+    try:
+        report = await async_exec.run_blocking(bulk.load, plan, reader, fmt, base, atomic)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    elapsed = time.perf_counter() - start
+    if report["rows_written"]:
+        result_cache.cache.invalidate_tables(plan.connector.get("id"), plan.tables)
+    metrics.record_request(mapping_id, elapsed, report["rows_written"], error=not report["ok"])
+
+    rid = uuid.uuid4().hex
+    logrec = {
+        "request_id": rid,
+        "mapping_id": mapping_id,
+        "time": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "status": "ok" if report["ok"] else "error",
+        "duration_ms": int(elapsed * 1000),
+        "params": base,
+        "bulk": fmt,
+        "rows_count": report["rows_written"],
+    }
+    if not report["ok"]:
+        logrec["error"] = f"{report['chunks_failed']} of {len(report['chunks'])} chunks failed, {report['rows_invalid']} invalid rows"
+    storage.append_log(logrec)
+
+    # 207: some rows were written, other rows or chunks failed; 400: nothing was written
+    status = 200 if report["ok"] else (207 if report["rows_written"] else 400)
+    return serializer.JSONBytesResponse({"request_id": rid, "duration_ms": int(elapsed * 1000), "result": report}, status_code=status)
+
+
+# POST /api/_batch limits: calls per batch and how many run at once
+BATCH_MAX_CALLS = int(os.environ.get("BATCH_MAX_CALLS", "50"))
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", "8"))
+
+
+class BatchCall(BaseModel):
+    path: str
+    method: str = "GET"
+    params: dict = {}
+
+
+@app.post("/api/_batch")
+async def run_batch(calls: List[BatchCall], request: Request):
+    """Run several mapping calls in one request. The API key is checked once; results come back
+    in request order as {status, body} or {status, error}."""
+    if len(calls) > BATCH_MAX_CALLS:
+        raise HTTPException(status_code=400, detail=f"at most {BATCH_MAX_CALLS} calls per batch")
+
+    key = request.headers.get("x-api-key")
+    rec = await async_exec.run_blocking(storage.validate_api_key, key) if key else None
+    if key and not rec:
+        raise HTTPException(status_code=401, detail="missing or invalid api key")
+
+    async def api_key_record():
+        return rec
+
+    semaphore = asyncio.Semaphore(max(1, BATCH_CONCURRENCY))
+
+    async def run_one(call: BatchCall) -> dict:
+        async with semaphore:
+            method = call.method.upper()
+            headers = {}
             try:
-                validated = Model(**data)
+                endpoint, path_params = mapping_routes.resolve(call.path, method)
+                plan = _get_plan(endpoint.mapping_id)
+                try:
+                    data = plan.extractor.from_params(path_params, call.params)
+                except ValueError as e:
+                    raise HTTPException(status_code=400, detail=str(e))
+                validated, params = await _prepare_call(plan, data, api_key_record)
+                compact = _compact_format(call.params, plan.declared)
+                body = await _execute_call(plan, validated, params, method, compact, headers)
+            except HTTPException as e:
+                return {"status": e.status_code, "error": e.detail}
             except Exception as e:
-                raise HTTPException(status_code=400, detail=str(e))
-        else:
-            # Fallback for dynamic models that failed to build
-            validated = type("DynamicModel", (), data)()
-
-        # auth enforcement
-        if mapping.get("auth_required"):
-            key = request.headers.get("x-api-key") or request.headers.get("X-API-Key")
-            rec = storage.validate_api_key(key)
-            if not rec:
-                raise HTTPException(status_code=401, detail="missing or invalid api key")
-
-        # execute query
-        qid = mapping.get("query_id")
-        queries = storage.read_queries()
-        q = next((x for x in queries if x.get("id") == qid), None)
-        if not q:
-            raise HTTPException(status_code=500, detail="query missing")
-
-        connector = storage.get_connector_by_id(mapping.get("connector_id"))
-        if not connector:
-            raise HTTPException(status_code=500, detail="connector missing")
-
-        # prepare params dict for SQL execution
-        try:
-            params = validated.model_dump(exclude={"limit", "offset"})
-        except Exception:
-            params = {k: v for k, v in data.items() if k not in ("limit", "offset")}
+                return {"status": 500, "error": str(e)}
+            out = {"status": 200, "body": body}
+            if "X-Cache" in headers:
+                out["cache"] = headers["X-Cache"].lower()
+            return out
+
+    results = await _unless_disconnected(request, asyncio.gather(*(run_one(c) for c in calls)))
+    return serializer.JSONBytesResponse({"results": results})
 
-        # enforce max limit
-        limit = getattr(validated, "limit", 100) or 100
-        if limit > MAX_LIMIT:
-            limit = MAX_LIMIT
 
-        start = datetime.datetime.now()
-        res = exec_query.run_query(connector, q.get("sql_text"), params, max_rows=limit, is_proc=bool(q.get("is_proc")))
-        duration_ms = int((datetime.datetime.now() - start).total_seconds() * 1000)
+def _stream_response(plan, params, fmt, max_rows=None):
+    """Export a SELECT mapping as NDJSON/CSV without the MAX_LIMIT cap; logged when the stream ends."""
+    if not plan.is_select:
+        raise HTTPException(status_code=400, detail="streaming is only available for SELECT mappings")
+    mapping_id = plan.mapping_id
 
-        # log
-        rid = uuid.uuid4().hex
+    rid = uuid.uuid4().hex
+    start = time.perf_counter()
+
+    def on_complete(rows_count, error):
+        elapsed = time.perf_counter() - start
+        metrics.record_request(mapping_id, elapsed, rows_count, error=bool(error))
         logrec = {
             "request_id": rid,
             "mapping_id": mapping_id,
             "time": datetime.datetime.now(datetime.timezone.utc).isoformat(),
-            "status": "ok" if res.get("ok") else "error",
-            "duration_ms": duration_ms,
+            "status": "error" if error else "ok",
+            "duration_ms": int(elapsed * 1000),
             "params": params,
+            "stream": fmt,
+            "rows_count": rows_count,
         }
-        if res.get("rows") is not None:
-            logrec["rows_count"] = len(res.get("rows"))
-        if not res.get("ok"):
-            logrec["error"] = res.get("error")
-        storage.append_log(logrec)
+        if error:
+            logrec["error"] = error
+        try:
+            storage.append_log(logrec)
+        except Exception:
+            pass
+
+    control = query_control.QueryControl(plan.statement_timeout_ms)
+    try:
+        media_type, body = exec_query.stream_query(plan.connector, plan.prepared.statement, params, fmt, max_rows=max_rows,
+                                                   on_complete=on_complete, control=control)
+    except Exception as e:
+        failed = control.error() or {"error": str(e), "error_status": 500}
+        on_complete(0, failed["error"])
+        raise HTTPException(status_code=failed["error_status"], detail=failed["error"])
+    return StreamingResponse(_cancel_on_abort(body, control), media_type=media_type, headers={"X-Request-ID": rid})
 
-        if not res.get("ok"):
-            raise HTTPException(status_code=500, detail=res.get("error"))
 
-        return {"request_id": rid, "duration_ms": duration_ms, "result": res, "more": res.get("more", False)}
+async def _cancel_on_abort(body, control: query_control.QueryControl):
+    """Stream `body` from worker threads; if the response is abandoned (client gone), cancel the
+    query and close `body` (releasing its connection and logging the call) once no fetch is in flight."""
+    lock = threading.Lock()
 
-    return handler
+    def step():
+        with lock:
+            return next(body, None)
+
+    def close():
+        with lock:
+            body.close()
+
+    finished = False
+    try:
+        while True:
+            chunk = await run_in_threadpool(step)
+            if chunk is None:
+                break
+            yield chunk
+        finished = True
+    finally:
+        if not finished:
+            control.cancel()
+            threading.Thread(target=close, daemon=True).start()
 
 
 @app.post("/admin/mappings/{mapping_id}/deploy")
 def deploy_mapping(mapping_id: str, admin=Depends(require_admin)):
-    mappings = storage.read_mappings()
-    mapping = next((m for m in mappings if m.get("id") == mapping_id), None)
+    mapping = storage.get_mapping_by_id(mapping_id)
     if not mapping:
         raise HTTPException(status_code=404, detail="mapping not found")
 
     path = mapping.get("path")
     method = mapping.get("method", "GET").upper()
 
-    # remove existing
-    app.router.routes = [r for r in app.router.routes if not (getattr(r, "path", None) == path and method in getattr(r, "methods", set()))]
-
-    try:
-        Model = param_model.build_params_model("ParamsModel_" + mapping_id, mapping.get("params_json", []))
-    except Exception:
-        Model = None
+    with _sync_lock:
+        try:
+            plans.compile_plan(mapping)
+        except plans.PlanError as e:
+            raise HTTPException(status_code=400, detail=str(e))
 
-    handler = create_mapping_handler(mapping, Model)
-    app.add_api_route(path, handler, methods=[method])
-    storage.set_mapping_deployed(mapping_id, True)
-    _deployed_routes[mapping_id] = {"path": path, "method": method}
+        handler = create_mapping_handler(mapping_id)
+        mapping_routes.add(path, method, dispatcher.mapping_app(handler, mapping_id))
+        storage.set_mapping_deployed(mapping_id, True)
+        _deployed_routes[mapping_id] = {"path": path, "method": method}
 
     return {"id": mapping_id, "status": "deployed", "path": path, "method": method}
 
 @app.post("/admin/mappings/{mapping_id}/undeploy")
 def undeploy_mapping(mapping_id: str, admin=Depends(require_admin)):
     # find mapping
-    mappings = storage.read_mappings()
-    mapping = next((m for m in mappings if m.get("id") == mapping_id), None)
+    mapping = storage.get_mapping_by_id(mapping_id)
     if not mapping:
         raise HTTPException(status_code=404, detail="mapping not found")
 
-    # attempt to remove route from app.router
-    reg = _deployed_routes.get(mapping_id)
-    if reg:
-        path = reg.get("path")
-        method = reg.get("method")
-        # remove matching route(s)
-        new_routes = []
-        removed = False
-        for r in app.router.routes:
-            try:
-                if getattr(r, "path", None) == path and method in getattr(r, "methods", set()):
-                    removed = True
-                    continue
-            except Exception:
-                pass
-            new_routes.append(r)
-        if removed:
-            app.router.routes = new_routes
+    with _sync_lock:
+        # leave a tombstone so stale clients get 410 rather than 404
+        try:
+            mapping_routes.tombstone(mapping.get("path"), mapping.get("method", "GET"))
+        except ValueError:
+            pass
         _deployed_routes.pop(mapping_id, None)
+        plans.drop_plan(mapping_id)
 
-    # mark as undeployed in storage
-    storage.set_mapping_deployed(mapping_id, False)
-
-    # as a safety, register a disabled stub that returns 410 to avoid stale clients hitting old handlers
-    async def disabled_stub():
-        raise HTTPException(status_code=410, detail="mapping undeployed")
-
-    # register stub at same path+method so the path is intentionally unavailable
-    try:
-        app.add_api_route(mapping.get("path"), disabled_stub, methods=[mapping.get("method", "GET")])
-    except Exception:
-        # ignore if adding fails
-        pass
+        # mark as undeployed in storage
+        storage.set_mapping_deployed(mapping_id, False)
 
     return {"id": mapping_id, "status": "undeployed"}
 
@@ -409,33 +722,131 @@ def remove_mapping(mapping_id: str, admin=Depends(require_admin)):
     return {"status": "deleted", "id": mapping_id}
 
 
+class MappingCacheIn(BaseModel):
+    cache_ttl: int | None = None
+
+
+@app.put("/admin/mappings/{mapping_id}/cache")
+def set_mapping_cache(mapping_id: str, payload: MappingCacheIn, admin=Depends(require_admin)):
+    """Enable (cache_ttl seconds) or disable result caching for a GET mapping.
+
+    The cache is per worker process: a write mapping only invalidates the worker that ran it.
+    """
+    try:
+        mapping = storage.set_mapping_cache_ttl(mapping_id, payload.cache_ttl)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not mapping:
+        raise HTTPException(status_code=404, detail="mapping not found")
+    result_cache.cache.purge_mapping(mapping_id)
+    if mapping_id in _deployed_routes:
+        try:
+            plans.compile_plan(mapping)
+        except plans.PlanError as e:
+            raise HTTPException(status_code=500, detail=str(e))
+    return {"id": mapping_id, "cache_ttl": mapping.get("cache_ttl")}
+
+
+class MappingTimeoutIn(BaseModel):
+    statement_timeout_ms: int | None = None
+
+
+@app.put("/admin/mappings/{mapping_id}/timeout")
+def set_mapping_timeout(mapping_id: str, payload: MappingTimeoutIn, admin=Depends(require_admin)):
+    """Set a mapping's statement timeout in milliseconds (null/0: the connector's, then STATEMENT_TIMEOUT_MS)."""
+    try:
+        mapping = storage.set_mapping_statement_timeout(mapping_id, payload.statement_timeout_ms)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not mapping:
+        raise HTTPException(status_code=404, detail="mapping not found")
+    if mapping_id in _deployed_routes:
+        try:
+            plans.compile_plan(mapping)
+        except plans.PlanError as e:
+            raise HTTPException(status_code=500, detail=str(e))
+    return {"id": mapping_id, "statement_timeout_ms": mapping.get("statement_timeout_ms")}
+
+
+@app.get("/admin/cache")
+def cache_stats(admin=Depends(require_admin)):
+    return {**result_cache.cache.stats(), "single_flight": single_flight.flights.stats()}
+
+
+@app.delete("/admin/cache")
+def purge_cache(mapping_id: Optional[str] = None, connector_id: Optional[str] = None, admin=Depends(require_admin)):
+    """Purge cached results: everything, or only one mapping's / connector's entries (in this worker process)."""
+    if mapping_id:
+        purged = result_cache.cache.purge_mapping(mapping_id)
+    elif connector_id:
+        purged = result_cache.cache.purge_connector(connector_id)
+    else:
+        purged = result_cache.cache.purge_all()
+    return {"purged": purged}
+
+
+@app.get("/admin/metrics")
+def get_metrics(request: Request, format: Optional[str] = None, admin=Depends(require_admin)):
+    """Process metrics in Prometheus text format, or JSON with ?format=json / Accept: application/json."""
+    if format == "json" or (format is None and "application/json" in request.headers.get("accept", "")):
+        return metrics.snapshot()
+    return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
 @app.get("/admin/logs/{request_id}")
 def get_log(request_id: str, admin=Depends(require_admin)):
-    logs = storage.read_logs()
-    rec = next((l for l in logs if l.get("request_id") == request_id), None)
+    rec = storage.find_log(request_id)
     if not rec:
         raise HTTPException(status_code=404, detail="log not found")
     return rec
 
 
 def register_deployed_routes(app_instance: FastAPI):
-    mappings = storage.get_deployed_mappings()
-    for mapping in mappings:
-        mid = mapping.get("id")
-        if mid in _deployed_routes:
-            continue
+    """Mount the mapping dispatcher and register every deployed mapping (see sync_deployed_routes)."""
+    if mapping_routes not in app_instance.router.routes:
+        app_instance.router.routes.append(mapping_routes)
+    sync_deployed_routes()
 
-        try:
-            Model = param_model.build_params_model("ParamsModel_" + mid, mapping.get("params_json", []))
-        except Exception:
-            Model = None
 
-        handler = create_mapping_handler(mapping, Model)
-        try:
-            app_instance.add_api_route(mapping.get("path"), handler, methods=[mapping.get("method", "GET")])
-            _deployed_routes[mid] = {"path": mapping.get("path"), "method": mapping.get("method", "GET")}
-        except Exception:
-            continue
+def sync_deployed_routes() -> None:
+    """Reconcile this worker's route table with storage: register newly deployed mappings,
+    tombstone undeployed or moved ones and send edited mappings back to lazy compilation.
+
+    Routes come from the routes manifest. Plans are not built here: each is compiled on its
+    mapping's first request or by the background warm-up (see lifespan). Runs at import and
+    whenever the metadata generation changes, so deploys made on other workers converge
+    within ROUTE_SYNC_INTERVAL.
+    """
+    global _synced_generation
+    with _sync_lock:
+        generation = storage.metadata_generation()[1]
+        storage.expire_metadata_cache()
+        desired = {mid: {"path": path, "method": method.upper()} for mid, path, method in storage.get_deployed_routes()}
+
+        for mid, route in list(_deployed_routes.items()):
+            if desired.get(mid) != route:
+                try:
+                    mapping_routes.tombstone(route["path"], route["method"])
+                except ValueError:
+                    pass
+                _deployed_routes.pop(mid, None)
+                plans.drop_plan(mid)
+            else:
+                plans.refresh(mid)
+
+        entries = []
+        for mid, route in desired.items():
+            if mid in _deployed_routes:
+                continue
+            entries.append((route["path"], route["method"], dispatcher.mapping_app(create_mapping_handler(mid), mid)))
+            _deployed_routes[mid] = route
+            plans.register_lazy(mid)
+        rejected = set(mapping_routes.add_many(entries))
+        for mid, route in list(_deployed_routes.items()):
+            if (route["path"], route["method"]) in rejected:
+                _deployed_routes.pop(mid, None)
+                plans.drop_plan(mid)
+        _synced_generation = generation
 
 
 @app.get("/admin/mappings")
@@ -448,6 +859,9 @@ def list_registered_routes(admin=Depends(require_admin)):
     """Return a list of currently registered routes (path and methods) for debugging."""
     out = []
     for r in app.router.routes:
+        if r is mapping_routes:
+            out.extend(mapping_routes.routes())
+            continue
         try:
             path = getattr(r, "path", None)
             methods = sorted([m for m in getattr(r, "methods", []) if m not in ("HEAD", "OPTIONS")])
@@ -487,7 +901,7 @@ def list_queries(admin=Depends(require_admin)):
 @app.post("/admin/connectors", response_model=ConnectorOut, status_code=201)
 def add_connector(payload: ConnectorIn, admin=Depends(require_admin)):
     try:
-        new_id = storage.add_connector_entry(payload.name, payload.sqlalchemy_url)
+        new_id = storage.add_connector_entry(payload.name, payload.sqlalchemy_url, payload.pool, payload.statement_timeout_ms)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     return {"id": new_id, "status": "created"}
@@ -504,7 +918,7 @@ def test_connector(connector_id: str, admin=Depends(require_admin)):
     if not c:
         raise HTTPException(status_code=404, detail="connector not found")
 
-    result = dbtest.test_connection(c.get("sqlalchemy_url"))
+    result = dbtest.test_connection(c)
     if result.get("ok"):
         return TestResult(ok=True, latency_ms=result.get("latency_ms"))
     else:
@@ -514,11 +928,16 @@ def test_connector(connector_id: str, admin=Depends(require_admin)):
 class ConnectorUpdate(BaseModel):
     name: str | None = None
     sqlalchemy_url: str | None = None
+    pool: dict | None = None
+    statement_timeout_ms: int | None = None
 
 
 @app.put("/admin/connectors/{connector_id}")
 def edit_connector(connector_id: str, payload: ConnectorUpdate, admin=Depends(require_admin)):
-    updated = storage.update_connector(connector_id, payload.name, payload.sqlalchemy_url)
+    try:
+        updated = storage.update_connector(connector_id, payload.name, payload.sqlalchemy_url, payload.pool, payload.statement_timeout_ms)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     if not updated:
         raise HTTPException(status_code=404, detail="connector not found")
     return updated
@@ -533,13 +952,22 @@ def remove_connector(connector_id: str, admin=Depends(require_admin)):
 
 
 @app.post("/admin/connectors/{connector_id}/discover")
-def discover_connector(connector_id: str, sample: int = 5, admin=Depends(require_admin)):
+def discover_connector(connector_id: str, sample: int = 5, background: bool = False, refresh: bool = False,
+                       admin=Depends(require_admin)):
+    """Discover tables. Unchanged tables are reused from the last snapshot unless `refresh`;
+    with `background` a job is started and returned (202) for polling via /admin/discover-jobs/{id}."""
     c = storage.get_connector_by_id(connector_id)
     if not c:
         raise HTTPException(status_code=404, detail="connector not found")
+    previous = None if refresh else storage.get_latest_schema_snapshot(connector_id)
+
+    if background:
+        job = discover.start_job(c, sample_rows=sample, previous=previous,
+                                 on_complete=lambda snapshot: storage.write_schema_snapshot(connector_id, snapshot))
+        return JSONResponse(job, status_code=202)
 
     try:
-        snapshot = discover.discover_schema(c.get("sqlalchemy_url"), sample_rows=sample)
+        snapshot = discover.discover_schema(c, sample_rows=sample, previous=previous)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -548,6 +976,17 @@ def discover_connector(connector_id: str, sample: int = 5, admin=Depends(require
     return {"connector_id": connector_id, "tables": snapshot.get("tables", {}), "snapshot_id": record.get("id")}
 
 
+@app.get("/admin/discover-jobs/{job_id}")
+def get_discover_job(job_id: str, admin=Depends(require_admin)):
+    job = discover.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="job not found")
+    record = job.pop("record", None)
+    if record:
+        job["snapshot_id"] = record.get("id")
+    return job
+
+
 @app.get("/admin/connectors/{connector_id}/schema/{table}")
 def get_table_schema(connector_id: str, table: str, sample: int = 10, admin=Depends(require_admin)):
     # enforce max cap
@@ -560,7 +999,7 @@ def get_table_schema(connector_id: str, table: str, sample: int = 10, admin=Depe
         raise HTTPException(status_code=404, detail="connector not found")
 
     try:
-        info = discover.get_table_info(c.get("sqlalchemy_url"), table, sample_rows=sample)
+        info = discover.get_table_info(c, table, sample_rows=sample)
     except RuntimeError as e:
         raise HTTPException(status_code=500, detail=str(e))
     except Exception as e:
@@ -586,5 +1025,18 @@ def create_api_key(payload: ApiKeyIn, admin=Depends(require_admin)):
         raise HTTPException(status_code=400, detail=str(e))
     return {"token": token}
 
+
+@app.get("/admin/api-keys")
+def list_api_keys(admin=Depends(require_admin)):
+    return storage.list_api_keys()
+
+
+@app.delete("/admin/api-keys/{key_id}")
+def revoke_api_key(key_id: str, admin=Depends(require_admin)):
+    ok = storage.revoke_api_key(key_id)
+    if not ok:
+        raise HTTPException(status_code=404, detail="api key not found")
+    return {"status": "revoked", "id": key_id}
+
 # Startup logic: Register already deployed routes from storage
 register_deployed_routes(app)
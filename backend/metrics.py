@@ -0,0 +1,181 @@
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Tuple
+
+# Latency bucket upper bounds in seconds (Prometheus `le` labels).
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+PREFIX = "dbapi_"
+
+# Recording is a bisect plus a few integer increments with no locking: this runs on every request,
+# and a lost increment when two offload threads race on the same histogram is an acceptable error.
+
+
+class Histogram:
+    """Fixed-bucket histogram; quantiles are interpolated within the bucket that holds them."""
+
+    __slots__ = ("bounds", "counts", "count", "sum")
+
+    def __init__(self, bounds: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                lo = self.bounds[i - 1] if i > 0 else 0.0
+                hi = self.bounds[i] if i < len(self.bounds) else self.bounds[-1]
+                return lo + (hi - lo) * ((rank - seen) / n)
+            seen += n
+        return self.bounds[-1]
+
+    def summary(self, scale: float = 1000.0) -> Dict[str, float]:
+        """count/sum plus p50/p95/p99, scaled (default: seconds -> milliseconds)."""
+        return {
+            "count": self.count,
+            "sum": round(self.sum * scale, 3),
+            "p50": round(self.quantile(0.50) * scale, 3),
+            "p95": round(self.quantile(0.95) * scale, 3),
+            "p99": round(self.quantile(0.99) * scale, 3),
+        }
+
+
+class MappingMetrics:
+    __slots__ = ("requests", "errors", "rows", "latency")
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.rows = 0
+        self.latency = Histogram()
+
+
+_mappings: Dict[str, MappingMetrics] = {}
+_pool_wait: Dict[str, Histogram] = {}
+_storage_writes: Dict[str, Histogram] = {}
+# name -> (callable returning {metric: value} or {label_value: {metric: value}}, label name); evaluated at scrape time
+_collectors: Dict[str, Tuple[Callable[[], dict], str]] = {}
+
+
+def record_request(mapping_id: str, seconds: float, rows: int = 0, error: bool = False) -> None:
+    m = _mappings.get(mapping_id)
+    if m is None:
+        m = _mappings.setdefault(mapping_id, MappingMetrics())
+    m.requests += 1
+    if error:
+        m.errors += 1
+    m.rows += rows
+    m.latency.observe(seconds)
+
+
+def _histogram(table: Dict[str, Histogram], key: str) -> Histogram:
+    h = table.get(key)
+    if h is None:
+        h = table.setdefault(key, Histogram())
+    return h
+
+
+def pool_timer(connector_id: str) -> Callable[[float], None]:
+    """Observer for time spent waiting on the connector's pool for a connection."""
+    return _histogram(_pool_wait, connector_id).observe
+
+
+def record_storage_write(name: str, seconds: float) -> None:
+    _histogram(_storage_writes, name).observe(seconds)
+
+
+class timed_storage_write:
+    """Context manager timing a metadata file write."""
+
+    __slots__ = ("name", "start")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record_storage_write(self.name, time.perf_counter() - self.start)
+        return False
+
+
+def register_collector(name: str, fn: Callable[[], dict], label: str = "key") -> None:
+    """Add gauges computed at scrape time (cache stats, pool occupancy, ...)."""
+    _collectors[name] = (fn, label)
+
+
+def _collect() -> Dict[str, dict]:
+    out = {}
+    for name, (fn, _) in list(_collectors.items()):
+        try:
+            out[name] = fn()
+        except Exception:
+            continue
+    return out
+
+
+def snapshot() -> dict:
+    """All metrics as JSON; latencies in milliseconds."""
+    return {
+        "mappings": {
+            mid: {"requests": m.requests, "errors": m.errors, "rows": m.rows, "latency_ms": m.latency.summary()}
+            for mid, m in list(_mappings.items())
+        },
+        "pool_wait_ms": {cid: h.summary() for cid, h in list(_pool_wait.items())},
+        "storage_write_ms": {name: h.summary() for name, h in list(_storage_writes.items())},
+        **_collect(),
+    }
+
+
+def _label(v) -> str:
+    return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _histogram_lines(name: str, label: str, table: Dict[str, Histogram]) -> List[str]:
+    lines = [f"# TYPE {name} histogram"]
+    for key, h in list(table.items()):
+        lbl = f'{label}="{_label(key)}"'
+        cumulative = 0
+        for bound, n in zip(h.bounds, h.counts):
+            cumulative += n
+            lines.append(f'{name}_bucket{{{lbl},le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{lbl},le="+Inf"}} {h.count}')
+        lines.append(f"{name}_sum{{{lbl}}} {h.sum}")
+        lines.append(f"{name}_count{{{lbl}}} {h.count}")
+    return lines
+
+
+def render_prometheus() -> str:
+    lines = []
+    mappings = list(_mappings.items())
+    for metric, attr in (("mapping_requests_total", "requests"), ("mapping_errors_total", "errors"), ("mapping_rows_total", "rows")):
+        lines.append(f"# TYPE {PREFIX}{metric} counter")
+        lines.extend(f'{PREFIX}{metric}{{mapping="{_label(mid)}"}} {getattr(m, attr)}' for mid, m in mappings)
+    lines.extend(_histogram_lines(f"{PREFIX}mapping_latency_seconds", "mapping", {mid: m.latency for mid, m in mappings}))
+    lines.extend(_histogram_lines(f"{PREFIX}pool_wait_seconds", "connector", _pool_wait))
+    lines.extend(_histogram_lines(f"{PREFIX}storage_write_seconds", "file", _storage_writes))
+
+    # collector values: flat {metric: n} become gauges, nested {label: {metric: n}} get a label
+    for name, values in _collect().items():
+        label = _collectors[name][1]
+        for key, value in values.items():
+            if isinstance(value, dict):
+                for metric, n in value.items():
+                    if isinstance(n, (int, float)) and not isinstance(n, bool):
+                        lines.append(f'{PREFIX}{name}_{metric}{{{label}="{_label(key)}"}} {n}')
+            elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                lines.append(f"{PREFIX}{name}_{key} {value}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,330 @@
+import re
+import json
+import base64
+import hashlib
+import datetime
+from decimal import Decimal
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+from sqlalchemy import Integer, text, select, literal_column, column, bindparam, and_, or_
+from sqlalchemy.sql.elements import quoted_name
+
+# Pagination is pushed down by wrapping the mapping SQL as a subquery:
+#   keyset - a unique, non-null sort key (the table PK, possibly after plain ORDER BY columns);
+#            continuation tokens carry the last row's key
+#   offset - any other plain-column ORDER BY, or none; LIMIT/OFFSET is applied to the wrapped query
+#   scan   - SQL that can't be wrapped safely (own LIMIT/TOP, expression ORDER BY, ...); rows are skipped on the cursor
+KEYSET = "keyset"
+OFFSET = "offset"
+SCAN = "scan"
+
+_IDENT = r'(?:"[^"]+"|\[[^\]]+\]|`[^`]+`|[A-Za-z_][A-Za-z0-9_$]*)'
+_ORDER_ITEM_RE = re.compile(r'^\s*(?:' + _IDENT + r'\s*\.\s*)*(' + _IDENT + r')\s*(ASC|DESC)?\s*$', re.IGNORECASE)
+_FROM_TABLE_RE = re.compile(r'\bFROM\s+(?:' + _IDENT + r'\s*\.\s*)?(' + _IDENT + r')', re.IGNORECASE)
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class PagePlan:
+    """How a SELECT is paginated. Built once per (sql, pk) and shared between requests."""
+
+    __slots__ = ("mode", "inner_sql", "keys", "signature")
+
+    def __init__(self, mode: str, inner_sql: str, keys: Tuple[Tuple[str, bool, bool], ...] = ()):
+        self.mode = mode
+        self.inner_sql = inner_sql
+        # (column name, was quoted, descending): the keyset, or the ORDER BY kept for offset paging
+        self.keys = keys
+        self.signature = hashlib.sha1((mode + "|" + inner_sql + "|" + repr(keys)).encode("utf-8")).hexdigest()[:12]
+
+
+def _top_level_tokens(sql: str):
+    """Yield (position, upper-cased word) for words outside parentheses, quotes and comments."""
+    depth = 0
+    i = 0
+    n = len(sql)
+    while i < n:
+        ch = sql[i]
+        if ch in ("'", '"', "`", "["):
+            close = "]" if ch == "[" else ch
+            j = sql.find(close, i + 1)
+            i = n if j == -1 else j + 1
+            continue
+        if sql.startswith("--", i):
+            j = sql.find("\n", i)
+            i = n if j == -1 else j + 1
+            continue
+        if sql.startswith("/*", i):
+            j = sql.find("*/", i + 2)
+            i = n if j == -1 else j + 2
+            continue
+        if ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+        elif ch == "," and depth == 0:
+            yield i, ","
+        elif ch.isalpha() or ch == "_":
+            j = i
+            while j < n and (sql[j].isalnum() or sql[j] in "_$"):
+                j += 1
+            if depth == 0:
+                yield i, sql[i:j].upper()
+            i = j
+            continue
+        i += 1
+
+
+def _split_order_by(sql: str) -> Tuple[str, Optional[str], set]:
+    """Split off a trailing top-level ORDER BY. Returns (sql without it, order clause or None, top-level words)."""
+    words = set()
+    order_pos = None
+    tokens = list(_top_level_tokens(sql))
+    for idx, (pos, word) in enumerate(tokens):
+        words.add(word)
+        if word == "ORDER" and idx + 1 < len(tokens) and tokens[idx + 1][1] == "BY":
+            order_pos = pos
+    if order_pos is None:
+        return sql, None, words
+    return sql[:order_pos].rstrip(), sql[order_pos:].split(None, 2)[2], words
+
+
+def _split_commas(clause: str) -> List[str]:
+    parts, start = [], 0
+    for pos, word in _top_level_tokens(clause):
+        if word == ",":
+            parts.append(clause[start:pos])
+            start = pos + 1
+    parts.append(clause[start:])
+    return parts
+
+
+def _parse_key(item: str) -> Optional[Tuple[str, bool, bool]]:
+    m = _ORDER_ITEM_RE.match(item)
+    if not m:
+        return None
+    ident = m.group(1)
+    quoted = ident[0] in '"[`'
+    name = ident[1:-1] if quoted else ident
+    return name, quoted, (m.group(2) or "").upper() == "DESC"
+
+
+def _single_table(sql_text: str, snapshot: Optional[Dict]) -> Optional[Tuple[Dict, str]]:
+    """(snapshot table entry, select list) for a simple SELECT reading one discovered table, else None.
+
+    Simple means no joins, grouping, DISTINCT or set operations, so its columns come out as-is.
+    """
+    if not snapshot:
+        return None
+    tokens = list(_top_level_tokens(sql_text))
+    words = {w for _, w in tokens}
+    if words & {"JOIN", "GROUP", "DISTINCT", "UNION", "INTERSECT", "EXCEPT"}:
+        return None
+    from_idx = next((i for i, (_, w) in enumerate(tokens) if w == "FROM"), None)
+    if from_idx is None:
+        return None
+    for _, w in tokens[from_idx + 1:]:
+        if w in ("WHERE", "ORDER", "HAVING", "LIMIT"):
+            break
+        if w == ",":
+            # comma join
+            return None
+    m = _FROM_TABLE_RE.match(sql_text, tokens[from_idx][0])
+    if not m:
+        return None
+    ident = m.group(1)
+    name = ident[1:-1] if ident[0] in '"[`' else ident
+    tables = snapshot.get("tables", {})
+    info = tables.get(name) or next((v for k, v in tables.items() if k.lower() == name.lower()), None)
+    if not info:
+        return None
+    return info, re.split(r"\bFROM\b", sql_text, maxsplit=1, flags=re.IGNORECASE)[0]
+
+
+def _selected(col: str, select_list: str) -> bool:
+    return re.search(r"(^|[\s,.])\*", select_list) is not None or \
+        re.search(r"\b" + re.escape(col) + r"\b", select_list, re.IGNORECASE) is not None
+
+
+def pk_for_query(sql_text: str, snapshot: Optional[Dict]) -> List[str]:
+    """Return the discovered primary key of the single table a simple SELECT reads from, if any.
+
+    Only used when the PK columns are selected as-is, i.e. the query has no joins, grouping,
+    DISTINCT or set operations and either selects * or names every PK column.
+    """
+    found = _single_table(sql_text, snapshot)
+    if found is None:
+        return []
+    info, select_list = found
+    pk = list(info.get("pk") or [])
+    if not all(_selected(col, select_list) for col in pk):
+        return []
+    return pk
+
+
+def not_null_for_query(sql_text: str, snapshot: Optional[Dict]) -> List[str]:
+    """Columns of the single table a simple SELECT reads from that discovery reported as NOT NULL."""
+    found = _single_table(sql_text, snapshot)
+    if found is None:
+        return []
+    info, _ = found
+    return [c["name"] for c in info.get("columns") or () if c.get("name") and c.get("nullable") is False]
+
+
+@lru_cache(maxsize=1024)
+def plan_pagination(sql_text: str, pk: Tuple[str, ...] = (), wrap: bool = True, not_null: Tuple[str, ...] = ()) -> PagePlan:
+    """Pick the pagination mode for a SELECT. `wrap=False` forces the cursor-skipping scan mode.
+
+    Keyset paging needs a key that is unique and never NULL, or rows tying (or NULL) at a page
+    edge would be skipped: it is only used when the selected `pk` completes the ORDER BY and
+    every other sort column is listed in `not_null`. Other orders page by OFFSET.
+    """
+    sql = sql_text.strip().rstrip(";").rstrip()
+    if not wrap:
+        return PagePlan(SCAN, sql)
+    inner, order_clause, words = _split_order_by(sql)
+
+    if words & {"LIMIT", "OFFSET", "FETCH", "TOP", "UNION", "INTERSECT", "EXCEPT"}:
+        return PagePlan(SCAN, sql)
+
+    if order_clause is None:
+        if pk:
+            return PagePlan(KEYSET, inner, tuple((c, False, False) for c in pk))
+        return PagePlan(OFFSET, inner)
+
+    keys = [_parse_key(item) for item in _split_commas(order_clause)]
+    if any(k is None for k in keys):
+        return PagePlan(SCAN, sql)
+    if not pk:
+        return PagePlan(OFFSET, inner, tuple(keys))
+    names = {k[0].lower() for k in keys}
+    safe = {c.lower() for c in pk} | {c.lower() for c in not_null}
+    if not names <= safe:
+        # a nullable sort column: `col > :k` would drop rows with NULLs at or after the page edge
+        return PagePlan(OFFSET, inner, tuple(keys))
+    # PK columns act as a tie-breaker so keys are unique and no row is skipped between pages
+    desc = keys[-1][2]
+    unique_keys = list(keys)
+    for c in pk:
+        if c.lower() not in names:
+            unique_keys.append((c, False, desc))
+    return PagePlan(KEYSET, inner, tuple(unique_keys))
+
+
+def _key_column(name: str, quoted: bool):
+    return column(quoted_name(name, True)) if quoted else literal_column(name)
+
+
+def build_statements(plan: PagePlan, dialect_name: str, inner_clause=None):
+    """Build the page statements once; everything that varies per request is a bind param.
+
+    LIMIT/OFFSET bind as `_pg_limit`/`_pg_offset` and the previous page's last key values as
+    `_pg_k<i>` (see page_params). `inner_clause` may be a pre-typed text() of plan.inner_sql.
+    Returns (first page statement, continuation statement or None).
+    """
+    inner = (inner_clause if inner_clause is not None else text(plan.inner_sql)).columns().subquery("_page")
+    base = select(literal_column("*")).select_from(inner)
+    nxt = None
+    order = [_key_column(n, q).desc() if d else _key_column(n, q) for n, q, d in plan.keys]
+
+    if plan.mode == KEYSET:
+        clauses = []
+        for i, (name, quoted, desc) in enumerate(plan.keys):
+            col = _key_column(name, quoted)
+            cmp = col < bindparam(f"_pg_k{i}") if desc else col > bindparam(f"_pg_k{i}")
+            eqs = [_key_column(n, q) == bindparam(f"_pg_k{j}") for j, (n, q, _) in enumerate(plan.keys[:i])]
+            clauses.append(and_(*eqs, cmp) if eqs else cmp)
+        first = base.order_by(*order)
+        nxt = base.where(or_(*clauses)).order_by(*order)
+    elif order:
+        # the query's own ORDER BY, re-applied outside the wrapper
+        first = base.order_by(*order)
+    elif dialect_name == "mssql":
+        # OFFSET/FETCH needs an ORDER BY on SQL Server
+        first = base.order_by(text("(SELECT NULL)"))
+    else:
+        first = base
+
+    limit = bindparam("_pg_limit", type_=Integer)
+    offset = bindparam("_pg_offset", type_=Integer)
+    first = first.limit(limit).offset(offset)
+    if nxt is not None:
+        nxt = nxt.limit(limit).offset(offset)
+    return first, nxt
+
+
+def page_params(limit: int, offset: int = 0, after: Optional[list] = None) -> Dict[str, Any]:
+    """Bind values for a statement from build_statements."""
+    values = {"_pg_limit": limit, "_pg_offset": offset}
+    for i, v in enumerate(after or ()):
+        values[f"_pg_k{i}"] = v
+    return values
+
+
+def _encode_value(v: Any):
+    if isinstance(v, datetime.datetime):
+        return {"dt": v.isoformat()}
+    if isinstance(v, datetime.date):
+        return {"d": v.isoformat()}
+    if isinstance(v, Decimal):
+        return {"dec": str(v)}
+    if v is None or isinstance(v, (int, float, bool, str)):
+        return v
+    return str(v)
+
+
+def _decode_value(v: Any):
+    if isinstance(v, dict):
+        if "dt" in v:
+            return datetime.datetime.fromisoformat(v["dt"])
+        if "d" in v:
+            return datetime.date.fromisoformat(v["d"])
+        if "dec" in v:
+            return Decimal(v["dec"])
+    return v
+
+
+def _row_value(row: Dict[str, Any], name: str):
+    if name in row:
+        return row[name]
+    lname = name.lower()
+    for k, v in row.items():
+        if k.lower() == lname:
+            return v
+    raise KeyError(name)
+
+
+def next_cursor(plan: PagePlan, last_row: Dict[str, Any], offset: int, page_len: int) -> Optional[str]:
+    """Opaque continuation token for the page after `last_row`."""
+    if plan.mode == KEYSET:
+        try:
+            payload = {"k": [_encode_value(_row_value(last_row, n)) for n, _, _ in plan.keys]}
+        except KeyError:
+            return None
+    else:
+        payload = {"o": offset + page_len}
+    payload["s"] = plan.signature
+    raw = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(plan: PagePlan, token: str) -> Tuple[Optional[list], int]:
+    """Return (after key values, offset) from a token produced by next_cursor for the same plan."""
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        payload = json.loads(raw)
+    except Exception:
+        raise InvalidCursor("invalid continuation token")
+    if not isinstance(payload, dict) or payload.get("s") != plan.signature:
+        raise InvalidCursor("continuation token does not belong to this query")
+    if plan.mode == KEYSET:
+        keys = payload.get("k")
+        if not isinstance(keys, list) or len(keys) != len(plan.keys):
+            raise InvalidCursor("invalid continuation token")
+        return [_decode_value(v) for v in keys], 0
+    offset = payload.get("o")
+    if not isinstance(offset, int) or offset < 0:
+        raise InvalidCursor("invalid continuation token")
+    return None, offset
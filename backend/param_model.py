@@ -1,4 +1,9 @@
+import json
+import hashlib
+from typing import Any, Dict, List
+
 from pydantic import create_model, Field, constr
+from pydantic_core import SchemaValidator, ValidationError, core_schema
 
 
 def build_params_model(model_name: str, params_json: list):
@@ -8,7 +13,8 @@ def build_params_model(model_name: str, params_json: list):
       - for strings: min_length, max_length, strip (bool)
       - for numbers: min (>=), max (<=)
 
-    Always injects optional pagination fields `limit` and `offset` when not present.
+    Always injects optional pagination fields `limit`, `offset` and `cursor` (the opaque
+    continuation token returned as `next_cursor`) when not present.
     params_json: [{name,in,type,required?,default?, min?, max?, min_length?, max_length?, strip?}, ...]
     """
     fields = {}
@@ -56,5 +62,160 @@ def build_params_model(model_name: str, params_json: list):
         fields["limit"] = (int, Field(100, ge=0))
     if "offset" not in fields:
         fields["offset"] = (int, Field(0, ge=0))
+    if "cursor" not in fields:
+        fields["cursor"] = (str | None, None)
 
     return create_model(model_name, **fields)
+
+
+
+def _field_schema(p: dict):
+    ptype = (p.get("type") or "string").lower()
+    if ptype == "integer":
+        return core_schema.int_schema(ge=p.get("min"), le=p.get("max"))
+    if ptype == "number":
+        return core_schema.float_schema(ge=p.get("min"), le=p.get("max"))
+    if ptype == "boolean":
+        return core_schema.bool_schema()
+    # string and unknown types, with the same trimming / length rules as build_params_model
+    return core_schema.str_schema(strip_whitespace=bool(p.get("strip", True)),
+                                  min_length=p.get("min_length") or None, max_length=p.get("max_length") or None)
+
+
+def _params_schema(params_json: list):
+    fields = {}
+    for p in params_json or []:
+        fname = p.get("name")
+        if not fname:
+            continue
+        schema = _field_schema(p)
+        if p.get("required", True) and "default" not in p:
+            fields[fname] = core_schema.typed_dict_field(schema, required=True)
+        else:
+            # like model defaults, the default itself is not validated
+            fields[fname] = core_schema.typed_dict_field(core_schema.with_default_schema(schema, default=p.get("default")), required=False)
+    pagination = {
+        "limit": core_schema.with_default_schema(core_schema.int_schema(ge=0), default=100),
+        "offset": core_schema.with_default_schema(core_schema.int_schema(ge=0), default=0),
+        "cursor": core_schema.with_default_schema(core_schema.nullable_schema(core_schema.str_schema()), default=None),
+    }
+    for name, schema in pagination.items():
+        if name not in fields:
+            fields[name] = core_schema.typed_dict_field(schema, required=False)
+    return core_schema.typed_dict_schema(fields, extra_behavior="ignore")
+
+
+class ParamValidator:
+    """Validates raw request params straight into a plain dict of bind values.
+
+    Same rules as build_params_model, compiled to a pydantic-core SchemaValidator without a model
+    class in between. Use compile_validator() so mappings with identical params_json share one.
+    """
+
+    __slots__ = ("_validator",)
+
+    def __init__(self, params_json: list):
+        self._validator = SchemaValidator(_params_schema(params_json))
+
+    def validate(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Validated params (declared ones plus limit/offset/cursor). Raises ValidationError."""
+        return self._validator.validate_python(data)
+
+
+# sha256 of canonical params_json -> validator; mappings with the same definition share one
+_validators: Dict[str, ParamValidator] = {}
+
+
+def compile_validator(params_json: list) -> ParamValidator:
+    """Shared validator for a params_json definition, compiled once per distinct content."""
+    canonical = json.dumps(params_json or [], sort_keys=True, default=str)
+    key = hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+    validator = _validators.get(key)
+    if validator is None:
+        validator = _validators.setdefault(key, ParamValidator(json.loads(canonical)))
+    return validator
+
+
+def error_details(e: ValidationError) -> List[Dict[str, Any]]:
+    """Structured validation errors: [{loc, msg, type}]."""
+    return [{"loc": list(err["loc"]), "msg": err["msg"], "type": err["type"]}
+            for err in e.errors(include_url=False, include_context=False, include_input=False)]
+
+
+def error_text(e: ValidationError) -> str:
+    """One-line summary of validation errors, e.g. `price: Input should be a valid number`."""
+    return "; ".join(f"{'.'.join(map(str, d['loc']))}: {d['msg']}" for d in error_details(e))
+
+# request controls read by the API itself; accepted as params unless the mapping declares that name
+CONTROL_PARAMS = frozenset({"limit", "offset", "cursor", "stream", "format"})
+# controls that may also travel in a JSON body (stream/format are only read from the query string)
+BODY_CONTROL_PARAMS = frozenset({"limit", "offset", "cursor"})
+
+
+class ParamExtractor:
+    """Reads a mapping's params from the request locations declared in params_json.
+
+    Built once per plan. Path params come from the route, query and header params from their
+    declared names (headers with `_` written as `-`, case-insensitive), and the JSON body is only
+    parsed when the mapping has body params. For write methods, `query` params missing from the
+    query string are also looked up in the body, since the admin UI declares non-path params as
+    `query` by default. Query or body keys that match no param are rejected.
+    Precedence is path, then query, then header, then body.
+    """
+
+    __slots__ = ("query", "body", "headers", "body_fallback", "allowed_query", "allowed_body", "allowed_any")
+
+    def __init__(self, params_json: list, method: str = "GET"):
+        by_in = {"path": [], "query": [], "body": [], "header": []}
+        for p in params_json or []:
+            if p.get("name"):
+                by_in.get(p.get("in"), by_in["query"]).append(p["name"])
+        declared = frozenset(n for names in by_in.values() for n in names)
+        self.query = tuple(by_in["query"])
+        self.body = tuple(by_in["body"])
+        self.headers = tuple((n, n.replace("_", "-")) for n in by_in["header"])
+        self.body_fallback = self.query if method.upper() != "GET" else ()
+        self.allowed_query = frozenset(self.query) | (CONTROL_PARAMS - declared)
+        self.allowed_body = frozenset(self.body) | frozenset(self.body_fallback) | (BODY_CONTROL_PARAMS - declared)
+        self.allowed_any = declared | CONTROL_PARAMS
+
+    def _needs_body(self, data: dict) -> bool:
+        return bool(self.body) or any(n not in data for n in self.body_fallback)
+
+    async def from_request(self, request) -> dict:
+        """Raw param values for a request. Raises ValueError for unexpected fields or a malformed body."""
+        data = dict(request.path_params)
+        query = request.query_params
+        if query:
+            unexpected = query.keys() - self.allowed_query
+            if unexpected:
+                raise ValueError(f"unexpected query parameter(s): {', '.join(sorted(unexpected))}")
+            for k, v in query.items():
+                data.setdefault(k, v)
+        for name, header in self.headers:
+            if name not in data:
+                v = request.headers.get(header)
+                if v is not None:
+                    data[name] = v
+        if self._needs_body(data) and request.headers.get("content-type", "").startswith("application/json"):
+            raw = await request.body()
+            if raw.strip():
+                try:
+                    body = await request.json()
+                except ValueError:
+                    raise ValueError("request body is not valid JSON")
+                if not isinstance(body, dict):
+                    raise ValueError("request body must be a JSON object")
+                unexpected = body.keys() - self.allowed_body
+                if unexpected:
+                    raise ValueError(f"unexpected body field(s): {', '.join(sorted(unexpected))}")
+                for k, v in body.items():
+                    data.setdefault(k, v)
+        return data
+
+    def from_params(self, path_params: dict, params: dict) -> dict:
+        """Raw param values for a call given as one flat dict (e.g. a batch item), whatever their location."""
+        unexpected = params.keys() - self.allowed_any
+        if unexpected:
+            raise ValueError(f"unexpected parameter(s): {', '.join(sorted(unexpected))}")
+        return {**params, **path_params}
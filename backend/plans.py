@@ -0,0 +1,224 @@
+import json
+import time
+import threading
+from typing import Dict, Optional
+from sqlalchemy import Boolean, Float, Integer, String
+
+import storage
+import exec_query
+import pagination
+import param_model
+import result_cache
+import query_control
+import engine_registry
+from db_adapter import DatabaseClient
+
+# pagination params injected by param_model; never bound into the SQL unless the mapping declares them
+PAGINATION_PARAMS = frozenset({"limit", "offset", "cursor"})
+
+# params_json type -> bind-param type for the compiled text() clause
+_BIND_TYPES = {"string": String, "integer": Integer, "number": Float, "boolean": Boolean}
+
+
+class PlanError(Exception):
+    pass
+
+
+class MappingPlan:
+    """Everything a deployed mapping needs per request, resolved once at deploy time.
+
+    Plans are immutable; when the mapping's query or connector record changes in storage
+    a new plan is compiled (see get_plan) and swapped in.
+    """
+
+    __slots__ = ("mapping_id", "mapping", "query", "connector", "validator", "declared", "exclude",
+                 "prepared", "row_converter", "fingerprint", "mapping_fingerprint", "cache_ttl", "tables", "extractor")
+
+    def __init__(self, mapping: dict, query: dict, connector: dict, validator=None):
+        params_json = mapping.get("params_json", []) or []
+        self.mapping_id = mapping.get("id")
+        self.mapping = mapping
+        self.query = query
+        self.connector = connector
+        self.validator = validator
+        self.declared = frozenset(p.get("name") for p in params_json if p.get("name"))
+        self.exclude = PAGINATION_PARAMS - self.declared
+        self.extractor = param_model.ParamExtractor(params_json, mapping.get("method", "GET"))
+        self.fingerprint = _fingerprint(query, connector)
+        self.mapping_fingerprint = _mapping_fingerprint(mapping)
+
+        param_types = {p["name"]: _BIND_TYPES[p.get("type")] for p in params_json if p.get("name") and p.get("type") in _BIND_TYPES}
+        sql_text = query.get("sql_text", "")
+        snapshot = storage.get_latest_schema_snapshot(connector.get("id"))
+        pk = not_null = []
+        if sql_text.strip().lower().startswith("select"):
+            pk = pagination.pk_for_query(sql_text, snapshot)
+            not_null = pagination.not_null_for_query(sql_text, snapshot)
+        self.prepared = exec_query.PreparedQuery(sql_text, param_types, pk, not_null)
+        self.row_converter = exec_query.rows_to_json
+        # result caching is opt-in and only applies to GET mappings that read
+        self.cache_ttl = (mapping.get("cache_ttl") or 0) if mapping.get("method", "GET").upper() == "GET" and self.is_select else 0
+        self.tables = result_cache.referenced_tables(sql_text)
+
+    @property
+    def is_select(self) -> bool:
+        return self.prepared.is_select
+
+    @property
+    def statement_timeout_ms(self):
+        # read per call: connector edits swap in a plan copy without recompiling
+        return query_control.timeout_ms(self.mapping, self.connector)
+
+    def client(self) -> DatabaseClient:
+        """Client on the connector's pooled engine (looked up so the registry's LRU sees the use)."""
+        return engine_registry.registry.get_client(self.connector)
+
+
+def _fingerprint(query: dict, connector: dict) -> tuple:
+    return (query.get("sql_text"), bool(query.get("is_proc")), connector.get("sqlalchemy_url"),
+            tuple(sorted((connector.get("pool") or {}).items())))
+
+
+# mapping fields that are deployment state rather than part of the plan (route sync handles them)
+_STATE_FIELDS = frozenset({"deployed", "connector_valid"})
+
+
+def _mapping_fingerprint(mapping: dict) -> str:
+    # by content: storage reloads hand out new dicts, so identity alone doesn't tell an edit apart
+    return json.dumps({k: v for k, v in mapping.items() if k not in _STATE_FIELDS}, sort_keys=True, default=str)
+
+
+_plans: Dict[str, MappingPlan] = {}
+# deployed mappings whose plan is built on first use (or by warm_up)
+_pending: set = set()
+_lock = threading.Lock()
+
+
+def _resolve(mapping: dict):
+    query = storage.get_query_by_id(mapping.get("query_id"))
+    if not query:
+        raise PlanError("query missing")
+    connector = storage.get_connector_by_id(mapping.get("connector_id"))
+    if not connector:
+        raise PlanError("connector missing")
+    return query, connector
+
+
+def _build(mapping: dict) -> MappingPlan:
+    query, connector = _resolve(mapping)
+    try:
+        validator = param_model.compile_validator(mapping.get("params_json", []))
+    except Exception:
+        validator = None
+    return MappingPlan(mapping, query, connector, validator)
+
+
+def compile_plan(mapping: dict) -> MappingPlan:
+    """Build and register the plan for a mapping. Raises PlanError if its query or connector is gone."""
+    plan = _build(mapping)
+    with _lock:
+        _plans[plan.mapping_id] = plan
+        _pending.discard(plan.mapping_id)
+    return plan
+
+
+def register_lazy(mapping_id: str) -> None:
+    """Mark a deployed mapping whose plan is compiled on its first request instead of now."""
+    with _lock:
+        if mapping_id not in _plans:
+            _pending.add(mapping_id)
+
+
+def _compile_pending(mapping_id: str) -> Optional[MappingPlan]:
+    mapping = storage.get_mapping_by_id(mapping_id)
+    plan = _build(mapping) if mapping and mapping.get("deployed") else None
+    with _lock:
+        if mapping_id not in _pending:
+            # dropped (undeployed) or compiled by someone else meanwhile
+            return _plans.get(mapping_id)
+        _pending.discard(mapping_id)
+        if plan is not None:
+            _plans[mapping_id] = plan
+    return plan
+
+
+def refresh(mapping_id: str) -> None:
+    """Send a compiled plan back to lazy compilation if its mapping record changed in storage
+    (e.g. edited by another worker). Query and connector changes are already caught by get_plan.
+
+    A record that was only re-read (same content) keeps its plan and cached results.
+    """
+    plan = _plans.get(mapping_id)
+    mapping = storage.get_mapping_by_id(mapping_id)
+    if plan is None or mapping is None or mapping is plan.mapping:
+        return
+    if _mapping_fingerprint(mapping) == plan.mapping_fingerprint:
+        fresh = MappingPlan.__new__(MappingPlan)
+        for attr in MappingPlan.__slots__:
+            setattr(fresh, attr, getattr(plan, attr))
+        fresh.mapping = mapping
+        with _lock:
+            if _plans.get(mapping_id) is plan:
+                _plans[mapping_id] = fresh
+        return
+    with _lock:
+        if _plans.get(mapping_id) is plan:
+            del _plans[mapping_id]
+            _pending.add(mapping_id)
+    result_cache.cache.purge_mapping(mapping_id)
+
+
+def warm_up() -> int:
+    """Compile every plan still pending (run in the background after start-up). Returns how many were built."""
+    built = 0
+    for mapping_id in list(_pending):
+        try:
+            if mapping_id in _pending and _compile_pending(mapping_id) is not None:
+                built += 1
+        except PlanError:
+            continue
+        # yield the GIL between plans so requests arriving during warm-up aren't held up
+        time.sleep(0)
+    return built
+
+
+def get_plan(mapping_id: str) -> Optional[MappingPlan]:
+    """Current plan for a deployed mapping, compiled on first use when registered lazily and
+    recompiled if its query or connector changed.
+
+    The check is two identity comparisons against storage's cached records; only when a
+    record was replaced is the (cheap) fingerprint compared and, if needed, the plan rebuilt.
+    """
+    plan = _plans.get(mapping_id)
+    if plan is None:
+        if mapping_id not in _pending:
+            return None
+        return _compile_pending(mapping_id)
+    query = storage.get_query_by_id(plan.mapping.get("query_id"))
+    connector = storage.get_connector_by_id(plan.mapping.get("connector_id"))
+    if query is plan.query and connector is plan.connector:
+        return plan
+    if not query:
+        raise PlanError("query missing")
+    if not connector:
+        raise PlanError("connector missing")
+
+    # records were re-read or edited; keep the param validator, rebuild the SQL side if it changed
+    if _fingerprint(query, connector) == plan.fingerprint:
+        fresh = MappingPlan.__new__(MappingPlan)
+        for attr in MappingPlan.__slots__:
+            setattr(fresh, attr, getattr(plan, attr))
+        fresh.query, fresh.connector = query, connector
+    else:
+        fresh = MappingPlan(plan.mapping, query, connector, plan.validator)
+        result_cache.cache.purge_mapping(mapping_id)
+    with _lock:
+        _plans[mapping_id] = fresh
+    return fresh
+
+
+def drop_plan(mapping_id: str) -> None:
+    with _lock:
+        _plans.pop(mapping_id, None)
+        _pending.discard(mapping_id)
+    result_cache.cache.purge_mapping(mapping_id)
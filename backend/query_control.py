@@ -0,0 +1,192 @@
+import os
+import time
+import inspect
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+
+from sqlalchemy import event, text
+from sqlalchemy.engine import Connection
+
+# Statement timeout (ms) when neither the mapping nor its connector sets one; 0 disables it.
+DEFAULT_TIMEOUT_MS = int(os.environ.get("STATEMENT_TIMEOUT_MS", "0"))
+# SQLite VM instructions between checks of the deadline / cancel flag.
+SQLITE_CHECK_STEPS = 1000
+
+# key in the pooled connection's info dict holding the session timeout currently set on it
+_INFO_KEY = "statement_timeout_ms"
+_UNKNOWN = "unknown"
+
+
+def timeout_ms(mapping: Optional[dict] = None, connector: Optional[dict] = None) -> Optional[int]:
+    """Effective statement timeout: the mapping's, else the connector's, else STATEMENT_TIMEOUT_MS."""
+    for rec in (mapping, connector):
+        if rec and rec.get("statement_timeout_ms"):
+            return rec["statement_timeout_ms"]
+    return DEFAULT_TIMEOUT_MS or None
+
+
+class QueryControl:
+    """
+    Statement timeout and cancellation for one query execution.
+
+    DatabaseClient applies it to every connection it hands out while the execution runs (see
+    `applied`): the timeout is set natively where the dialect has one (Postgres
+    `statement_timeout`, MySQL `max_execution_time` / MariaDB `max_statement_time`, the pyodbc
+    query timeout for MSSQL, a progress handler for SQLite). `cancel()` may be called from any
+    thread and stops the statement in flight where the driver allows it.
+    """
+
+    def __init__(self, timeout_ms: Optional[int] = None):
+        self.timeout_ms = timeout_ms or None
+        self.cancelled = False
+        self._deadline = None
+        self._lock = threading.Lock()
+        self._cancel_fn: Optional[Callable[[], None]] = None
+        # a statement is running that cancel() can stop (driver cancel or the SQLite progress handler)
+        self._stoppable = False
+
+    def expired(self) -> bool:
+        return self._deadline is not None and time.monotonic() >= self._deadline
+
+    def _interrupt(self) -> int:
+        # SQLite progress handler: non-zero aborts the running statement
+        return 1 if self.cancelled or self.expired() else 0
+
+    def error(self) -> Optional[Dict]:
+        """Result dict for an execution that failed because it was cancelled or timed out, else None."""
+        if self.cancelled:
+            return {"ok": False, "error": "query cancelled: client disconnected", "error_status": 499}
+        if self.expired():
+            return {"ok": False, "error": f"statement timeout exceeded ({self.timeout_ms} ms)", "error_status": 504}
+        return None
+
+    def cancel(self) -> bool:
+        """Cancel the execution. Returns False if a statement in flight can't be stopped natively."""
+        with self._lock:
+            self.cancelled = True
+            fn = self._cancel_fn
+            stoppable = self._stoppable
+        if fn is not None:
+            # driver cancels may block on a round trip; keep them off the caller's (event loop) thread
+            threading.Thread(target=_quietly, args=(fn,), daemon=True).start()
+        return stoppable
+
+    @contextmanager
+    def applied(self, conn: Connection):
+        """Apply the timeout to `conn` and make it cancellable for the duration of the block."""
+        if self.cancelled:
+            raise RuntimeError("query cancelled")
+        if self.timeout_ms:
+            self._deadline = time.monotonic() + self.timeout_ms / 1000
+        dialect = conn.dialect.name
+        driver = conn.connection.driver_connection
+        undo = []
+        if dialect == "sqlite":
+            _call(driver.set_progress_handler, self._interrupt, SQLITE_CHECK_STEPS)
+            undo.append(lambda: _call(driver.set_progress_handler, None, 0))
+        else:
+            set_session_timeout(conn, self.timeout_ms)
+            if dialect == "mssql" and hasattr(driver, "timeout"):
+                previous = driver.timeout
+                # pyodbc applies its query timeout (whole seconds) to cursors created afterwards
+                driver.timeout = -(-self.timeout_ms // 1000) if self.timeout_ms else 0
+                undo.append(lambda: setattr(driver, "timeout", previous))
+        cancel_fn = _cancel_fn(conn, driver, undo)
+        with self._lock:
+            self._cancel_fn = cancel_fn
+            self._stoppable = cancel_fn is not None or dialect == "sqlite"
+        try:
+            yield conn
+        finally:
+            with self._lock:
+                self._cancel_fn = None
+                self._stoppable = False
+            for fn in reversed(undo):
+                _quietly(fn)
+
+
+def set_session_timeout(conn: Connection, timeout_ms: Optional[int]) -> None:
+    """Set (or clear, for None) the session statement timeout on Postgres / MySQL connections.
+
+    The value is remembered on the pooled connection, so a SET is only sent when it changes.
+    """
+    info = conn.connection.info
+    if info.get(_INFO_KEY) == timeout_ms:
+        return
+    dialect = conn.dialect.name
+    if dialect == "postgresql":
+        stmt = f"SET statement_timeout = {int(timeout_ms or 0)}"
+    elif dialect == "mysql" and getattr(conn.dialect, "is_mariadb", False):
+        stmt = f"SET SESSION max_statement_time = {(timeout_ms or 0) / 1000:.3f}"
+    elif dialect == "mysql":
+        # session form of the MAX_EXECUTION_TIME hint; MySQL applies it to SELECTs only
+        stmt = f"SET SESSION max_execution_time = {int(timeout_ms or 0)}"
+    else:
+        return
+    if conn.in_transaction():
+        # may be rolled back with the caller's transaction: send it again next time, whatever it is
+        conn.execute(text(stmt))
+        info[_INFO_KEY] = _UNKNOWN
+        return
+    conn.execute(text(stmt))
+    # committed so the setting survives the rollback done when the connection is released
+    conn.commit()
+    info[_INFO_KEY] = timeout_ms
+
+
+def clear_session_timeout(conn: Connection) -> None:
+    """Drop a session timeout left on a pooled connection by an earlier controlled execution."""
+    if conn.connection.info.get(_INFO_KEY):
+        set_session_timeout(conn, None)
+
+
+def _cancel_fn(conn: Connection, driver, undo: list) -> Optional[Callable[[], None]]:
+    """Thread-safe way to stop the statement running on `conn`, for drivers that have one.
+
+    Async drivers are cancelled through their awaiting task instead (see async_exec).
+    """
+    dialect = conn.dialect.name
+    if dialect == "sqlite" or getattr(conn.dialect, "is_async", False):
+        # SQLite: the progress handler watches `cancelled`
+        return None
+    if dialect == "postgresql":
+        cancel = getattr(driver, "cancel", None)
+        return cancel if callable(cancel) and not inspect.iscoroutinefunction(cancel) else None
+    if dialect == "mysql" and callable(getattr(driver, "thread_id", None)):
+        thread_id = driver.thread_id()
+        engine = conn.engine
+
+        def kill():
+            with engine.connect() as other:
+                other.exec_driver_sql(f"KILL QUERY {int(thread_id)}")
+        return kill
+    if dialect == "mssql":
+        # pyodbc cancels per cursor; remember the one SQLAlchemy opens for each statement
+        cursors = []
+
+        def track(conn_, cursor, *args):
+            cursors[:] = [cursor]
+        event.listen(conn, "before_cursor_execute", track)
+        undo.append(lambda: event.remove(conn, "before_cursor_execute", track))
+
+        def cancel():
+            if cursors and hasattr(cursors[0], "cancel"):
+                cursors[0].cancel()
+        return cancel
+    return None
+
+
+def _call(fn, *args) -> None:
+    # aiosqlite's connection methods are coroutines; run them from the greenlet of AsyncConnection.run_sync
+    result = fn(*args)
+    if inspect.isawaitable(result):
+        from sqlalchemy.util import await_
+        await_(result)
+
+
+def _quietly(fn) -> None:
+    try:
+        fn()
+    except Exception:
+        pass
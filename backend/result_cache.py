@@ -0,0 +1,170 @@
+import os
+import re
+import json
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, FrozenSet, Optional
+
+import storage
+import metrics
+
+# Total size budget (approximate serialized bytes) for all cached results.
+MAX_BYTES = int(os.environ.get("RESULT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+_TABLE_RE = re.compile(r'\b(?:FROM|JOIN|INTO|UPDATE|TABLE)\s+((?:"[^"]+"|\[[^\]]+\]|`[^`]+`|[\w$]+)(?:\s*\.\s*(?:"[^"]+"|\[[^\]]+\]|`[^`]+`|[\w$]+))*)', re.IGNORECASE)
+
+
+def referenced_tables(sql_text: str) -> FrozenSet[str]:
+    """Lower-cased, unqualified table names a statement reads or writes (best effort)."""
+    tables = set()
+    for m in _TABLE_RE.finditer(sql_text or ""):
+        last = re.split(r"\s*\.\s*", m.group(1))[-1]
+        tables.add(last.strip('"[]`').lower())
+    return frozenset(tables)
+
+
+def make_key(mapping_id: str, params: Dict[str, Any], limit: int, offset: int, cursor: Optional[str], fmt: str = "") -> str:
+    """Cache key from the mapping id, its validated params (order-insensitive) and the response format."""
+    return json.dumps([mapping_id, sorted(params.items()), limit, offset, cursor, fmt], default=str, separators=(",", ":"))
+
+
+class _Entry:
+    __slots__ = ("value", "expires_at", "size", "mapping_id", "connector_id", "tables")
+
+    def __init__(self, value, expires_at, size, mapping_id, connector_id, tables):
+        self.value = value
+        self.expires_at = expires_at
+        self.size = size
+        self.mapping_id = mapping_id
+        self.connector_id = connector_id
+        self.tables = tables
+
+
+class ResultCache:
+    """
+    LRU of query results for opt-in GET mappings, bounded by approximate size in bytes.
+    Entries expire after the mapping's TTL and are dropped when a write mapping on the same
+    connector touches one of the tables they read.
+
+    Invalidations also bump version counters (per table, connector and mapping). A reader takes
+    `version()` before executing and passes it to `put`, which drops the result if a write
+    invalidated it meanwhile. The cache and its invalidations are local to the process: with
+    several workers, a write only purges the worker that ran it, and the others keep serving
+    their entries until the TTL ends.
+    """
+
+    def __init__(self, max_bytes: int = MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.stale_puts = 0
+        # invalidation counters: ("t", connector, table), ("w", connector) for any table write,
+        # ("c", connector) for all of its tables, ("m", mapping); _epoch for purge_all
+        self._versions: Dict[tuple, int] = {}
+        self._epoch = 0
+
+    def _version_locked(self, mapping_id: str, connector_id: str, tables: FrozenSet[str]) -> tuple:
+        keys = [("m", mapping_id), ("c", connector_id)]
+        # readers of unknown tables are invalidated by any write on the connector
+        keys += [("t", connector_id, t) for t in sorted(tables)] if tables else [("w", connector_id)]
+        return (self._epoch,) + tuple(self._versions.get(k, 0) for k in keys)
+
+    def _bump_locked(self, *keys) -> None:
+        for k in keys:
+            self._versions[k] = self._versions.get(k, 0) + 1
+
+    def version(self, mapping_id: str, connector_id: str, tables: FrozenSet[str]) -> tuple:
+        """Invalidation state to pass to `put` for a result about to be computed."""
+        with self._lock:
+            return self._version_locked(mapping_id, connector_id, tables)
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if time.monotonic() >= entry.expires_at:
+                self._remove_locked(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry.value
+
+    def put(self, key: str, value: dict, ttl: float, mapping_id: str, connector_id: str, tables: FrozenSet[str],
+            version: Optional[tuple] = None) -> None:
+        """Store a result, unless it was invalidated since `version` was taken."""
+        size = len(json.dumps(value, default=str))
+        if ttl <= 0 or size > self.max_bytes:
+            return
+        with self._lock:
+            if version is not None and version != self._version_locked(mapping_id, connector_id, tables):
+                self.stale_puts += 1
+                return
+            if key in self._entries:
+                self._remove_locked(key)
+            self._entries[key] = _Entry(value, time.monotonic() + ttl, size, mapping_id, connector_id, tables)
+            self._bytes += size
+            while self._bytes > self.max_bytes and self._entries:
+                oldest = next(iter(self._entries))
+                self._remove_locked(oldest)
+                self.evictions += 1
+
+    def _remove_locked(self, key: str) -> None:
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+
+    def _purge_where(self, pred, *bump) -> int:
+        with self._lock:
+            self._bump_locked(*bump)
+            keys = [k for k, e in self._entries.items() if pred(e)]
+            for k in keys:
+                self._remove_locked(k)
+            return len(keys)
+
+    def invalidate_tables(self, connector_id: str, tables: FrozenSet[str]) -> int:
+        """Drop results on `connector_id` that read any of `tables` (all of them if tables is empty)."""
+        bump = [("w", connector_id)] + ([("t", connector_id, t) for t in tables] if tables else [("c", connector_id)])
+        n = self._purge_where(lambda e: e.connector_id == connector_id and (not tables or not e.tables or e.tables & tables), *bump)
+        with self._lock:
+            self.invalidations += n
+        return n
+
+    def purge_mapping(self, mapping_id: str) -> int:
+        return self._purge_where(lambda e: e.mapping_id == mapping_id, ("m", mapping_id))
+
+    def purge_connector(self, connector_id: str) -> int:
+        return self._purge_where(lambda e: e.connector_id == connector_id, ("c", connector_id))
+
+    def purge_all(self) -> int:
+        with self._lock:
+            self._epoch += 1
+        return self._purge_where(lambda e: True)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "stale_puts": self.stale_puts,
+            }
+
+
+cache = ResultCache()
+storage.add_connector_listener(cache.purge_connector)
+metrics.register_collector("result_cache", cache.stats)
@@ -0,0 +1,238 @@
+import os
+import copy
+import json
+import hashlib
+import threading
+from contextlib import contextmanager, nullcontext
+from functools import lru_cache
+from typing import Callable, ContextManager, Dict, List, Optional
+
+# Snapshots kept per connector; older ones are dropped and unreferenced table objects collected.
+RETENTION_SNAPSHOTS = int(os.environ.get("SCHEMA_RETENTION_SNAPSHOTS", "10"))
+
+
+def _canonical(entry: dict) -> bytes:
+    return json.dumps(entry, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str).encode("utf-8")
+
+
+def _signature(path: str):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+class SchemaStore:
+    """
+    Content-addressed schema snapshots.
+
+    Each table entry (columns, pk, sample rows) is stored once under `objects/` named by the
+    SHA-256 of its canonical JSON, so tables that did not change are shared between snapshots.
+    A snapshot is a small manifest ({table: hash}) appended to its connector's own manifest
+    file; the latest one is the last entry, and its resolved form is cached until that file changes.
+    Writes and garbage collection run under `file_lock()`, a lock shared by every process using
+    the directory, so one worker's collection can't drop objects another has just written.
+    """
+
+    def __init__(self, directory: str, write_json: Callable[[str, object], None], legacy_file: Optional[str] = None,
+                 retention: int = RETENTION_SNAPSHOTS, file_lock: Optional[Callable[[], ContextManager]] = None):
+        self.directory = directory
+        self.objects_dir = os.path.join(directory, "objects")
+        self.retention = retention
+        self._write_json = write_json
+        self._legacy_file = legacy_file
+        self._lock = threading.RLock()
+        self._file_lock = file_lock or nullcontext
+        self._lock_depth = 0
+        # connector id -> (file signature, manifests)
+        self._manifests: Dict[str, tuple] = {}
+        # connector id -> (manifest id, resolved snapshot)
+        self._latest: Dict[str, tuple] = {}
+        self._migrated = False
+
+    @contextmanager
+    def _exclusive(self):
+        # the cross-process lock is taken once, by the outermost caller (flock isn't re-entrant)
+        with self._lock:
+            outer = self._lock_depth == 0
+            self._lock_depth += 1
+            try:
+                with self._file_lock() if outer else nullcontext():
+                    yield
+            finally:
+                self._lock_depth -= 1
+
+    # --- paths ---
+
+    def _manifest_path(self, connector_id: str) -> str:
+        return os.path.join(self.directory, f"{connector_id}.json")
+
+    def _object_path(self, digest: str) -> str:
+        return os.path.join(self.objects_dir, digest[:2], digest + ".json")
+
+    # --- objects ---
+
+    def _put_object(self, entry: dict) -> str:
+        digest = hashlib.sha256(_canonical(entry)).hexdigest()
+        path = self._object_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._write_json(path, entry)
+        return digest
+
+    def _get_object(self, digest: str) -> dict:
+        return _load_object(self._object_path(digest))
+
+    # --- manifests ---
+
+    def _read_manifests(self, connector_id: str) -> List[dict]:
+        self._migrate()
+        path = self._manifest_path(connector_id)
+        sig = _signature(path)
+        cached = self._manifests.get(connector_id)
+        if cached is not None and cached[0] == sig:
+            return cached[1]
+        manifests = []
+        if sig is not None:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    manifests = json.load(f)
+            except (OSError, ValueError):
+                manifests = []
+        self._manifests[connector_id] = (sig, manifests)
+        return manifests
+
+    def _write_manifests(self, connector_id: str, manifests: List[dict]) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._manifest_path(connector_id)
+        self._write_json(path, manifests)
+        self._manifests[connector_id] = (_signature(path), manifests)
+
+    def _resolve(self, manifest: dict) -> dict:
+        return {"tables": {name: self._get_object(digest) for name, digest in manifest.get("tables", {}).items()}}
+
+    def _record(self, connector_id: str, manifest: dict, snapshot: dict) -> dict:
+        return {"id": manifest["id"], "connector_id": connector_id, "snapshot": snapshot, "created_at": manifest.get("created_at")}
+
+    # --- public ---
+
+    def write(self, connector_id: str, snapshot: dict, record_id: str, created_at: str) -> dict:
+        """Store a snapshot. If it is identical to the latest one, that record is returned instead."""
+        with self._exclusive():
+            # objects are written under the lock so a concurrent garbage collection can't drop them
+            tables = {name: self._put_object(entry) for name, entry in (snapshot.get("tables") or {}).items()}
+            manifests = list(self._read_manifests(connector_id))
+            if manifests and manifests[-1].get("tables") == tables:
+                latest = manifests[-1]
+                return self._record(connector_id, latest, self.latest(connector_id))
+            manifest = {"id": record_id, "created_at": created_at, "tables": tables}
+            manifests.append(manifest)
+            dropped = manifests[:-self.retention] if self.retention > 0 else []
+            if dropped:
+                manifests = manifests[len(dropped):]
+            self._write_manifests(connector_id, manifests)
+            self._latest[connector_id] = (manifest["id"], copy.deepcopy(snapshot))
+            if dropped:
+                self.collect_garbage()
+        return self._record(connector_id, manifest, snapshot)
+
+    def latest(self, connector_id: str) -> Optional[dict]:
+        """Latest snapshot for a connector (a private copy), or None."""
+        with self._lock:
+            manifests = self._read_manifests(connector_id)
+            if not manifests:
+                return None
+            manifest = manifests[-1]
+            cached = self._latest.get(connector_id)
+            if cached is None or cached[0] != manifest["id"]:
+                cached = (manifest["id"], self._resolve(manifest))
+                self._latest[connector_id] = cached
+            return copy.deepcopy(cached[1])
+
+    def records(self) -> List[dict]:
+        """Every retained snapshot, fully resolved (oldest first per connector)."""
+        out = []
+        with self._lock:
+            for connector_id in self.connector_ids():
+                for manifest in self._read_manifests(connector_id):
+                    out.append(self._record(connector_id, manifest, copy.deepcopy(self._resolve(manifest))))
+        return out
+
+    def connector_ids(self) -> List[str]:
+        self._migrate()
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(n[:-5] for n in os.listdir(self.directory) if n.endswith(".json"))
+
+    def drop_connector(self, connector_id: str) -> None:
+        with self._exclusive():
+            try:
+                os.remove(self._manifest_path(connector_id))
+            except FileNotFoundError:
+                return
+            self._manifests.pop(connector_id, None)
+            self._latest.pop(connector_id, None)
+            self.collect_garbage()
+
+    def collect_garbage(self) -> int:
+        """Delete table objects no retained snapshot references. Returns the number removed."""
+        with self._exclusive():
+            live = set()
+            for connector_id in self.connector_ids():
+                for manifest in self._read_manifests(connector_id):
+                    live.update(manifest.get("tables", {}).values())
+            removed = 0
+            if not os.path.isdir(self.objects_dir):
+                return 0
+            for sub in os.listdir(self.objects_dir):
+                subdir = os.path.join(self.objects_dir, sub)
+                if not os.path.isdir(subdir):
+                    continue
+                for name in os.listdir(subdir):
+                    if name.endswith(".json") and name[:-5] not in live:
+                        try:
+                            os.remove(os.path.join(subdir, name))
+                            removed += 1
+                        except OSError:
+                            continue
+            return removed
+
+    # --- legacy schemas.json ---
+
+    def _migrate(self) -> None:
+        """Import a legacy single-file schemas.json once, then rename it out of the way."""
+        if self._migrated:
+            return
+        with self._exclusive():
+            if self._migrated:
+                return
+            self._migrated = True
+            legacy = self._legacy_file
+            if not legacy or not os.path.exists(legacy):
+                return
+            try:
+                with open(legacy, "r", encoding="utf-8") as f:
+                    records = json.load(f)
+            except (OSError, ValueError):
+                records = []
+            by_connector: Dict[str, List[dict]] = {}
+            for rec in records if isinstance(records, list) else []:
+                if rec.get("connector_id") and rec.get("id"):
+                    by_connector.setdefault(rec["connector_id"], []).append(rec)
+            for connector_id, recs in by_connector.items():
+                manifests = self._read_manifests(connector_id)
+                for rec in recs[-self.retention:] if self.retention > 0 else recs:
+                    tables = {name: self._put_object(entry) for name, entry in ((rec.get("snapshot") or {}).get("tables") or {}).items()}
+                    if manifests and manifests[-1].get("tables") == tables:
+                        continue
+                    manifests = manifests + [{"id": rec["id"], "created_at": rec.get("created_at"), "tables": tables}]
+                self._write_manifests(connector_id, manifests)
+            os.replace(legacy, legacy + ".migrated")
+
+
+@lru_cache(maxsize=4096)
+def _load_object(path: str) -> dict:
+    # objects are immutable once written, so a parsed copy can be cached by path
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
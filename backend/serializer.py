@@ -0,0 +1,143 @@
+import json
+import base64
+import uuid
+import datetime
+from decimal import Decimal
+from typing import Any, Callable, List, Optional, Sequence
+
+from starlette.responses import Response
+
+try:
+    import orjson
+except ImportError:  # optional: falls back to the stdlib encoder
+    orjson = None
+
+# value types the JSON encoder writes as-is; orjson also handles datetimes and UUIDs natively
+_NATIVE = {type(None), bool, int, float, str}
+if orjson is not None:
+    _NATIVE |= {datetime.datetime, datetime.date, datetime.time, uuid.UUID}
+
+
+_INT64_MIN, _INT64_MAX = -(1 << 63), (1 << 63) - 1
+
+
+def _decimal(v: Decimal):
+    # integral values (NUMERIC(p, 0), COUNT over some drivers) become ints when JSON encoders take them
+    # (64-bit); others, and NaN / Infinity, keep every digit as a string
+    if v.is_finite() and v.as_tuple().exponent >= 0:
+        i = int(v)
+        if _INT64_MIN <= i <= _INT64_MAX:
+            return i
+    return str(v)
+
+
+def _bytes(v) -> str:
+    return base64.b64encode(bytes(v)).decode("ascii")
+
+
+def _isoformat(v) -> str:
+    return v.isoformat()
+
+
+def _timedelta(v: datetime.timedelta) -> float:
+    return v.total_seconds()
+
+
+def _fallback(v):
+    if v is None or type(v) in _NATIVE:
+        return v
+    conv = _converter_for(type(v))
+    return conv(v) if conv is not None else v
+
+
+def _converter_for(t: type) -> Optional[Callable[[Any], Any]]:
+    """Converter to a JSON-native value for type `t`, or None when the encoder takes it as-is."""
+    if t in _NATIVE:
+        return None
+    if issubclass(t, Decimal):
+        return _decimal
+    if issubclass(t, (bytes, bytearray, memoryview)):
+        return _bytes
+    if issubclass(t, (datetime.datetime, datetime.date, datetime.time)):
+        return _isoformat
+    if issubclass(t, datetime.timedelta):
+        return _timedelta
+    if issubclass(t, bool):
+        return bool
+    if issubclass(t, int):
+        return int
+    if issubclass(t, float):
+        return float
+    return str
+
+
+def _guarded(t: type, conv: Callable) -> Callable:
+    # columns are usually homogeneous, but e.g. SQLite lets any cell hold any type
+    def apply(v):
+        return conv(v) if type(v) is t else _fallback(v)
+    return apply
+
+
+def column_converters(columns: Sequence[str], rows: Sequence[Sequence[Any]], type_codes: Sequence[Any] = ()) -> List[Optional[Callable]]:
+    """One converter per column (None = pass through), built once per result.
+
+    The cursor description's type code is used when the driver reports a Python type (pyodbc
+    does); otherwise the column type is taken from its first non-NULL value.
+    """
+    convs: List[Optional[Callable]] = []
+    for i in range(len(columns)):
+        t = type_codes[i] if i < len(type_codes) and isinstance(type_codes[i], type) else None
+        if t is None:
+            t = next((type(r[i]) for r in rows if r[i] is not None), None)
+        conv = _converter_for(t) if t is not None else None
+        convs.append(_guarded(t, conv) if conv is not None else None)
+    return convs
+
+
+def _convert(rows: Sequence[Sequence[Any]], convs: List[Optional[Callable]]) -> List[list]:
+    active = [(i, c) for i, c in enumerate(convs) if c is not None]
+    if not active:
+        return [list(r) for r in rows]
+    out = []
+    for r in rows:
+        r = list(r)
+        for i, c in active:
+            v = r[i]
+            if v is not None:
+                r[i] = c(v)
+        out.append(r)
+    return out
+
+
+def rows_as_dicts(columns: Sequence[str], rows: Sequence[Sequence[Any]], type_codes: Sequence[Any] = ()) -> List[dict]:
+    """Row tuples -> [{column: value}] with JSON-ready values."""
+    convs = column_converters(columns, rows, type_codes)
+    cols = list(columns)
+    return [dict(zip(cols, r)) for r in _convert(rows, convs)]
+
+
+def rows_as_lists(columns: Sequence[str], rows: Sequence[Sequence[Any]], type_codes: Sequence[Any] = ()) -> List[list]:
+    """Row tuples -> [[value, ...]] for the compact {columns, rows} format."""
+    return _convert(rows, column_converters(columns, rows, type_codes))
+
+
+def dumps(obj: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _default(v):
+    conv = _converter_for(type(v))
+    if conv is None:
+        raise TypeError(f"not JSON serializable: {type(v).__name__}")
+    return conv(v)
+
+
+class JSONBytesResponse(Response):
+    """JSON response encoded in one pass (orjson when installed), without jsonable_encoder."""
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
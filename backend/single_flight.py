@@ -0,0 +1,63 @@
+import os
+import asyncio
+from typing import Any, Awaitable, Callable, Dict
+
+import metrics
+
+ENABLED = os.environ.get("SINGLE_FLIGHT", "true").lower() in ("1", "true", "yes")
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key: the first caller starts the work as a task
+    and every caller arriving before it finishes awaits that same task. The task is shielded,
+    so a disconnecting client does not cancel the execution for the others; it is cancelled
+    only once every caller waiting on it has been.
+    """
+
+    def __init__(self):
+        self._flights: Dict[str, asyncio.Task] = {}
+        # task -> callers still awaiting it
+        self._waiters: Dict[asyncio.Task, int] = {}
+        self.executions = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._flights.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._flights[key] = task
+            task.add_done_callback(lambda t, k=key: self._done(k, t))
+            self.executions += 1
+        else:
+            self.coalesced += 1
+        self._waiters[task] = self._waiters.get(task, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if self._waiters.get(task) == 1 and not task.done():
+                # nobody is left to take the result; later callers start a fresh execution
+                if self._flights.get(key) is task:
+                    del self._flights[key]
+                task.cancel()
+            raise
+        finally:
+            left = self._waiters.get(task, 1) - 1
+            if left:
+                self._waiters[task] = left
+            else:
+                self._waiters.pop(task, None)
+
+    def _done(self, key: str, task: asyncio.Task) -> None:
+        if self._flights.get(key) is task:
+            del self._flights[key]
+        if not task.cancelled():
+            # mark the exception retrieved when every waiter went away before it finished
+            task.exception()
+
+    def stats(self) -> Dict[str, int]:
+        return {"in_flight": len(self._flights), "executions": self.executions, "coalesced": self.coalesced}
+
+
+flights = SingleFlight()
+metrics.register_collector("single_flight", flights.stats)
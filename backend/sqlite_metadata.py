@@ -0,0 +1,285 @@
+import os
+import copy
+import json
+import time
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Callable, Dict, Optional
+
+# Indexed columns per table, extracted from each record on write; the full record is kept as JSON.
+# Lookups by id, (path, method) and connector / query id are served by these indexes.
+TABLES = {
+    "connectors": {},
+    "queries": {"connector_id": "TEXT"},
+    "mappings": {"path": "TEXT", "method": "TEXT", "connector_id": "TEXT", "query_id": "TEXT"},
+    "api_keys": {},
+}
+_INDEXES = [
+    "CREATE UNIQUE INDEX IF NOT EXISTS mappings_route ON mappings (path, method)",
+    "CREATE INDEX IF NOT EXISTS mappings_connector ON mappings (connector_id)",
+    "CREATE INDEX IF NOT EXISTS mappings_query ON mappings (query_id)",
+    "CREATE INDEX IF NOT EXISTS queries_connector ON queries (connector_id)",
+]
+
+
+class DuplicateKey(ValueError):
+    pass
+
+
+class SqliteBackend:
+    """
+    Metadata tables in one SQLite database in WAL mode, so readers in other worker processes
+    are never blocked by a writer and each mutation touches only its own rows.
+
+    All access goes through one connection guarded by a re-entrant lock. `transaction()`
+    groups several table operations into one atomic commit; operations outside it commit
+    individually. Every commit bumps the changed tables' rows in `_versions`, which is how
+    the per-table caches (and other processes) notice changes.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._touched = set()
+        self._tables: Dict[str, "SqliteTable"] = {}
+        with self._lock:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS _versions (name TEXT PRIMARY KEY, version INTEGER NOT NULL)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS _meta (key TEXT PRIMARY KEY, value TEXT)")
+            for name, columns in TABLES.items():
+                extra = "".join(f", {col} {kind}" for col, kind in columns.items())
+                self._conn.execute(f"CREATE TABLE IF NOT EXISTS {name} (seq INTEGER PRIMARY KEY AUTOINCREMENT, "
+                                   f"id TEXT NOT NULL UNIQUE, data TEXT NOT NULL{extra})")
+                self._conn.execute("INSERT OR IGNORE INTO _versions (name, version) VALUES (?, 0)", (name,))
+            for ddl in _INDEXES:
+                self._conn.execute(ddl)
+
+    def table(self, name: str, indexes: dict) -> "SqliteTable":
+        table = SqliteTable(self, name, indexes)
+        self._tables[name] = table
+        return table
+
+    @contextmanager
+    def transaction(self):
+        """Run the enclosed table operations as one transaction (nested calls join the outer one)."""
+        with self._lock:
+            if self._depth == 0:
+                self._conn.execute("BEGIN IMMEDIATE")
+                self._touched = set()
+            self._depth += 1
+            try:
+                yield self._conn
+            except BaseException:
+                self._depth -= 1
+                if self._depth == 0:
+                    self._conn.execute("ROLLBACK")
+                    self._expire(self._touched)
+                raise
+            self._depth -= 1
+            if self._depth == 0:
+                for name in self._touched:
+                    self._conn.execute("UPDATE _versions SET version = version + 1 WHERE name = ?", (name,))
+                self._conn.execute("COMMIT")
+                self._expire(self._touched)
+
+    def _expire(self, names) -> None:
+        for name in names:
+            table = self._tables.get(name)
+            if table is not None:
+                table.expire()
+
+    def version(self, name: str) -> int:
+        with self._lock:
+            row = self._conn.execute("SELECT version FROM _versions WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else 0
+
+    def get_meta(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM _meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key: str, value: str) -> None:
+        with self.transaction() as conn:
+            conn.execute("INSERT OR REPLACE INTO _meta (key, value) VALUES (?, ?)", (key, value))
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class SqliteTable:
+    """One metadata table with the same interface as storage's JSON tables.
+
+    Records are cached in memory with in-process indexes, like the JSON tables, and reloaded
+    when the table's version changes (checked at most every `check_interval` seconds).
+    Cached records are shared and must be treated as read-only.
+    """
+
+    check_interval = float(os.environ.get("METADATA_CHECK_INTERVAL", "1.0"))
+
+    def __init__(self, backend: SqliteBackend, name: str, indexes: dict):
+        self._backend = backend
+        self.name = name
+        self._columns = list(TABLES[name])
+        self._index_keys = indexes
+        self._lock = threading.Lock()
+        self._rows = None
+        self._indexes = {}
+        self._version = None
+        self._checked_at = 0.0
+
+    # --- cache ---
+
+    def _load_locked(self, version: int) -> None:
+        with self._backend._lock:
+            rows = [json.loads(d) for (d,) in self._backend._conn.execute(f"SELECT data FROM {self.name} ORDER BY seq")]
+        self._rows = rows
+        self._indexes = {}
+        for index, keyfunc in self._index_keys.items():
+            idx = {}
+            for r in rows:
+                idx.setdefault(keyfunc(r), r)
+            self._indexes[index] = idx
+        self._version = version
+        self._checked_at = time.monotonic()
+
+    def _fresh(self) -> None:
+        now = time.monotonic()
+        if self._rows is not None and now - self._checked_at < self.check_interval:
+            return
+        with self._lock:
+            version = self._backend.version(self.name)
+            if self._rows is None or version != self._version:
+                self._load_locked(version)
+            else:
+                self._checked_at = now
+
+    def rows(self) -> list:
+        self._fresh()
+        return self._rows
+
+    def get(self, index: str, key):
+        self._fresh()
+        return self._indexes[index].get(key)
+
+    def expire(self) -> None:
+        self._checked_at = 0.0
+
+    def signature(self):
+        """Change token of the cached rows (compare for equality only)."""
+        return ("sqlite", self.name, self._version)
+
+    def current_signature(self):
+        return ("sqlite", self.name, self._backend.version(self.name))
+
+    # --- writes ---
+
+    def _values(self, rec: dict) -> tuple:
+        return (rec.get("id"), json.dumps(rec, ensure_ascii=False)) + tuple(rec.get(c) for c in self._columns)
+
+    def _insert_sql(self) -> str:
+        cols = ["id", "data"] + self._columns
+        return f"INSERT INTO {self.name} ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))})"
+
+    def _touch(self) -> None:
+        self._backend._touched.add(self.name)
+
+    def write(self, data: list) -> None:
+        """Replace the whole table."""
+        with self._backend.transaction() as conn:
+            conn.execute(f"DELETE FROM {self.name}")
+            conn.executemany(self._insert_sql(), [self._values(r) for r in data])
+            self._touch()
+
+    def insert(self, rec: dict) -> None:
+        with self._backend.transaction() as conn:
+            try:
+                conn.execute(self._insert_sql(), self._values(rec))
+            except sqlite3.IntegrityError as e:
+                raise DuplicateKey(str(e))
+            self._touch()
+
+    def _load_record(self, conn, record_id: str) -> Optional[dict]:
+        row = conn.execute(f"SELECT data FROM {self.name} WHERE id = ?", (record_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _store(self, conn, rec: dict) -> None:
+        sets = ", ".join(f"{c} = ?" for c in ["data"] + self._columns)
+        values = self._values(rec)[1:]
+        try:
+            conn.execute(f"UPDATE {self.name} SET {sets} WHERE id = ?", values + (rec.get("id"),))
+        except sqlite3.IntegrityError as e:
+            raise DuplicateKey(str(e))
+
+    def update(self, record_id: str, fn: Callable[[dict], None]) -> Optional[dict]:
+        """Apply `fn` to a copy of the record and store it. Returns the updated record, or None if missing."""
+        with self._backend.transaction() as conn:
+            rec = self._load_record(conn, record_id)
+            if rec is None:
+                return None
+            fn(rec)
+            self._store(conn, rec)
+            self._touch()
+        return self.get("id", record_id)
+
+    def update_where(self, field: str, value, changes: dict) -> int:
+        """Merge `changes` into every record whose `field` equals `value`. Returns the number changed."""
+        with self._backend.transaction() as conn:
+            if field in self._columns or field == "id":
+                found = conn.execute(f"SELECT data FROM {self.name} WHERE {field} = ?", (value,)).fetchall()
+                records = [json.loads(d) for (d,) in found]
+            else:
+                records = [r for r in (json.loads(d) for (d,) in conn.execute(f"SELECT data FROM {self.name}")) if r.get(field) == value]
+            for rec in records:
+                rec.update(changes)
+                self._store(conn, rec)
+            if records:
+                self._touch()
+        return len(records)
+
+    def delete(self, record_id: str) -> bool:
+        with self._backend.transaction() as conn:
+            deleted = conn.execute(f"DELETE FROM {self.name} WHERE id = ?", (record_id,)).rowcount
+            if deleted:
+                self._touch()
+        return bool(deleted)
+
+
+def migrate_from_json(backend: SqliteBackend, files: Dict[str, str], read_json: Callable[[str], list], force: bool = False) -> Dict[str, int]:
+    """Import the JSON metadata files ({table: path}) into the database in one transaction.
+
+    Runs once: the import time is recorded in `_meta` and later calls are no-ops unless `force`
+    (which replaces the tables' contents). Tables that already have rows are left alone.
+    The JSON files are not modified, so switching back to the JSON backend keeps the old state.
+    """
+    if backend.get_meta("migrated_from_json") and not force:
+        return {}
+    counts = {}
+    with backend.transaction() as conn:
+        for name, path in files.items():
+            rows = [r for r in read_json(path) if isinstance(r, dict) and r.get("id")]
+            table = backend._tables.get(name)
+            if table is None or not rows:
+                continue
+            if not force and conn.execute(f"SELECT 1 FROM {name} LIMIT 1").fetchone():
+                continue
+            conn.execute(f"DELETE FROM {name}")
+            seen = set()
+            for rec in rows:
+                if rec["id"] in seen:
+                    continue
+                seen.add(rec["id"])
+                values = table._values(copy.deepcopy(rec))
+                # the route index is unique; keep the first mapping registered for a path + method
+                conn.execute(table._insert_sql().replace("INSERT", "INSERT OR IGNORE", 1), values)
+            table._touch()
+            counts[name] = len(seen)
+        conn.execute("INSERT OR REPLACE INTO _meta (key, value) VALUES (?, ?)",
+                     ("migrated_from_json", datetime.now(timezone.utc).isoformat()))
+    return counts
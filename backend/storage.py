@@ -1,9 +1,25 @@
 import os
+import copy
 import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
 from typing import List
 from uuid import uuid4
 from datetime import datetime, timezone
 
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+import metrics
+from log_writer import LogWriter
+from schema_store import SchemaStore
+
 METADATA_DIR = os.environ.get("METADATA_DIR", os.path.join(os.path.dirname(__file__), "metadata"))
 CONNECTORS_FILE = os.path.join(METADATA_DIR, "connectors.json")
 
@@ -21,26 +37,402 @@ def _read_json(filepath: str) -> list:
         except Exception:
             return []
 
-def _write_json_atomic(filepath: str, data: list):
+def _write_json_atomic(filepath: str, data: list, label: str | None = None):
+    """Write `data` to `filepath` via a temp file + rename, timed under `label` (default: the file name).
+
+    Callers writing files with generated names must pass a fixed label to keep the metric bounded.
+    """
+    ensure_metadata_dir()
+    # per-writer temp name: several worker processes may write the same file
+    tmp = f"{filepath}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with metrics.timed_storage_write(label or os.path.basename(filepath)):
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, filepath)
+
+
+# How often (seconds) a cached table stats its file for out-of-process edits; 0 checks on every access.
+METADATA_CHECK_INTERVAL = float(os.environ.get("METADATA_CHECK_INTERVAL", "1.0"))
+# JSON tables: mutations arriving within this many seconds of a commit starting share its rewrite + fsync.
+METADATA_COMMIT_WINDOW = float(os.environ.get("METADATA_COMMIT_WINDOW", "0.002"))
+
+
+@contextmanager
+def _file_lock(filepath: str):
+    """Exclusive lock on `<file>.lock`, held across processes (flock on POSIX, msvcrt on Windows)."""
     ensure_metadata_dir()
-    tmp = filepath + ".tmp"
-    with open(tmp, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
-        f.flush()
-        os.fsync(f.fileno())
-    os.replace(tmp, filepath)
+    with open(filepath + ".lock", "a+") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _fsync_dir(filepath: str) -> None:
+    # makes the rename itself durable; directories can't be opened for fsync on Windows
+    if os.name != "posix":
+        return
+    fd = os.open(os.path.dirname(filepath) or ".", os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _file_signature(filepath: str):
+    try:
+        st = os.stat(filepath)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+class _JsonTable:
+    """In-memory copy of one metadata JSON array, indexed for O(1) lookups.
+
+    Loaded on first use, replaced on every write made through this module and reloaded
+    when the file's mtime/size changes on disk (checked at most every METADATA_CHECK_INTERVAL).
+    Records returned by `rows()` and `get()` are shared and must be treated as read-only;
+    the public read_* helpers hand out copies for read-modify-write callers.
+    """
+
+    def __init__(self, filepath: str, indexes: dict, unique: dict | None = None):
+        self.filepath = filepath
+        self._index_keys = indexes
+        # name -> key function whose values must be distinct (checked on insert)
+        self._unique = unique or {}
+        # group commit state (see _mutate)
+        self._commit_cond = threading.Condition()
+        self._pending = []
+        self._committing = False
+        self.commits = 0
+        self.committed_ops = 0
+        self._lock = threading.Lock()
+        self._rows = None
+        self._indexes = {}
+        self._signature = None
+        self._checked_at = 0.0
+        self.generation = 0
+
+    def _load_locked(self, rows: list, signature) -> None:
+        self._rows = rows
+        self._indexes = {}
+        for name, keyfunc in self._index_keys.items():
+            idx = {}
+            for r in rows:
+                idx.setdefault(keyfunc(r), r)
+            self._indexes[name] = idx
+        self._signature = signature
+        self._checked_at = time.monotonic()
+        self.generation += 1
+
+    def _fresh(self) -> None:
+        now = time.monotonic()
+        if self._rows is not None and now - self._checked_at < METADATA_CHECK_INTERVAL:
+            return
+        with self._lock:
+            signature = _file_signature(self.filepath)
+            if self._rows is None or signature != self._signature:
+                self._load_locked(_read_json(self.filepath), signature)
+            else:
+                self._checked_at = now
+
+    def rows(self) -> list:
+        self._fresh()
+        return self._rows
+
+    def get(self, index: str, key):
+        self._fresh()
+        return self._indexes[index].get(key)
+
+    def expire(self) -> None:
+        """Make the next access re-check the file instead of trusting the cache until the interval ends."""
+        self._checked_at = 0.0
+
+    def signature(self):
+        """File signature the cached rows were loaded from (None if the file did not exist)."""
+        return self._signature
+
+    def current_signature(self):
+        return _file_signature(self.filepath)
+
+    def write(self, data: list) -> None:
+        """Replace the whole table."""
+        def replace(rows):
+            rows[:] = copy.deepcopy(data)
+            return None, True
+        self._mutate(replace)
+
+    # Record-level mutations share the table interface with sqlite_metadata.SqliteTable. Here they
+    # are group-committed: concurrent callers queue their change, one of them (the leader) waits
+    # METADATA_COMMIT_WINDOW for more, then applies the whole batch to the file as read under a
+    # cross-process lock and writes it once with a single fsync. Every caller returns only after
+    # the rewrite that contains its change is durable.
+
+    def _mutate(self, fn):
+        op = {"fn": fn, "done": False}
+        with self._commit_cond:
+            self._pending.append(op)
+            while not op["done"] and self._committing:
+                self._commit_cond.wait()
+            leader = not op["done"]
+            if leader:
+                self._committing = True
+        if leader:
+            try:
+                self._commit()
+            finally:
+                with self._commit_cond:
+                    self._committing = False
+                    self._commit_cond.notify_all()
+        if "error" in op:
+            raise op["error"]
+        return op.get("result")
+
+    def _commit(self) -> None:
+        if METADATA_COMMIT_WINDOW > 0:
+            time.sleep(METADATA_COMMIT_WINDOW)
+        with self._commit_cond:
+            batch, self._pending = self._pending, []
+        try:
+            with _file_lock(self.filepath):
+                rows = _read_json(self.filepath)
+                changed = False
+                for op in batch:
+                    try:
+                        op["result"], op_changed = op["fn"](rows)
+                        changed = changed or op_changed
+                    except Exception as e:
+                        op["error"] = e
+                if changed:
+                    with self._lock:
+                        _write_json_atomic(self.filepath, rows)
+                        _fsync_dir(self.filepath)
+                        self._load_locked(rows, _file_signature(self.filepath))
+                    self.commits += 1
+                    self.committed_ops += len(batch)
+        except Exception as e:
+            for op in batch:
+                op.setdefault("error", e)
+        finally:
+            with self._commit_cond:
+                for op in batch:
+                    op["done"] = True
+                self._commit_cond.notify_all()
+
+    def insert(self, rec: dict) -> None:
+        def fn(rows):
+            for name, keyfunc in self._unique.items():
+                key = keyfunc(rec)
+                if any(keyfunc(r) == key for r in rows):
+                    raise DuplicateKey(f"duplicate {name}: {key}")
+            rows.append(copy.deepcopy(rec))
+            return None, True
+        self._mutate(fn)
+
+    def update(self, record_id: str, fn) -> dict | None:
+        """Apply `fn` to a copy of the record and store it. Returns the updated record, or None if missing."""
+        def apply(rows):
+            for r in rows:
+                if r.get("id") == record_id:
+                    fn(r)
+                    return True, True
+            return False, False
+        if not self._mutate(apply):
+            return None
+        return self.get("id", record_id)
+
+    def update_where(self, field: str, value, changes: dict) -> int:
+        """Merge `changes` into every record whose `field` equals `value`. Returns the number changed."""
+        def apply(rows):
+            n = 0
+            for r in rows:
+                if r.get(field) == value:
+                    r.update(changes)
+                    n += 1
+            return n, n > 0
+        return self._mutate(apply)
+
+    def delete(self, record_id: str) -> bool:
+        def apply(rows):
+            keep = [r for r in rows if r.get("id") != record_id]
+            found = len(keep) != len(rows)
+            rows[:] = keep
+            return found, found
+        return self._mutate(apply)
+
+
+class DuplicateKey(ValueError):
+    pass
+
+
+# serializes multi-table JSON transactions within this process (single mutations group-commit per file)
+_json_write_lock = threading.RLock()
+
+
+class _JsonBackend:
+    """Whole-file JSON arrays, one per table, fine for small setups. Writes to each file are
+    group-committed under a cross-process file lock; transactions only keep multi-table updates
+    from interleaving within this process and are not atomic across files."""
+
+    def __init__(self):
+        self._tables = {}
+
+    def table(self, name: str, filepath: str, indexes: dict, unique: dict | None = None) -> _JsonTable:
+        table = _JsonTable(filepath, indexes, unique)
+        self._tables[name] = table
+        return table
+
+    def write_stats(self) -> dict:
+        """Group-commit counters per file: rewrites done and mutations they carried."""
+        return {os.path.basename(t.filepath): {"commits": t.commits, "ops": t.committed_ops}
+                for t in list(self._tables.values())}
+
+    @contextmanager
+    def transaction(self):
+        with _json_write_lock:
+            yield None
+
+
+def _by_id(rec: dict):
+    return rec.get("id")
+
+
+# Metadata backend: "json" (default; one JSON file per table) or "sqlite" (metadata.db in WAL mode).
+METADATA_BACKEND = os.environ.get("METADATA_BACKEND", "json").lower()
+METADATA_DB_FILE = os.path.join(METADATA_DIR, "metadata.db")
+
+if METADATA_BACKEND == "sqlite":
+    import sqlite_metadata
+    _backend = sqlite_metadata.SqliteBackend(METADATA_DB_FILE)
+else:
+    _backend = _JsonBackend()
+    metrics.register_collector("metadata_writes", _backend.write_stats, label="file")
+
+
+def _table(name: str, filepath: str, indexes: dict, unique: dict | None = None):
+    if METADATA_BACKEND == "sqlite":
+        return _backend.table(name, indexes)
+    return _backend.table(name, filepath, indexes, unique)
+
+
+def transaction():
+    """Context manager grouping metadata writes (e.g. delete a query and invalidate its mappings)."""
+    return _backend.transaction()
+
+
+# Metadata generation: a counter file bumped after every connector / query / mapping write, so
+# other worker processes can tell cheaply (one stat) that they need to reconcile their routes.
+GENERATION_FILE = os.path.join(METADATA_DIR, "generation")
+
+
+def _bump_generation() -> None:
+    current, _ = metadata_generation()
+    tmp = f"{GENERATION_FILE}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(str(current + 1))
+        os.replace(tmp, GENERATION_FILE)
+    except OSError:
+        pass
+
+
+def metadata_generation():
+    """(generation number, file signature). Compare signatures to detect changes: each bump replaces
+    the file, so even two concurrent bumps that write the same number are seen as a change."""
+    signature = _file_signature(GENERATION_FILE)
+    if signature is None:
+        return 0, None
+    try:
+        with open(GENERATION_FILE, "r", encoding="utf-8") as f:
+            return int(f.read().strip() or 0), signature
+    except (OSError, ValueError):
+        return 0, signature
+
+
+def expire_metadata_cache() -> None:
+    """Force connectors, queries and mappings to be re-checked against their files on next access."""
+    for table in (_connectors, _queries, _mappings):
+        table.expire()
+
+
+# Callbacks invoked with a connector id whenever its URL/pool settings change or it is deleted.
+_connector_listeners = []
+
+
+def add_connector_listener(callback) -> None:
+    if callback not in _connector_listeners:
+        _connector_listeners.append(callback)
+
+
+def _notify_connector_changed(connector_id: str) -> None:
+    for cb in list(_connector_listeners):
+        try:
+            cb(connector_id)
+        except Exception:
+            continue
+
+
+_POOL_OPTION_KEYS = {"pool_size", "max_overflow", "pool_recycle", "pool_timeout", "pool_pre_ping"}
+
+
+def _validate_pool_options(pool) -> dict:
+    if pool is None:
+        return {}
+    if not isinstance(pool, dict):
+        raise ValueError("pool must be an object")
+    unknown = set(pool) - _POOL_OPTION_KEYS
+    if unknown:
+        raise ValueError(f"unknown pool option(s): {', '.join(sorted(unknown))}")
+    for k, v in pool.items():
+        if k == "pool_pre_ping":
+            if not isinstance(v, bool):
+                raise ValueError("pool_pre_ping must be a boolean")
+        elif isinstance(v, bool) or not isinstance(v, int) or v < -1:
+            raise ValueError(f"{k} must be an integer")
+    return dict(pool)
+
+
+def _validate_statement_timeout(timeout_ms) -> int | None:
+    if timeout_ms is None:
+        return None
+    if isinstance(timeout_ms, bool) or not isinstance(timeout_ms, int) or timeout_ms < 0:
+        raise ValueError("statement_timeout_ms must be a non-negative integer (milliseconds)")
+    return timeout_ms or None
+
+
+_connectors = _table("connectors", CONNECTORS_FILE, {"id": _by_id})
+
 
 def read_connectors() -> List[dict]:
-    return _read_json(CONNECTORS_FILE)
+    return copy.deepcopy(_connectors.rows())
 
 def write_connectors_atomic(data: List[dict]):
-    _write_json_atomic(CONNECTORS_FILE, data)
+    _connectors.write(data)
+    _bump_generation()
 
 
-def add_connector_entry(name: str, sqlalchemy_url: str) -> str:
+def add_connector_entry(name: str, sqlalchemy_url: str, pool: dict | None = None, statement_timeout_ms: int | None = None) -> str:
     if not sqlalchemy_url:
         raise ValueError("sqlalchemy_url is required")
-    connectors = read_connectors()
+    pool = _validate_pool_options(pool)
+    statement_timeout_ms = _validate_statement_timeout(statement_timeout_ms)
     new_id = uuid4().hex
     entry = {
         "id": new_id,
@@ -48,38 +440,56 @@ def add_connector_entry(name: str, sqlalchemy_url: str) -> str:
         "sqlalchemy_url": sqlalchemy_url,
         "created_at": datetime.now(timezone.utc).isoformat(),
     }
-    connectors.append(entry)
-    write_connectors_atomic(connectors)
+    if pool:
+        entry["pool"] = pool
+    if statement_timeout_ms:
+        entry["statement_timeout_ms"] = statement_timeout_ms
+    _connectors.insert(entry)
+    _bump_generation()
     return new_id
 
 
 def get_connector_by_id(connector_id: str) -> dict | None:
-    connectors = read_connectors()
-    for c in connectors:
-        if c.get("id") == connector_id:
-            return c
-    return None
-
-
-def update_connector(connector_id: str, name: str | None = None, sqlalchemy_url: str | None = None) -> dict | None:
-    """Update connector fields and write back atomically. Returns updated entry or None if not found."""
-    connectors = read_connectors()
-    changed = False
-    for i, c in enumerate(connectors):
-        if c.get("id") == connector_id:
-            if name is not None:
-                c["name"] = name
-                changed = True
-            if sqlalchemy_url is not None:
-                c["sqlalchemy_url"] = sqlalchemy_url
-                changed = True
-            connectors[i] = c
-            break
-    else:
+    """Cached connector record (read-only) or None."""
+    return _connectors.get("id", connector_id)
+
+
+def update_connector(connector_id: str, name: str | None = None, sqlalchemy_url: str | None = None, pool: dict | None = None,
+                     statement_timeout_ms: int | None = None) -> dict | None:
+    """Update connector fields and write back atomically. Returns updated entry or None if not found.
+    A statement_timeout_ms of 0 removes the connector's default timeout."""
+    if pool is not None:
+        pool = _validate_pool_options(pool)
+    if statement_timeout_ms is not None:
+        statement_timeout_ms = _validate_statement_timeout(statement_timeout_ms) or 0
+    changes = {}
+
+    def apply(c):
+        if name is not None:
+            c["name"] = name
+        if sqlalchemy_url is not None:
+            changes["engine"] = changes.get("engine") or c.get("sqlalchemy_url") != sqlalchemy_url
+            c["sqlalchemy_url"] = sqlalchemy_url
+        if pool is not None:
+            changes["engine"] = changes.get("engine") or (c.get("pool") or {}) != pool
+            if pool:
+                c["pool"] = pool
+            else:
+                c.pop("pool", None)
+        if statement_timeout_ms is not None:
+            if statement_timeout_ms:
+                c["statement_timeout_ms"] = statement_timeout_ms
+            else:
+                c.pop("statement_timeout_ms", None)
+
+    if name is None and sqlalchemy_url is None and pool is None and statement_timeout_ms is None:
+        return get_connector_by_id(connector_id)
+    c = _connectors.update(connector_id, apply)
+    if c is None:
         return None
-
-    if changed:
-        write_connectors_atomic(connectors)
+    _bump_generation()
+    if changes.get("engine"):
+        _notify_connector_changed(connector_id)
     return c
 
 
@@ -87,90 +497,66 @@ def delete_connector(connector_id: str) -> bool:
     """Delete connector by id. Also marks any mappings that reference this connector as invalid (if mappings.json exists).
     Returns True if a connector was deleted, False otherwise.
     """
-    connectors = read_connectors()
-    new_connectors = [c for c in connectors if c.get("id") != connector_id]
-    if len(new_connectors) == len(connectors):
-        return False
+    with transaction():
+        if not _connectors.delete(connector_id):
+            return False
+        # mark mappings invalid in the same transaction
+        invalidated = _mappings.update_where("connector_id", connector_id, {"connector_valid": False, "deployed": False})
+    if invalidated:
+        _mappings_changed()
+    _bump_generation()
+    _notify_connector_changed(connector_id)
+    _schema_store.drop_connector(connector_id)
+    return True
 
-    write_connectors_atomic(new_connectors)
 
-    # try to mark mappings invalid
-    mappings_file = os.path.join(METADATA_DIR, "mappings.json")
-    if os.path.exists(mappings_file):
-        try:
-            with open(mappings_file, "r", encoding="utf-8") as f:
-                mappings = json.load(f)
-        except Exception:
-            mappings = []
-
-        changed = False
-        for m in mappings:
-            if m.get("connector_id") == connector_id:
-                m["connector_valid"] = False
-                m["deployed"] = False
-                changed = True
-
-        if changed:
-            tmp = mappings_file + ".tmp"
-            with open(tmp, "w", encoding="utf-8") as f:
-                json.dump(mappings, f, indent=2, ensure_ascii=False)
-                f.flush()
-                os.fsync(f.fileno())
-            os.replace(tmp, mappings_file)
+SCHEMAS_DIR = os.path.join(METADATA_DIR, "schemas")
+LEGACY_SCHEMAS_FILE = os.path.join(METADATA_DIR, "schemas.json")
+SCHEMA_OBJECTS_DIR = os.path.join(SCHEMAS_DIR, "objects")
 
-    return True
 
+def _write_schema_json(filepath: str, data) -> None:
+    # schema files are named by content hash / connector id: one metric label per kind
+    kind = "schema_object" if filepath.startswith(SCHEMA_OBJECTS_DIR + os.sep) else "schema_manifest"
+    _write_json_atomic(filepath, data, label=kind)
 
-def write_schema_snapshot(connector_id: str, snapshot: dict) -> dict:
-    """Append a new schema snapshot entry to schemas.json and return the saved record."""
-    schemas_file = os.path.join(METADATA_DIR, "schemas.json")
-    if os.path.exists(schemas_file):
-        try:
-            with open(schemas_file, "r", encoding="utf-8") as f:
-                data = json.load(f)
-        except Exception:
-            data = []
-    else:
-        data = []
 
-    record = {
-        "id": uuid4().hex,
-        "connector_id": connector_id,
-        "snapshot": snapshot,
-        "created_at": datetime.now(timezone.utc).isoformat(),
-    }
-    data.append(record)
+_schema_store = SchemaStore(SCHEMAS_DIR, _write_schema_json, legacy_file=LEGACY_SCHEMAS_FILE,
+                            file_lock=lambda: _file_lock(SCHEMAS_DIR))
 
-    tmp = schemas_file + ".tmp"
-    with open(tmp, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
-        f.flush()
-        os.fsync(f.fileno())
-    os.replace(tmp, schemas_file)
 
-    return record
+def write_schema_snapshot(connector_id: str, snapshot: dict) -> dict:
+    """Save a schema snapshot for a connector and return the saved record.
+    Unchanged tables are shared with earlier snapshots; an identical snapshot returns the existing record."""
+    return _schema_store.write(connector_id, snapshot, uuid4().hex, datetime.now(timezone.utc).isoformat())
 
 
 def read_schemas() -> list:
-    schemas_file = os.path.join(METADATA_DIR, "schemas.json")
-    if not os.path.exists(schemas_file):
-        return []
-    try:
-        with open(schemas_file, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception:
-        return []
+    """All retained snapshot records (every connector, fully resolved). Prefer get_latest_schema_snapshot."""
+    return _schema_store.records()
+
+
+def get_latest_schema_snapshot(connector_id: str) -> dict | None:
+    """Return the most recent discovered snapshot for a connector, or None."""
+    return _schema_store.latest(connector_id)
 
 
 # --- queries storage ---
 QUERIES_FILE = os.path.join(METADATA_DIR, "queries.json")
+_queries = _table("queries", QUERIES_FILE, {"id": _by_id})
 
 
 def read_queries() -> list:
-    return _read_json(QUERIES_FILE)
+    return copy.deepcopy(_queries.rows())
 
 def write_queries_atomic(data: list):
-    _write_json_atomic(QUERIES_FILE, data)
+    _queries.write(data)
+    _bump_generation()
+
+
+def get_query_by_id(query_id: str) -> dict | None:
+    """Cached query record (read-only) or None."""
+    return _queries.get("id", query_id)
 
 
 def add_query_entry(connector_id: str, name: str, sql_text: str, is_proc: bool = False, description: str | None = None):
@@ -179,7 +565,6 @@ def add_query_entry(connector_id: str, name: str, sql_text: str, is_proc: bool =
     if not get_connector_by_id(connector_id):
         raise ValueError("connector_id not found")
 
-    queries = read_queries()
     qid = str(uuid4())
     record = {
         "id": qid,
@@ -190,50 +575,56 @@ def add_query_entry(connector_id: str, name: str, sql_text: str, is_proc: bool =
         "description": description or "",
         "created_at": datetime.now(timezone.utc).isoformat()
     }
-    queries.append(record)
-    write_queries_atomic(queries)
+    _queries.insert(record)
+    _bump_generation()
     return qid
 
 
 def delete_query(query_id: str):
     """Delete query and mark any referencing mappings as invalid."""
     ensure_metadata_dir()
-    queries = read_queries()
-    idx = -1
-    for i, q in enumerate(queries):
-        if q.get("id") == query_id:
-            idx = i
-            break
-    if idx == -1:
-        return False
-    
-    queries.pop(idx)
-    write_queries_atomic(queries)
-
-    # Invalidate mappings referencing this query
-    if os.path.exists(MAPPINGS_FILE):
-        mappings = read_mappings()
-        changed = False
-        for m in mappings:
-            if m.get("query_id") == query_id:
-                m["invalidated"] = True
-                m["deployed"] = False
-                changed = True
-        if changed:
-            write_mappings_atomic(mappings)
-
+    with transaction():
+        if not _queries.delete(query_id):
+            return False
+        # Invalidate mappings referencing this query, atomically with the delete
+        invalidated = _mappings.update_where("query_id", query_id, {"invalidated": True, "deployed": False})
+    if invalidated:
+        _mappings_changed()
+    _bump_generation()
     return True
 
 
 # --- mappings storage ---
+def _route_key(m: dict):
+    return (m.get("path"), m.get("method"))
+
+
 MAPPINGS_FILE = os.path.join(METADATA_DIR, "mappings.json")
+_mappings = _table("mappings", MAPPINGS_FILE, {"id": _by_id, "route": _route_key}, unique={"route": _route_key})
 
 
 def read_mappings() -> list:
-    return _read_json(MAPPINGS_FILE)
+    return copy.deepcopy(_mappings.rows())
 
 def write_mappings_atomic(data: list):
-    _write_json_atomic(MAPPINGS_FILE, data)
+    _mappings.write(data)
+    _mappings_changed()
+
+
+def _mappings_changed() -> None:
+    """Refresh the routes manifest and tell other workers after any mapping write."""
+    _write_routes_manifest(_mappings.rows(), _mappings.signature())
+    _bump_generation()
+
+
+def get_mapping_by_id(mapping_id: str) -> dict | None:
+    """Cached mapping record (read-only) or None."""
+    return _mappings.get("id", mapping_id)
+
+
+def get_mapping_by_route(path: str, method: str) -> dict | None:
+    """Cached mapping record (read-only) registered for path + method, or None."""
+    return _mappings.get("route", (path, method.upper()))
 
 
 def _validate_params_json(params_json) -> bool:
@@ -254,7 +645,16 @@ def _validate_params_json(params_json) -> bool:
     return True
 
 
-def add_mapping_entry(query_id: str, connector_id: str, path: str, method: str, params_json: list, auth_required: bool = True) -> str:
+def _validate_cache_ttl(cache_ttl) -> int | None:
+    if cache_ttl is None:
+        return None
+    if isinstance(cache_ttl, bool) or not isinstance(cache_ttl, int) or cache_ttl < 0:
+        raise ValueError("cache_ttl must be a non-negative integer (seconds)")
+    return cache_ttl or None
+
+
+def add_mapping_entry(query_id: str, connector_id: str, path: str, method: str, params_json: list, auth_required: bool = True,
+                      cache_ttl: int | None = None, statement_timeout_ms: int | None = None) -> str:
     """Add a mapping, validating uniqueness of path+method and params_json shape."""
     # basic checks
     if not path or not path.startswith("/"):
@@ -265,19 +665,18 @@ def add_mapping_entry(query_id: str, connector_id: str, path: str, method: str,
 
     if not _validate_params_json(params_json):
         raise ValueError("params_json malformed")
+    cache_ttl = _validate_cache_ttl(cache_ttl)
+    statement_timeout_ms = _validate_statement_timeout(statement_timeout_ms)
 
     # ensure connector and query exist
     if not get_connector_by_id(connector_id):
         raise ValueError("connector_id not found")
-    queries = read_queries()
-    if not any(q.get("id") == query_id for q in queries):
+    if not get_query_by_id(query_id):
         raise ValueError("query_id not found")
 
-    mappings = read_mappings()
     # path uniqueness (path + method)
-    for m in mappings:
-        if m.get("path") == path and m.get("method") == method_u:
-            raise ValueError("path already in use for this method")
+    if get_mapping_by_route(path, method_u):
+        raise ValueError("path already in use for this method")
 
     new_id = uuid4().hex
     entry = {
@@ -288,97 +687,166 @@ def add_mapping_entry(query_id: str, connector_id: str, path: str, method: str,
         "method": method_u,
         "params_json": params_json,
         "auth_required": bool(auth_required),
+        "cache_ttl": cache_ttl,
+        "statement_timeout_ms": statement_timeout_ms,
         "deployed": False,
         "created_at": datetime.now(timezone.utc).isoformat(),
     }
-    mappings.append(entry)
-    write_mappings_atomic(mappings)
+    try:
+        _mappings.insert(entry)
+    except ValueError:
+        # lost a race with a concurrent add for the same route
+        raise ValueError("path already in use for this method")
+    _mappings_changed()
     return new_id
 
 
 def set_mapping_deployed(mapping_id: str, deployed: bool = True):
+    """Set a mapping's deployed flag. Returns the (read-only) updated record, or None."""
     ensure_metadata_dir()
-    mappings = read_mappings()
-    for m in mappings:
-        if m.get("id") == mapping_id:
-            m["deployed"] = deployed
-            write_mappings_atomic(mappings)
-            return m
-    return None
+    m = _mappings.update(mapping_id, lambda rec: rec.__setitem__("deployed", deployed))
+    if m is not None:
+        _mappings_changed()
+    return m
+
+
+def set_mapping_cache_ttl(mapping_id: str, cache_ttl: int | None):
+    """Enable (ttl seconds) or disable (None/0) result caching for a mapping."""
+    cache_ttl = _validate_cache_ttl(cache_ttl)
+    m = _mappings.update(mapping_id, lambda rec: rec.__setitem__("cache_ttl", cache_ttl))
+    if m is not None:
+        _mappings_changed()
+    return m
+
+
+def set_mapping_statement_timeout(mapping_id: str, timeout_ms: int | None):
+    """Set the mapping's statement timeout in ms (None/0: use the connector's)."""
+    timeout_ms = _validate_statement_timeout(timeout_ms)
+    m = _mappings.update(mapping_id, lambda rec: rec.__setitem__("statement_timeout_ms", timeout_ms))
+    if m is not None:
+        _mappings_changed()
+    return m
 
 
 def delete_mapping(mapping_id: str):
     """Delete a mapping entry."""
     ensure_metadata_dir()
-    mappings = read_mappings()
-    idx = -1
-    for i, m in enumerate(mappings):
-        if m.get("id") == mapping_id:
-            idx = i
-            break
-    if idx == -1:
+    if not _mappings.delete(mapping_id):
         return False
-    
-    mappings.pop(idx)
-    write_mappings_atomic(mappings)
+    _mappings_changed()
     return True
 
 
+LOGS_DIR = os.path.join(METADATA_DIR, "logs")
+# pre-JSONL log file; still read, never written
+LEGACY_LOGS_FILE = os.path.join(METADATA_DIR, "logs.json")
+_log_writer = LogWriter(LOGS_DIR)
+
+
 def append_log(record: dict) -> None:
-    """Append a small log record to logs.json."""
-    logs_file = os.path.join(METADATA_DIR, "logs.json")
-    if os.path.exists(logs_file):
-        try:
-            with open(logs_file, "r", encoding="utf-8") as f:
-                data = json.load(f)
-        except Exception:
-            data = []
-    else:
-        data = []
+    """Queue a log record for the background JSONL writer (see log_writer.py)."""
+    _log_writer.append(record)
+
+
+def flush_logs() -> None:
+    """Wait until queued log records are on disk."""
+    _log_writer.flush()
 
-    data.append(record)
 
-    tmp = logs_file + ".tmp"
-    with open(tmp, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
-        f.flush()
-        os.fsync(f.fileno())
-    os.replace(tmp, logs_file)
+def close_logs() -> None:
+    _log_writer.close()
 
 
 def read_logs() -> list:
-    """Read logs.json and return list of records."""
-    logs_file = os.path.join(METADATA_DIR, "logs.json")
-    if not os.path.exists(logs_file):
-        return []
-    try:
-        with open(logs_file, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception:
-        return []
+    """Return all log records, oldest first (legacy logs.json followed by the JSONL segments)."""
+    return _read_json(LEGACY_LOGS_FILE) + list(_log_writer.iter_records())
+
+
+def find_log(request_id: str) -> dict | None:
+    """Return the log record for a request id, searching the newest segments first."""
+    for rec in _log_writer.iter_records(newest_first=True):
+        if rec.get("request_id") == request_id:
+            return rec
+    return next((rec for rec in _read_json(LEGACY_LOGS_FILE) if rec.get("request_id") == request_id), None)
 
 
 def get_deployed_mappings() -> list:
     """Return list of mappings that have deployed=True."""
-    mappings = read_mappings()
-    return [m for m in mappings if m.get("deployed")]
+    return [m for m in read_mappings() if m.get("deployed")]
+
+
+# Compact [id, path, method] list of the deployed mappings, so a starting worker can register its
+# routes without parsing every mapping record. Tagged with the mappings.json signature it was
+# built from and rebuilt whenever that no longer matches.
+ROUTES_MANIFEST_FILE = os.path.join(METADATA_DIR, "routes.manifest.json")
+
+
+def _write_routes_manifest(mappings: list, signature) -> list:
+    routes = [[m.get("id"), m.get("path"), m.get("method", "GET")] for m in mappings if m.get("deployed")]
+    if signature is not None:
+        try:
+            _write_json_atomic(ROUTES_MANIFEST_FILE, {"source": list(signature), "routes": routes})
+        except OSError:
+            pass
+    return routes
+
+
+def get_deployed_routes() -> list:
+    """[(mapping id, path, method)] for deployed mappings, read from the routes manifest when it is current."""
+    signature = _mappings.current_signature()
+    if signature is not None:
+        try:
+            with open(ROUTES_MANIFEST_FILE, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            if manifest.get("source") == list(signature):
+                return [tuple(r) for r in manifest["routes"]]
+        except (OSError, ValueError, AttributeError, KeyError, TypeError):
+            pass
+    rows = _mappings.rows()
+    return [tuple(r) for r in _write_routes_manifest(rows, _mappings.signature())]
 
 
 # --- api keys ---
 API_KEYS_FILE = os.path.join(METADATA_DIR, "api_keys.json")
+_api_keys = _table("api_keys", API_KEYS_FILE, {"id": _by_id})
+
+
+def migrate_json_metadata(force: bool = False) -> dict:
+    """Import the JSON metadata files into the SQLite backend (see sqlite_metadata.migrate_from_json).
+    Returns {table: rows imported}; empty when not using SQLite or already migrated."""
+    if METADATA_BACKEND != "sqlite":
+        return {}
+    files = {"connectors": CONNECTORS_FILE, "queries": QUERIES_FILE, "mappings": MAPPINGS_FILE, "api_keys": API_KEYS_FILE}
+    counts = sqlite_metadata.migrate_from_json(_backend, files, _read_json, force=force)
+    if counts.get("mappings"):
+        _mappings_changed()
+    return counts
+
+
+# first start on the SQLite backend imports any existing JSON metadata once
+migrate_json_metadata()
+
+# Tokens are "<key id>.<secret>": the id is public and selects the one hash to check.
+API_KEY_SEPARATOR = "."
+API_KEY_CACHE_TTL = float(os.environ.get("API_KEY_CACHE_TTL", "300"))
+API_KEY_CACHE_SIZE = int(os.environ.get("API_KEY_CACHE_SIZE", "10000"))
+
+# sha256(token) -> (key record, expires at); only successful verifications are cached
+_api_key_cache = OrderedDict()
+_api_key_cache_lock = threading.Lock()
 
 
 def read_api_keys() -> list:
-    return _read_json(API_KEYS_FILE)
+    return copy.deepcopy(_api_keys.rows())
 
 def write_api_keys_atomic(data: list):
-    _write_json_atomic(API_KEYS_FILE, data)
+    _api_keys.write(data)
 
 
 def add_api_key_entry(role: str = "consumer") -> str:
     """Generate an API key (plaintext returned once) and store only its bcrypt hash.
 
-    Returns the plaintext token.
+    Returns the plaintext token, prefixed with the key id.
     """
     import secrets
     import bcrypt
@@ -386,30 +854,103 @@ def add_api_key_entry(role: str = "consumer") -> str:
     if role not in ("admin", "consumer"):
         raise ValueError("role must be 'admin' or 'consumer'")
 
-    token = secrets.token_urlsafe(32)
-    hashed = bcrypt.hashpw(token.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
-
-    keys = read_api_keys()
     new_id = uuid4().hex
-    entry = {"id": new_id, "role": role, "hash": hashed, "created_at": datetime.now(timezone.utc).isoformat()}
-    keys.append(entry)
-    write_api_keys_atomic(keys)
+    secret = secrets.token_urlsafe(32)
+    token = new_id + API_KEY_SEPARATOR + secret
+    # only the secret part is hashed; the id is public and bcrypt input is capped at 72 bytes
+    hashed = bcrypt.hashpw(secret.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
+
+    entry = {"id": new_id, "role": role, "hash": hashed, "prefixed": True, "created_at": datetime.now(timezone.utc).isoformat()}
+    _api_keys.insert(entry)
     return token
 
 
-def validate_api_key(token: str) -> dict | None:
-    """Return the api key record if token matches a stored hash, else None."""
+def _token_digest(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def _cache_get(digest: str) -> dict | None:
+    with _api_key_cache_lock:
+        hit = _api_key_cache.get(digest)
+        if hit is None:
+            return None
+        rec, expires_at = hit
+        if time.monotonic() >= expires_at:
+            del _api_key_cache[digest]
+            return None
+        _api_key_cache.move_to_end(digest)
+        return rec
+
+
+def _cache_put(digest: str, rec: dict) -> None:
+    if API_KEY_CACHE_TTL <= 0 or API_KEY_CACHE_SIZE <= 0:
+        return
+    with _api_key_cache_lock:
+        _api_key_cache[digest] = (rec, time.monotonic() + API_KEY_CACHE_TTL)
+        _api_key_cache.move_to_end(digest)
+        while len(_api_key_cache) > API_KEY_CACHE_SIZE:
+            _api_key_cache.popitem(last=False)
+
+
+def _cache_evict_key(key_id: str) -> None:
+    with _api_key_cache_lock:
+        for digest in [d for d, (rec, _) in _api_key_cache.items() if rec.get("id") == key_id]:
+            del _api_key_cache[digest]
+
+
+def _checkpw(secret: str, rec: dict) -> bool:
     import bcrypt
 
+    try:
+        return bcrypt.checkpw(secret.encode("utf-8"), rec.get("hash").encode("utf-8"))
+    except Exception:
+        return False
+
+
+def validate_api_key(token: str) -> dict | None:
+    """Return the api key record if token matches a stored hash, else None.
+
+    Prefixed tokens cost at most one bcrypt check (none when cached); legacy tokens
+    without a key id are checked against the legacy hashes only. A cached verification is
+    only trusted while the key is still stored with the same hash, so revocations and role
+    changes made by any process apply as soon as the metadata is reloaded.
+    """
     if not token:
         return None
-    keys = read_api_keys()
-    for k in keys:
-        try:
-            if bcrypt.checkpw(token.encode("utf-8"), k.get("hash").encode("utf-8")):
-                return k
-        except Exception:
-            continue
+    digest = _token_digest(token)
+    rec = _cache_get(digest)
+    if rec is not None:
+        current = _api_keys.get("id", rec.get("id"))
+        if current is not None and current.get("hash") == rec.get("hash"):
+            if current is not rec:
+                _cache_put(digest, current)
+            return current
+        with _api_key_cache_lock:
+            _api_key_cache.pop(digest, None)
+
+    key_id, sep, secret = token.partition(API_KEY_SEPARATOR)
+    if sep:
+        rec = _api_keys.get("id", key_id)
+        candidates = [rec] if rec is not None and rec.get("prefixed") else []
+    else:
+        candidates = [k for k in _api_keys.rows() if not k.get("prefixed")]
+        secret = token
+
+    for k in candidates:
+        if _checkpw(secret, k):
+            _cache_put(digest, k)
+            return k
     return None
 
 
+def list_api_keys() -> list:
+    """Key metadata without hashes."""
+    return [{k: v for k, v in rec.items() if k != "hash"} for rec in _api_keys.rows()]
+
+
+def revoke_api_key(key_id: str) -> bool:
+    """Delete an API key and drop any cached verification for it. Returns False if not found."""
+    if not _api_keys.delete(key_id):
+        return False
+    _cache_evict_key(key_id)
+    return True
@@ -0,0 +1,78 @@
+"""Compare the old per-cell result serialization with the column-converter / orjson path.
+
+Usage (PowerShell):
+    .\.venv\Scripts\python.exe .\scripts\bench_serialization.py [rows] [repeats]
+
+Builds a synthetic wide page (ints, floats, text, datetimes, decimals, bytes, UUIDs) and times:
+ - legacy: {k: _to_json_safe(v)} per row + FastAPI jsonable_encoder + JSONResponse
+ - objects: serializer.rows_as_dicts + serializer.dumps
+ - compact: serializer.rows_as_lists + serializer.dumps ({columns, rows} format)
+"""
+import os
+import sys
+import time
+import uuid
+import datetime
+from decimal import Decimal
+
+proj_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+backend_dir = os.path.join(proj_root, "backend")
+if backend_dir not in sys.path:
+    sys.path.insert(0, backend_dir)
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+import serializer
+from exec_query import _to_json_safe
+
+COLUMNS = ["id", "name", "price", "qty", "created", "updated", "amount", "payload", "ref", "note", "ratio", "flag"]
+
+
+def make_rows(n: int):
+    base = datetime.datetime(2024, 1, 1, 12, 0, 0)
+    return [
+        (i, f"name-{i}", i * 1.25, i % 17, base + datetime.timedelta(minutes=i), base.date(), Decimal(i) / Decimal(100),
+         bytes([i % 256]) * 8, uuid.UUID(int=i), None if i % 3 else "note", i / 7, bool(i % 2))
+        for i in range(n)
+    ]
+
+
+def legacy(rows):
+    dict_rows = [dict(zip(COLUMNS, r)) for r in rows]
+    safe = [{k: _to_json_safe(v) for k, v in r.items()} for r in dict_rows]
+    return JSONResponse(jsonable_encoder({"ok": True, "rows": safe, "columns": COLUMNS})).body
+
+
+def objects(rows):
+    return serializer.dumps({"ok": True, "rows": serializer.rows_as_dicts(COLUMNS, rows), "columns": COLUMNS})
+
+
+def compact(rows):
+    return serializer.dumps({"ok": True, "rows": serializer.rows_as_lists(COLUMNS, rows), "columns": COLUMNS})
+
+
+def bench(fn, rows, repeats):
+    fn(rows)
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        body = fn(rows)
+        best = min(best, time.perf_counter() - start)
+    return best, len(body)
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    rows = make_rows(n)
+    print(f"{n} rows x {len(COLUMNS)} columns, best of {repeats}, orjson={'yes' if serializer.orjson else 'no'}")
+    baseline = None
+    for name, fn in (("legacy", legacy), ("objects", objects), ("compact", compact)):
+        secs, size = bench(fn, rows, repeats)
+        baseline = baseline or secs
+        print(f"  {name:8s} {secs * 1000:8.2f} ms  {size / 1024:8.1f} KiB  x{baseline / secs:.1f}")
+
+
+if __name__ == "__main__":
+    main()
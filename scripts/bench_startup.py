@@ -0,0 +1,82 @@
+"""Worker cold-start time with many deployed mappings.
+
+Usage (PowerShell):
+    .\.venv\Scripts\python.exe .\scripts\bench_startup.py [mappings] [runs]
+
+Writes a throwaway METADATA_DIR with one SQLite connector and N deployed GET mappings, then
+times in fresh interpreters:
+ - import: `import main` (module import plus deployed route registration)
+ - first call: the first request to a mapping (includes building its plan when that is lazy)
+ - ready: import until every route is registered and answering
+"""
+import os
+import sys
+import json
+import time
+import sqlite3
+import tempfile
+import subprocess
+import statistics
+
+proj_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+backend_dir = os.path.join(proj_root, "backend")
+
+CHILD = r"""
+import sys, time, json
+t0 = time.perf_counter()
+import main
+t1 = time.perf_counter()
+from fastapi.testclient import TestClient
+with TestClient(main.app) as c:
+    t2 = time.perf_counter()
+    r = c.get("/api/m%d" % (int(sys.argv[1]) - 1), params={"minp": 1})
+    assert r.status_code == 200, r.text
+    t3 = time.perf_counter()
+print(json.dumps({"import": t1 - t0, "first_call": t3 - t2}))
+"""
+
+
+def make_metadata(directory: str, n: int) -> None:
+    db = os.path.join(directory, "bench.db")
+    con = sqlite3.connect(db)
+    con.execute("CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT, price REAL)")
+    con.executemany("INSERT INTO items (name, price) VALUES (?, ?)", [(f"n{i}", i * 1.5) for i in range(100)])
+    con.commit()
+    con.close()
+    connector = {"id": "c" * 32, "name": "bench", "sqlalchemy_url": f"sqlite:///{db}", "created_at": "2024-01-01T00:00:00+00:00"}
+    queries, mappings = [], []
+    for i in range(n):
+        qid, mid = f"q{i:031d}", f"m{i:031d}"
+        queries.append({"id": qid, "connector_id": connector["id"], "name": f"q{i}", "is_proc": False,
+                        "sql_text": f"SELECT id, name, price FROM items WHERE price >= :minp AND id > {i % 10} ORDER BY id"})
+        mappings.append({"id": mid, "query_id": qid, "connector_id": connector["id"], "path": f"/api/m{i}", "method": "GET",
+                         "params_json": [{"name": "minp", "in": "query", "type": "number", "required": False, "default": 0},
+                                         {"name": "tag", "in": "query", "type": "string", "required": False, "max_length": 32}],
+                         "auth_required": False, "deployed": True, "created_at": "2024-01-01T00:00:00+00:00"})
+    for name, data in (("connectors.json", [connector]), ("queries.json", queries), ("mappings.json", mappings)):
+        with open(os.path.join(directory, name), "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2)
+
+
+def run_once(metadata_dir: str, n: int) -> dict:
+    env = {**os.environ, "METADATA_DIR": metadata_dir}
+    start = time.perf_counter()
+    out = subprocess.run([sys.executable, "-c", CHILD, str(n)], cwd=backend_dir, env=env, capture_output=True, text=True, check=True)
+    res = json.loads(out.stdout.strip().splitlines()[-1])
+    res["process"] = time.perf_counter() - start
+    return res
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    with tempfile.TemporaryDirectory() as tmp:
+        make_metadata(tmp, n)
+        results = [run_once(tmp, n) for _ in range(runs)]
+    print(f"{n} deployed mappings, median of {runs} fresh processes")
+    for key in ("import", "first_call", "process"):
+        print(f"  {key:10s} {statistics.median(r[key] for r in results) * 1000:9.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""Per-request parameter validation cost: generated model class vs compiled pydantic-core validator.
+
+Usage (PowerShell):
+    .\.venv\Scripts\python.exe .\scripts\bench_validation.py [iterations]
+
+Times, for a typical params_json (strings with length limits, bounded numbers, a boolean):
+ - model: build_params_model class instantiated per call + model_dump(exclude=...)
+ - validator: param_model.compile_validator(...).validate(...) into a plain dict
+and the same two paths for an invalid call (error formatting included).
+"""
+import os
+import sys
+import time
+
+proj_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+backend_dir = os.path.join(proj_root, "backend")
+if backend_dir not in sys.path:
+    sys.path.insert(0, backend_dir)
+
+import param_model
+
+PARAMS_JSON = [
+    {"name": "customer_id", "in": "path", "type": "integer", "min": 1},
+    {"name": "status", "in": "query", "type": "string", "max_length": 20, "required": False, "default": "open"},
+    {"name": "min_total", "in": "query", "type": "number", "min": 0, "required": False},
+    {"name": "region", "in": "query", "type": "string", "min_length": 2, "max_length": 8},
+    {"name": "include_archived", "in": "query", "type": "boolean", "required": False, "default": False},
+]
+EXCLUDE = {"limit", "offset", "cursor"}
+VALID = {"customer_id": "42", "status": " shipped ", "min_total": "10.5", "region": "emea", "include_archived": "true", "limit": "50"}
+INVALID = {"customer_id": "0", "min_total": "abc", "region": "x"}
+
+
+def model_path(Model, data):
+    try:
+        return Model(**data).model_dump(exclude=EXCLUDE)
+    except Exception as e:
+        return str(e)
+
+
+def validator_path(validator, data):
+    try:
+        out = validator.validate(data)
+    except param_model.ValidationError as e:
+        return param_model.error_details(e)
+    return {k: v for k, v in out.items() if k not in EXCLUDE}
+
+
+def bench(fn, arg, data, n):
+    fn(arg, data)
+    start = time.perf_counter()
+    for _ in range(n):
+        fn(arg, data)
+    return (time.perf_counter() - start) / n
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    Model = param_model.build_params_model("BenchParams", PARAMS_JSON)
+    validator = param_model.compile_validator(PARAMS_JSON)
+    assert model_path(Model, VALID) == validator_path(validator, VALID)
+    print(f"{len(PARAMS_JSON)} params, {n} calls each")
+    for label, data in (("valid", VALID), ("invalid", INVALID)):
+        base = bench(model_path, Model, data, n)
+        fast = bench(validator_path, validator, data, n)
+        print(f"  {label:8s} model {base * 1e6:7.2f} us   validator {fast * 1e6:7.2f} us   x{base / fast:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -10,6 +10,9 @@ It will:
  - mark mapping as deployed (storage.set_mapping_deployed)
  - simulate calling the mapping by building a param model with param_model and running exec_query.run_query
  - append and print a log entry
+ - check that large and non-finite DECIMAL values serialize
+ - check that revoked API keys are rejected, also when revoked by another process
+ - page through ORDER BYs with duplicate and NULL sort values and check no row is lost or repeated
 
 Run:
   .\.venv\Scripts\python.exe .\scripts\headless_e2e.py
@@ -23,12 +26,90 @@ import json
 from pathlib import Path
 
 ROOT = Path(__file__).resolve().parents[1]
-if str(ROOT) not in sys.path:
-    sys.path.insert(0, str(ROOT))
+for p in (ROOT, ROOT / "backend"):
+    if str(p) not in sys.path:
+        sys.path.insert(0, str(p))
 
 import storage
 import exec_query
+import pagination
 import param_model
+import serializer
+from engine_registry import get_client
+
+
+def check_paging(connector, limit=7):
+    """Page through orderings whose sort values tie and are NULL across page edges."""
+    pk, not_null = ("id",), ("grp",)
+    cases = [
+        ("SELECT id, grp, age FROM scores ORDER BY age DESC", pagination.OFFSET),
+        ("SELECT id, grp, age FROM scores ORDER BY age, id", pagination.OFFSET),
+        ("SELECT id, grp, age FROM scores ORDER BY grp DESC", pagination.KEYSET),
+        ("SELECT id, grp, age FROM scores ORDER BY grp, id DESC", pagination.KEYSET),
+    ]
+    client = get_client(connector)
+    try:
+        total = client.fetch_page("SELECT COUNT(*) AS n FROM scores")[0][0]["n"]
+        for sql, mode in cases:
+            prepared = exec_query.PreparedQuery(sql, pk=pk, not_null=not_null)
+            if prepared.page_plan.mode != mode:
+                print("paging plan mismatch:", sql, prepared.page_plan.mode)
+                return False
+            seen, cursor = [], None
+            while True:
+                res = exec_query.run_prepared(client, prepared, max_rows=limit, cursor=cursor)
+                if not res.get("ok"):
+                    print("paging failed:", sql, res)
+                    return False
+                seen.extend(r["id"] for r in res["rows"])
+                cursor = res["next_cursor"]
+                if not cursor:
+                    break
+            if len(seen) != total or len(set(seen)) != total:
+                print("paging lost or repeated rows:", sql, len(seen), len(set(seen)), "of", total)
+                return False
+        print("paging ok:", len(cases), "orderings x", total, "rows")
+        return True
+    finally:
+        client.dispose()
+
+
+def check_decimals():
+    """DECIMALs beyond 64 bits (e.g. DECIMAL(38,0) ids) and NaN / Infinity must encode, as strings."""
+    from decimal import Decimal
+    values = [Decimal(2) ** 63, -Decimal(2) ** 63 - 1, Decimal("NaN"), Decimal("Infinity"), Decimal("42"), Decimal("1.50")]
+    expected = [str(2 ** 63), str(-2 ** 63 - 1), "NaN", "Infinity", 42, "1.50"]
+    try:
+        body = json.loads(serializer.dumps(serializer.rows_as_lists(["v"], [(v,) for v in values])))
+    except Exception as e:
+        print("decimal serialization failed:", e)
+        return False
+    if [r[0] for r in body] != expected:
+        print("decimal serialization mismatch:", body)
+        return False
+    print("decimal serialization ok")
+    return True
+
+
+def check_api_key_revocation():
+    """A cached key verification must not outlive the key."""
+    for other_process in (False, True):
+        token = storage.add_api_key_entry("consumer")
+        rec = storage.validate_api_key(token)
+        if not rec or storage.validate_api_key(token) is None:
+            print("api key not accepted")
+            return False
+        if other_process:
+            # another worker's revoke: the row goes, this process's cache is left alone
+            storage._api_keys.delete(rec["id"])
+            storage._api_keys.expire()
+        else:
+            storage.revoke_api_key(rec["id"])
+        if storage.validate_api_key(token) is not None:
+            print("revoked api key still accepted", "(other process)" if other_process else "")
+            return False
+    print("api key revocation ok")
+    return True
 
 
 def run():
@@ -46,6 +127,10 @@ def run():
         cur.execute("CREATE TABLE people (id INTEGER PRIMARY KEY, name TEXT, age INTEGER)")
         cur.execute("INSERT INTO people (name, age) VALUES (?,?)", ("Alice", 30))
         cur.execute("INSERT INTO people (name, age) VALUES (?,?)", ("Bob", 25))
+        # few distinct sort values, a third of them NULL, so ties and NULLs straddle page edges
+        cur.execute("CREATE TABLE scores (id INTEGER PRIMARY KEY, grp INTEGER NOT NULL, age INTEGER)")
+        cur.executemany("INSERT INTO scores (grp, age) VALUES (?,?)",
+                        [(i % 4, None if i % 3 == 0 else i % 5) for i in range(250)])
         conn.commit(); conn.close()
 
         # add connector
@@ -93,6 +178,9 @@ def run():
         res = exec_query.run_query(connector, q.get("sql_text"), params, max_rows=100, is_proc=bool(q.get("is_proc")))
         print("exec result:", json.dumps(res, indent=2))
 
+        if not check_decimals() or not check_api_key_revocation() or not check_paging(connector):
+            return 1
+
         # append a log
         import uuid, datetime
         rid = uuid.uuid4().hex
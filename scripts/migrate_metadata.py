@@ -0,0 +1,38 @@
+"""Copy the JSON metadata files (connectors, queries, mappings, API keys) into the SQLite backend.
+
+Usage (PowerShell):
+    $env:METADATA_BACKEND = "sqlite"
+    .\.venv\Scripts\python.exe .\scripts\migrate_metadata.py [--force]
+
+The import also runs automatically the first time the server starts with METADATA_BACKEND=sqlite;
+this script is for doing it ahead of a switch-over, or (--force) for re-importing after the JSON
+files were edited. The JSON files are left untouched. Schema snapshots and request logs keep their
+own on-disk formats and are not part of the database.
+"""
+import os
+import sys
+
+proj_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+backend_dir = os.path.join(proj_root, "backend")
+if backend_dir not in sys.path:
+    sys.path.insert(0, backend_dir)
+
+os.environ.setdefault("METADATA_BACKEND", "sqlite")
+
+import storage
+
+
+def main():
+    if storage.METADATA_BACKEND != "sqlite":
+        print("METADATA_BACKEND must be 'sqlite'")
+        return 1
+    counts = storage.migrate_json_metadata(force="--force" in sys.argv[1:])
+    if not counts:
+        print(f"nothing imported ({storage.METADATA_DB_FILE} was already migrated; use --force to re-import)")
+    for table, n in counts.items():
+        print(f"  {table:12s} {n} rows")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())